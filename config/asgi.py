@@ -3,14 +3,33 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Under ASGI the catalogue pages are served by async views (config.urls_asgi,
+lib_app.async_views), e.g.:
+
+    uvicorn config.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+ASGI_URLCONF = 'config.urls_asgi'
+
+
+class CatalogueASGIHandler(ASGIHandler):
+    """ASGIHandler with the async catalogue URLconf for every request"""
+
+    async def get_response_async(self, request):
+        request.urlconf = ASGI_URLCONF
+        return await super().get_response_async(request)
+
+
+application = CatalogueASGIHandler()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +50,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'lib_app.middleware.QueryBudgetMiddleware',
+    'lib_app.routers.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -78,8 +81,89 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            # Транзакция сразу берёт блокировку на запись: параллельные выдачи
+            # ждут друг друга, а не падают с "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'TEST': {
+            # Файл вместо памяти: многопоточные тесты открывают свои соединения
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # Реплика для чтения каталога (lib_app.routers). Локально — копия
+    # основной базы, которую обновляет команда sync_replica
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db_replica.sqlite3',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['lib_app.routers.PrimaryReplicaRouter']
+
+# Алиасы реплик, с которых читают представления каталога (use_replica = True),
+# через запятую в переменной окружения LIBRARY_DB_REPLICAS; пусто — всё из default
+LIBRARY_DB_REPLICAS = [
+    alias for alias in os.environ.get('LIBRARY_DB_REPLICAS', '').split(',') if alias
+]
+# Сколько секунд после записи сессия читает основную базу (чтение своих записей)
+LIBRARY_DB_PIN_SECONDS = 30
+
+# Профили соединений SQLite (lib_app.sqlite): PRAGMA при открытии соединения.
+# Профиль выбирается переменной окружения LIBRARY_SQLITE_PROFILE
+
+LIBRARY_SQLITE_PROFILES = {
+    'production': {
+        # Сколько миллисекунд ждать чужую блокировку записи
+        'busy_timeout': 5000,
+        # Журнал WAL: чтение не блокируется записью
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        # Чтение файла базы через отображение в память, до 256 МБ
+        'mmap_size': 256 * 1024 * 1024,
+        # Кэш страниц соединения, отрицательное значение — в КБ (64 МБ)
+        'cache_size': -64000,
+    },
+    # Значения SQLite по умолчанию (для сравнения в бенчмарке bench_sqlite)
+    'default': {
+        'journal_mode': 'delete',
+        'synchronous': 'full',
+    },
 }
+LIBRARY_SQLITE_PROFILE = os.environ.get('LIBRARY_SQLITE_PROFILE', 'production')
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Двухуровневый кэш (lib_app.tiered_cache): память процесса перед общим
+# файловым кэшем, который видят все процессы сервера
+
+CACHES = {
+    'default': {
+        'BACKEND': 'lib_app.tiered_cache.TieredCache',
+        # Алиас общего кэша
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            # Сколько записей держать в памяти процесса
+            'FRONT_MAX_ENTRIES': 1000,
+            # Сколько секунд запись живёт в памяти процесса
+            'FRONT_TIMEOUT': 5,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Тесты работают с кэшем в памяти, а не с файловым кэшем сайта
+TEST_RUNNER = 'lib_app.testing.TestRunner'
 
 
 # Password validation
@@ -119,3 +203,51 @@ USE_TZ = True
 STATIC_URL = 'static/'
 
 AUTH_USER_MODEL = 'user_app.CustomUser'
+
+# Учёт SQL-запросов на HTTP-запрос (lib_app.middleware.QueryBudgetMiddleware)
+# Заголовок X-SQL-Queries с числом и временем запросов
+LIBRARY_QUERY_BUDGET_HEADER = DEBUG
+# Предупреждения в лог lib_app.sql о превышении бюджета и о повторяющихся запросах
+LIBRARY_QUERY_BUDGET_LOG = True
+# Сколько одинаковых запросов за HTTP-запрос считать признаком N+1
+LIBRARY_QUERY_REPEAT_THRESHOLD = 3
+
+# Кэш главной страницы (lib_app.leaderboard)
+# Сколько книг показывать в топе самых выдаваемых
+LIBRARY_TOP_BOOKS_SIZE = 5
+# Время жизни топа и счётчика книг в кэше, секунд
+LIBRARY_LEADERBOARD_TIMEOUT = 300
+
+# Кэш состава корзин читателей (lib_app.cart_cache), время жизни записи, секунд
+LIBRARY_CART_CACHE_TIMEOUT = 3600
+
+# Сколько ключевых слов показывать в облаке над каталогом (lib_app.keywords)
+LIBRARY_KEYWORD_CLOUD_SIZE = 50
+
+# Фасеты каталога (lib_app.facets): сколько издательств показывать в фасете
+LIBRARY_FACET_PUBLISHERS = 20
+# Сводка фасетов каталога в кэше, время жизни, секунд
+LIBRARY_FACETS_TIMEOUT = 300
+
+# Кэш страниц и объектов каталога (lib_app.catalogue_cache), время жизни записи, секунд
+LIBRARY_CATALOGUE_CACHE_TIMEOUT = 600
+
+# Сроки выдачи (lib_app.loans): срок возврата в днях и через сколько дней
+# повторять напоминание о просрочке (команда scan_overdue_loans)
+LIBRARY_LOAN_PERIOD_DAYS = 14
+LIBRARY_OVERDUE_REMIND_DAYS = 7
+# Политика выдачи — путь к классу; None — lib_app.loans.LoanPolicy
+LIBRARY_LOAN_POLICY = None
+
+# Напоминания о просрочке в разработке печатаются в консоль
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'library@example.com'
+
+# Фоновые задачи (lib_app.jobs, воркер run_jobs): как часто воркер отмечает
+# выполняющиеся задачи, через сколько секунд без отметки задача считается
+# зависшей и задержка первого повтора после ошибки (дальше удваивается), секунд
+LIBRARY_JOB_HEARTBEAT = 30
+LIBRARY_JOB_TIMEOUT = 300
+LIBRARY_JOB_RETRY_DELAY = 60
+# Каталог файлов, которые пишет задача export_data
+LIBRARY_EXPORT_DIR = BASE_DIR / 'exports'
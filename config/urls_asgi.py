@@ -0,0 +1,15 @@
+"""
+URL configuration for the ASGI entry point (config.asgi).
+
+Same routes as config.urls, but the catalogue pages are served by the
+async views from lib_app.async_urls.
+"""
+from django.contrib import admin
+from django.urls import path, include
+
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('', include('lib_app.async_urls')),
+    path('user/', include('user_app.urls')),
+]
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Book, Author, Publisher, Cart, BorrowedBook
+from django.db.models import Count
+from .models import Book, Author, Publisher, Cart, BorrowedBook, Keyword, Job
+from .widgets import AutocompleteSelect
 from user_app.models import CustomUser
 
 
@@ -23,6 +25,17 @@ class BookAdmin(admin.ModelAdmin):
     )
     search_help_text = "Введите часть заголовка или имени автора для поиска в каталоге."
     readonly_fields = ("times_of_issued",)
+    list_select_related = ("author", "publisher")
+    # Те же точки автодополнения, что и в форме книги на сайте
+    autocomplete_urls = {
+        "author": "author_autocomplete",
+        "publisher": "publisher_autocomplete",
+    }
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.autocomplete_urls:
+            kwargs["widget"] = AutocompleteSelect(self.autocomplete_urls[db_field.name])
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 @admin.register(Author)
@@ -36,16 +49,35 @@ class PublisherAdmin(admin.ModelAdmin):
     ordering = ("name",)
 
 
+@admin.register(Keyword)
+class KeywordAdmin(admin.ModelAdmin):
+    list_display = ("name",)
+    ordering = ("normalized",)
+    search_fields = ("normalized",)
+
+
 @admin.register(BorrowedBook)
 class BorrowedBookAdmin(admin.ModelAdmin):
-    list_display = ("user", "book", "borrowed_at", "returned")
+    list_display = ("user", "book", "borrowed_at", "due_at", "returned")
+    list_select_related = ("user", "book__author")
     list_filter = ("returned", "borrowed_at")
 
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ("user", "books_count")
+    list_select_related = ("user",)
 
-    @admin.display(description="Книг")
+    def get_queryset(self, request):
+        # Число книг считаем в запросе списка, а не отдельно для каждой корзины
+        return super().get_queryset(request).annotate(books_count=Count("books"))
+
+    @admin.display(description="Книг", ordering="books_count")
     def books_count(self, obj):
-        return obj.books.count()
+        return obj.books_count
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "attempts", "created_at", "finished_at")
+    list_filter = ("status", "name")
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class LibAppConfig(AppConfig):
     name = "lib_app"
+
+    def ready(self):
+        from lib_app import signals  # noqa: F401 — подключение обработчиков сигналов
@@ -0,0 +1,32 @@
+"""
+URL каталога для ASGI: те же маршруты, что в lib_app.urls, но главная,
+списки книг и авторов и карточка книги обслуживаются асинхронными
+представлениями (lib_app.async_views).
+"""
+
+from django.urls import URLPattern
+
+from . import urls
+from .async_views import (
+    AsyncAuthorListView,
+    AsyncBookDetailView,
+    AsyncBookListView,
+    AsyncIndexView,
+)
+
+ASYNC_VIEWS = {
+    "index": AsyncIndexView,
+    "author_list": AsyncAuthorListView,
+    "book_list": AsyncBookListView,
+    "book_detail": AsyncBookDetailView,
+}
+
+
+def replace_view(pattern):
+    view = ASYNC_VIEWS.get(getattr(pattern, "name", None))
+    if view is None:
+        return pattern
+    return URLPattern(pattern.pattern, view.as_view(), name=pattern.name)
+
+
+urlpatterns = [replace_view(pattern) for pattern in urls.urlpatterns]
@@ -0,0 +1,146 @@
+"""
+Асинхронные представления каталога для запуска под ASGI.
+
+Это подклассы обычных представлений (lib_app.views): данные читаются
+асинхронным ORM (acount, aget, async for) и асинхронными вариантами
+функций кэшей, а шаблоны, контекст и бюджеты запросов остаются общими.
+Синхронные методы контекста переопределены так, чтобы отдавать уже
+загруженные данные: в асинхронном коде синхронный ORM недоступен.
+Шаблон отрисовывается обработчиком ASGI в потоке sync_to_async.
+
+Подключаются через config.urls_asgi (см. config.asgi) — под WSGI
+сайт обслуживают прежние синхронные представления.
+"""
+
+from django.core.paginator import InvalidPage
+from django.http import Http404
+
+from lib_app import cart_cache, catalogue_cache, facets, keywords, leaderboard
+from lib_app.models import Book
+from lib_app.views import (
+    AuthorListView,
+    BookDetailView,
+    BookListView,
+    IndexTemplateView,
+)
+
+
+class AsyncListMixin:
+    """Асинхронный get() для ListView: страница выбирается асинхронным ORM"""
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+        self.async_page = None
+        if page_size:
+            self.async_page = await self.apaginate_queryset(self.object_list, page_size)
+        await self.aload_context()
+        return self.render_to_response(self.get_context_data())
+
+    async def aload_context(self):
+        """Загрузка остальных данных контекста (для переопределения)"""
+
+    def paginate_queryset(self, queryset, page_size):
+        # get_context_data() получает страницу, выбранную в get()
+        return self.async_page
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """Как MultipleObjectMixin.paginate_queryset(), но с acount()"""
+        paginator = self.get_paginator(
+            queryset,
+            page_size,
+            orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty(),
+        )
+        # Число объектов считается заранее, тогда paginator.page() не идёт в базу
+        paginator.count = await queryset.acount()
+        page = self.kwargs.get(self.page_kwarg) or self.request.GET.get(
+            self.page_kwarg, 1
+        )
+        try:
+            page_number = int(page)
+        except ValueError:
+            if page != "last":
+                raise Http404("Неверный номер страницы.")
+            page_number = paginator.num_pages
+        try:
+            page = paginator.page(page_number)
+        except InvalidPage as error:
+            raise Http404(f"Неверная страница ({page_number}): {error}")
+        page.object_list = [obj async for obj in page.object_list]
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class AsyncIndexView(IndexTemplateView):
+    async def get(self, request, *args, **kwargs):
+        self.leaderboard = {
+            "total_books": await leaderboard.aget_books_total(),
+            "top_books": await leaderboard.aget_top_books(),
+        }
+        return super().get(request, *args, **kwargs)
+
+    def get_leaderboard_context(self):
+        return self.leaderboard
+
+
+class AsyncAuthorListView(AsyncListMixin, AuthorListView):
+    pass
+
+
+class AsyncBookListView(AsyncListMixin, BookListView):
+    async def get(self, request, *args, **kwargs):
+        # Ключевое слово нужно get_queryset(), поэтому читается первым
+        value = request.GET.get("keyword", "").strip()
+        self._keyword = await keywords.aget_keyword(value) if value else None
+        return await super().get(request, *args, **kwargs)
+
+    async def apaginate_queryset(self, queryset, page_size):
+        if self.use_keyset_pagination():
+            return await self.apaginate_keyset(queryset, page_size)
+        return await super().apaginate_queryset(queryset, page_size)
+
+    async def aload_context(self):
+        if self.has_catalogue_facets():
+            self.facet_counts = await facets.aget_catalogue_facets(
+                self.unfaceted_queryset
+            )
+        else:
+            self.facet_counts = await facets.acount_facets(
+                self.unfaceted_queryset, self.get_facet_filters()
+            )
+        self.keyword_cloud = await keywords.aget_keyword_cloud()
+        user = await self.request.auser()
+        if user.is_authenticated and not user.is_staff:
+            self.cart_book_ids = await cart_cache.aget_cart_book_ids(user.pk)
+        else:
+            self.cart_book_ids = set()
+
+    def get_facet_counts(self):
+        return self.facet_counts
+
+    def get_keyword_cloud(self):
+        return self.keyword_cloud
+
+    def get_cart_book_ids(self):
+        return self.cart_book_ids
+
+
+class AsyncBookDetailView(BookDetailView):
+    async def get(self, request, *args, **kwargs):
+        self.object = await self.aget_object()
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
+
+    async def aget_object(self):
+        if getattr(self, "object", None) is not None:
+            return self.object
+        queryset = self.get_queryset()
+        pk = self.kwargs["pk"]
+
+        async def load():
+            try:
+                return await queryset.aget(pk=pk)
+            except Book.DoesNotExist:
+                raise Http404("Книга не найдена.")
+
+        return await catalogue_cache.aget_cached_object("book", pk, load)
@@ -0,0 +1,139 @@
+"""
+Кэш состава корзин: множество id книг в корзине каждого читателя.
+
+Каталог отмечает книги, уже лежащие в корзине, и проверяет это
+по множеству из кэша, не обращаясь к таблице корзин. Кэш ведёт
+сигнал m2m_changed на Cart.books (см. lib_app.signals), поэтому
+его обновляют все пути: добавление и удаление книги читателем,
+выдача из корзины, действия персонала и админка.
+
+Запись в кэше помечена версией корзины. После фиксации транзакции,
+изменившей корзину, версия меняется, и в этом процессе старая запись
+больше не читается. Версия берётся до чтения из базы: если корзину
+изменили, пока запрос читал её состав, он сохранит устаревшую запись
+со старой версией, и её не прочитают до истечения срока записи.
+При двухуровневом кэше (lib_app.tiered_cache) другие процессы держат
+версию и запись в памяти до FRONT_TIMEOUT секунд и всё это время могут
+видеть прежний состав. Поэтому кэш служит только для отображения
+каталога, а добавление и удаление книг проверяют корзину по базе.
+
+Настройка LIBRARY_CART_CACHE_TIMEOUT — время жизни записи в секундах
+(по умолчанию 3600).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from lib_app.models import Cart
+from lib_app.routers import use_primary
+
+
+def cart_key(user_id):
+    return f"lib_app:cart:{user_id}"
+
+
+def version_key(user_id):
+    return f"lib_app:cart:{user_id}:version"
+
+
+def get_timeout():
+    return getattr(settings, "LIBRARY_CART_CACHE_TIMEOUT", 3600)
+
+
+def new_version():
+    # Как в lib_app.catalogue_cache: время, а не incr, чтобы смена версии
+    # из разных процессов не терялась
+    return time.time_ns()
+
+
+def get_cached(user_id):
+    """
+    Возвращает (состав корзины из кэша или None, текущая версия корзины).
+    Прочитанный из базы состав сохраняется с версией, полученной здесь.
+    """
+    key, vkey = cart_key(user_id), version_key(user_id)
+    cached = cache.get_many([key, vkey])
+    version = cached.get(vkey)
+    if version is None:
+        # add, а не set: версию могла только что сменить фиксация транзакции
+        cache.add(vkey, new_version(), get_timeout())
+        version = cache.get(vkey)
+    entry = cached.get(key)
+    if version is not None and isinstance(entry, tuple) and entry[0] == version:
+        return entry[1], version
+    return None, version
+
+
+async def aget_cached(user_id):
+    """Асинхронный вариант get_cached()"""
+    key, vkey = cart_key(user_id), version_key(user_id)
+    cached = await cache.aget_many([key, vkey])
+    version = cached.get(vkey)
+    if version is None:
+        await cache.aadd(vkey, new_version(), get_timeout())
+        version = await cache.aget(vkey)
+    entry = cached.get(key)
+    if version is not None and isinstance(entry, tuple) and entry[0] == version:
+        return entry[1], version
+    return None, version
+
+
+def store(user_id, version, book_ids):
+    if version is not None:
+        cache.set(cart_key(user_id), (version, book_ids), get_timeout())
+
+
+async def astore(user_id, version, book_ids):
+    if version is not None:
+        await cache.aset(cart_key(user_id), (version, book_ids), get_timeout())
+
+
+def get_cart_book_ids(user_id):
+    """Множество id книг в корзине читателя"""
+    book_ids, version = get_cached(user_id)
+    if book_ids is None:
+        with use_primary():
+            book_ids = frozenset(
+                Cart.books.through.objects.filter(cart__user_id=user_id).values_list(
+                    "book_id", flat=True
+                )
+            )
+        store(user_id, version, book_ids)
+    return book_ids
+
+
+async def aget_cart_book_ids(user_id):
+    """Асинхронный вариант get_cart_book_ids()"""
+    book_ids, version = await aget_cached(user_id)
+    if book_ids is None:
+        with use_primary():
+            book_ids = frozenset(
+                [
+                    book_id
+                    async for book_id in Cart.books.through.objects.filter(
+                        cart__user_id=user_id
+                    ).values_list("book_id", flat=True)
+                ]
+            )
+        await astore(user_id, version, book_ids)
+    return book_ids
+
+
+def invalidate_carts(user_ids):
+    """
+    После фиксации транзакции меняет версию корзин читателей:
+    состав будет прочитан из базы при следующем обращении.
+    """
+    user_ids = list(user_ids)
+
+    def invalidate():
+        version = new_version()
+        cache.set_many(
+            {version_key(user_id): version for user_id in user_ids}, get_timeout()
+        )
+        cache.delete_many([cart_key(user_id) for user_id in user_ids])
+
+    transaction.on_commit(invalidate)
@@ -0,0 +1,300 @@
+"""
+Кэш каталога с версией в ключе.
+
+Ключи записей каталога содержат номер версии каталога, который
+увеличивается при любом изменении книг, авторов и издательств
+(сигналы в lib_app.signals, выдача и возврат в lib_app.services).
+Сброс всего кэша каталога — одна запись новой версии: записи
+старых версий больше не читаются и вытесняются по времени жизни.
+Новая версия видна после фиксации транзакции (другим процессам при
+двухуровневом кэше — в пределах FRONT_TIMEOUT, см. lib_app.tiered_cache).
+
+Помощники для представлений:
+    ConditionalGetMixin — ETag и Last-Modified, ответ 304 без отрисовки
+                          страницы, если она не менялась;
+    CatalogueCacheMixin — готовая страница целиком для анонимных
+                          посетителей (у них нет корзины и прав);
+    get_cached_object   — объект детальной страницы для всех пользователей.
+Статистика попаданий (get_stats) — на странице staff/cache-stats/.
+
+Настройка LIBRARY_CATALOGUE_CACHE_TIMEOUT — время жизни записей
+в секундах (по умолчанию 600).
+"""
+
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from lib_app import cart_cache, tiered_cache
+from lib_app.routers import use_primary
+
+VERSION_KEY = "lib_app:catalogue_version"
+# Время смены версии каталога: Last-Modified страниц-списков
+CHANGED_KEY = "lib_app:catalogue_changed"
+
+
+def get_timeout():
+    return getattr(settings, "LIBRARY_CATALOGUE_CACHE_TIMEOUT", 600)
+
+
+def new_version():
+    # Версия — текущее время в наносекундах, а не счётчик: incr в файловом
+    # кэше читает и записывает значение отдельно, и одновременные смены
+    # версии из разных процессов терялись бы. Время не совпадает ни с одной
+    # прежней версией, а какая из одновременных записей победит, неважно
+    return time.time_ns()
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, new_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_version():
+    """Асинхронный вариант get_version()"""
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, new_version(), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """Новая версия каталога после фиксации транзакции"""
+
+    def bump():
+        cache.set(VERSION_KEY, new_version(), None)
+        cache.set(CHANGED_KEY, time.time(), None)
+
+    transaction.on_commit(bump)
+
+
+def get_changed_at():
+    """Время последнего изменения каталога (timestamp)"""
+    changed = cache.get(CHANGED_KEY)
+    if changed is None:
+        # Время изменения неизвестно: считаем, что каталог изменился сейчас
+        cache.add(CHANGED_KEY, time.time(), None)
+        changed = cache.get(CHANGED_KEY)
+    return changed or time.time()
+
+
+def make_key(version, parts):
+    digest = hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+    return f"lib_app:catalogue:{version}:{parts[0]}:{digest}"
+
+
+def catalogue_key(*parts):
+    """Ключ записи каталога текущей версии"""
+    return make_key(get_version(), parts)
+
+
+async def acatalogue_key(*parts):
+    """Асинхронный вариант catalogue_key()"""
+    return make_key(await aget_version(), parts)
+
+
+def get_stats():
+    """Попадания и промахи кэша в этом процессе или None для других бэкендов"""
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, tiered_cache.TieredCache):
+        return tiered_cache.get_stats(backend.location)
+    return None
+
+
+def get_cached_object(name, pk, loader):
+    """Объект из кэша каталога; loader() загружает его из основной базы при промахе"""
+
+    def load():
+        with use_primary():
+            return loader()
+
+    return cache.get_or_set(catalogue_key(name, pk), load, get_timeout())
+
+
+async def aget_cached_object(name, pk, loader):
+    """Асинхронный вариант get_cached_object(); loader — корутинная функция"""
+    key = await acatalogue_key(name, pk)
+    obj = await cache.aget(key)
+    if obj is None:
+        with use_primary():
+            obj = await loader()
+        await cache.aset(key, obj, get_timeout())
+    return obj
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы к страницам каталога. ETag и Last-Modified
+    считаются по версии каталога и времени её смены (оба лежат в кэше),
+    поэтому ответ 304 не стоит ни запросов к базе, ни отрисовки шаблона.
+    Детальные страницы переопределяют get_last_modified() и get_etag_parts().
+
+    Страница зависит от посетителя: у читателя ETag включает его id,
+    состав корзины и cookie CSRF (токен в формах), страницы сотрудников
+    и страницы с сообщениями не проверяются. Cache-Control: no-cache —
+    браузер переспрашивает страницу при каждом показе.
+    """
+
+    def get_last_modified(self):
+        """Время изменения страницы (timestamp)"""
+        return get_changed_at()
+
+    def get_etag_parts(self):
+        return [get_version()]
+
+    def get_validators(self, request):
+        """(ETag, Last-Modified) страницы или None, если проверка не нужна"""
+        user = request.user
+        if (
+            request.method not in ("GET", "HEAD")
+            or user.is_staff
+            or len(messages.get_messages(request))
+        ):
+            return None
+        # В ETag — точное время: Last-Modified различает только секунды
+        modified = self.get_last_modified()
+        parts = [request.get_full_path(), modified, *self.get_etag_parts()]
+        if user.is_authenticated:
+            parts += [
+                user.pk,
+                sorted(cart_cache.get_cart_book_ids(user.pk)),
+                request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+            ]
+        digest = hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+        # Слабый ETag: токен CSRF в разметке меняется от ответа к ответу
+        return f'W/"{digest}"', int(modified)
+
+    def set_validators(self, request, response, validators):
+        if validators is None or response.status_code not in (200, 304):
+            return response
+        etag, last_modified = validators
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(
+            response, no_cache=True, private=request.user.is_authenticated
+        )
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self.adispatch_conditional(request, *args, **kwargs)
+        validators = self.get_validators(request)
+        if validators is not None:
+            etag, last_modified = validators
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                return self.set_validators(request, response, validators)
+        response = super().dispatch(request, *args, **kwargs)
+        return self.set_validators(request, response, validators)
+
+    async def adispatch_conditional(self, request, *args, **kwargs):
+        # Валидаторы детальной страницы могут прочитать объект из базы
+        validators = await sync_to_async(self.get_validators)(request)
+        if validators is not None:
+            etag, last_modified = validators
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                return self.set_validators(request, response, validators)
+        response = await super().dispatch(request, *args, **kwargs)
+        return self.set_validators(request, response, validators)
+
+
+class CatalogueCacheMixin:
+    """
+    Кэширует готовые страницы каталога для анонимных посетителей.
+    Ключ — версия каталога и полный путь запроса с параметрами.
+    Не кэшируются страницы с сообщениями и страницы, выдавшие cookie.
+    Работает и с асинхронными представлениями (lib_app.async_views).
+    """
+
+    def is_cacheable(self, request):
+        return (
+            request.method == "GET"
+            and not request.user.is_authenticated
+            and not len(messages.get_messages(request))
+        )
+
+    def get_cached_page(self, key):
+        return self.make_cached_response(cache.get(key))
+
+    async def aget_cached_page(self, key):
+        return self.make_cached_response(await cache.aget(key))
+
+    def make_cached_response(self, cached):
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        return None
+
+    def store_callback(self, request, key):
+        def store(response):
+            if (
+                response.status_code == 200
+                and not response.cookies
+                and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+            ):
+                cache.set(
+                    key, (response.content, response["Content-Type"]), get_timeout()
+                )
+
+        return store
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self.adispatch(request, *args, **kwargs)
+        if not self.is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = catalogue_key("page", request.get_full_path())
+        cached = self.get_cached_page(key)
+        if cached is not None:
+            return cached
+
+        store = self.store_callback(request, key)
+        # Страница для кэша строится по основной базе, шаблон отрисовывается
+        # здесь же: ленивые запросы шаблона не должны уйти на реплику
+        with use_primary():
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.add_post_render_callback(store)
+                response.render()
+            else:
+                store(response)
+        return response
+
+    async def adispatch(self, request, *args, **kwargs):
+        # Пользователь и сообщения читаются из сессии синхронным кодом
+        if not await sync_to_async(self.is_cacheable)(request):
+            return await super().dispatch(request, *args, **kwargs)
+
+        key = await acatalogue_key("page", request.get_full_path())
+        cached = await self.aget_cached_page(key)
+        if cached is not None:
+            return cached
+
+        # Запись в кэш — в потоке, где отрисовывается шаблон, а не в цикле событий
+        store = self.store_callback(request, key)
+        with use_primary():
+            response = await super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.add_post_render_callback(store)
+                await sync_to_async(response.render)()
+            else:
+                await sync_to_async(store)(response)
+        return response
@@ -0,0 +1,196 @@
+"""
+Потоковая выгрузка каталога, истории выдач и читателей в CSV и JSONL.
+
+Строки читаются из базы порциями (QuerySet.iterator() по values_list),
+кодируются и отдаются кусками по CHUNK_SIZE байт, поэтому память не зависит
+от числа строк. Сжатие gzip (необязательное) выполняется на лету тем же
+потоком. Генератор stream_export() используют и StreamingHttpResponse,
+и команда export_data.
+
+Выгрузка книг содержит поля импорта (lib_app.importer): файл можно
+загрузить обратно, книги сопоставятся по ISBN.
+"""
+
+import csv
+import io
+import itertools
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from lib_app.models import Book, BorrowedBook
+from user_app.models import CustomUser
+
+FORMATS = ("csv", "jsonl")
+CONTENT_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+# Строк, читаемых из базы за один запрос
+DEFAULT_BATCH_SIZE = 2000
+# Примерный размер куска, отдаваемого клиенту
+CHUNK_SIZE = 64 * 1024
+
+
+def books_queryset():
+    return Book.objects.order_by("pk").values_list(
+        "pk",
+        "title",
+        "author__name",
+        "publisher__name",
+        "isbn",
+        "year",
+        "short_description",
+        "key_words",
+        "available",
+        "times_of_issued",
+    )
+
+
+def loans_queryset():
+    return BorrowedBook.objects.order_by("pk").values_list(
+        "pk",
+        "user_id",
+        "user__email",
+        "book_id",
+        "book__title",
+        "book__isbn",
+        "borrowed_at",
+        "due_at",
+        "returned_at",
+        "returned",
+    )
+
+
+def users_queryset():
+    # Пароль и права не выгружаются
+    return CustomUser.objects.order_by("pk").values_list(
+        "pk",
+        "email",
+        "full_name",
+        "date_of_birth",
+        "is_staff",
+        "is_active",
+        "date_joined",
+        "active_loans_count",
+        "total_loans_count",
+    )
+
+
+# Имя выгрузки: (заголовок, функция набора строк); столбцы — в порядке values_list
+EXPORTS = {
+    "books": (
+        (
+            "id",
+            "title",
+            "author",
+            "publisher",
+            "isbn",
+            "year",
+            "short_description",
+            "key_words",
+            "available",
+            "times_of_issued",
+        ),
+        books_queryset,
+    ),
+    "loans": (
+        (
+            "id",
+            "user_id",
+            "user_email",
+            "book_id",
+            "book_title",
+            "isbn",
+            "borrowed_at",
+            "due_at",
+            "returned_at",
+            "returned",
+        ),
+        loans_queryset,
+    ),
+    "users": (
+        (
+            "id",
+            "email",
+            "full_name",
+            "date_of_birth",
+            "is_staff",
+            "is_active",
+            "date_joined",
+            "active_loans_count",
+            "total_loans_count",
+        ),
+        users_queryset,
+    ),
+}
+
+
+def csv_lines(header, rows):
+    # csv.writer пишет в буфер, который опустошается после каждой строки
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in itertools.chain([header], rows):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def jsonl_lines(header, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(header, row))) + "\n"
+
+
+def chunked(lines):
+    """Склеивает строки в куски примерно по CHUNK_SIZE байт"""
+    parts = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        parts.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            yield b"".join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield b"".join(parts)
+
+
+def gzipped(chunks):
+    """Сжимает поток кусков в формат gzip, не накапливая его целиком"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(name, format="csv", compress=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Генератор байтов выгрузки name (ключ EXPORTS) в формате format"""
+    header, queryset = EXPORTS[name]
+    rows = queryset().iterator(chunk_size=batch_size)
+    if format == "csv":
+        lines = csv_lines(header, rows)
+    else:
+        lines = jsonl_lines(header, rows)
+    chunks = chunked(lines)
+    return gzipped(chunks) if compress else chunks
+
+
+async def aiter_chunks(chunks):
+    """
+    Асинхронный итератор поверх stream_export() для ASGI: синхронный
+    итератор StreamingHttpResponse под ASGI сначала собрал бы в список.
+    Куски читаются в потоке sync_to_async, где открыто соединение с базой.
+    """
+    read = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await read(chunks, None)) is not None:
+        yield chunk
+
+
+def get_filename(name, format, compress, date):
+    filename = f"{name}-{date:%Y%m%d}.{format}"
+    return filename + ".gz" if compress else filename
@@ -0,0 +1,287 @@
+"""
+Фасеты каталога: издательство, годы издания, доступность, первая буква автора.
+
+Число книг у вариантов фасета считается одним запросом с группировкой
+на фасет (GROUP BY), а не отдельным COUNT на каждый вариант.
+Каждый фасет считается по каталогу, отфильтрованному всеми остальными
+фасетами, поисковым запросом и ключевым словом: так в фасете остаются
+видны соседние варианты. Сводка для нефильтрованного каталога хранится
+в кэше и сбрасывается при изменении книг, издательств и авторов.
+Выдача и возврат меняют только фасет «Наличие»: сводка не пересчитывается,
+а поправляется на число выданных или возвращённых книг (shift_available).
+Поправка — чтение и запись кэша, одновременная поправка из другого процесса
+может потеряться, поэтому сводка живёт не дольше LIBRARY_FACETS_TIMEOUT.
+
+Параметры запроса: publisher=<id>, year_from, year_to, available=1|0, initial=<буква>.
+Настройки:
+    LIBRARY_FACET_PUBLISHERS — сколько издательств показывать (по умолчанию 20);
+    LIBRARY_FACETS_TIMEOUT   — время жизни сводки в кэше, секунд (300).
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Substr
+from django.db.models.lookups import In
+
+from lib_app.routers import use_primary
+
+FACETS_KEY = "lib_app:catalogue_facets"
+
+FACET_PARAMS = ("publisher", "year_from", "year_to", "available", "initial")
+
+# Порядок и заголовки фасетов на странице каталога
+FACET_HEADINGS = (
+    ("publisher", "Издательство"),
+    ("year", "Годы издания"),
+    ("available", "Наличие"),
+    ("initial", "Автор на букву"),
+)
+
+
+def parse_int(value):
+    """Целое из GET-параметра; вне диапазона INTEGER базы — None"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if -(2**63) <= value < 2**63 else None
+
+
+def parse_filters(params):
+    """Фильтры фасетов из GET-параметров; некорректные значения отбрасываются"""
+    filters = {}
+    for name in ("publisher", "year_from", "year_to"):
+        value = parse_int(params.get(name))
+        if value is not None:
+            filters[name] = value
+    if params.get("available") in ("1", "0"):
+        filters["available"] = params["available"] == "1"
+    initial = params.get("initial", "").strip()[:1].upper()
+    if initial:
+        filters["initial"] = initial
+    return filters
+
+
+def apply_filters(queryset, filters, skip=()):
+    """
+    Применяет фильтры фасетов, кроме перечисленных в skip
+    (годы задаются парой year_from/year_to и пропускаются вместе по имени year).
+    """
+    if "publisher" in filters and "publisher" not in skip:
+        queryset = queryset.filter(publisher_id=filters["publisher"])
+    if "year" not in skip:
+        if "year_from" in filters:
+            queryset = queryset.filter(year__gte=filters["year_from"])
+        if "year_to" in filters:
+            queryset = queryset.filter(year__lte=filters["year_to"])
+    if "available" in filters and "available" not in skip:
+        queryset = queryset.filter(available=filters["available"])
+    if "initial" in filters and "initial" not in skip:
+        # То же выражение, по которому считается фасет, в обоих регистрах:
+        # LIKE в SQLite различает регистр кириллических букв
+        letter = filters["initial"]
+        queryset = queryset.filter(
+            In(Substr("author_name", 1, 1), sorted({letter, letter.lower()}))
+        )
+    return queryset
+
+
+def grouped(queryset, field, **annotations):
+    """Один запрос GROUP BY по field: [{field, ..., count}, ...]"""
+    return (
+        queryset.order_by()
+        .annotate(**annotations)
+        .values(field, *[name for name in annotations if name != field])
+        .annotate(count=Count("pk"))
+    )
+
+
+def get_publisher_limit():
+    return getattr(settings, "LIBRARY_FACET_PUBLISHERS", 20)
+
+
+def get_timeout():
+    return getattr(settings, "LIBRARY_FACETS_TIMEOUT", 300)
+
+
+def facet_querysets(queryset, filters):
+    """
+    Запросы с группировкой для всех фасетов: {фасет: queryset}.
+    queryset — каталог с поиском и ключевым словом, но без фильтров фасетов.
+    """
+    return {
+        "publisher": grouped(
+            apply_filters(queryset, filters, skip=("publisher",)).exclude(
+                publisher=None
+            ),
+            "publisher_id",
+            publisher_name=F("publisher__name"),
+        ).order_by("-count", "publisher_name")[: get_publisher_limit()],
+        "year": grouped(
+            apply_filters(queryset, filters, skip=("year",)).exclude(year=None),
+            "decade",
+            decade=F("year") / 10 * 10,
+        ).order_by("-decade"),
+        "available": grouped(
+            apply_filters(queryset, filters, skip=("available",)), "available"
+        ).order_by("-available"),
+        "initial": grouped(
+            apply_filters(queryset, filters, skip=("initial",)).exclude(author_name=""),
+            "initial",
+            initial=Substr("author_name", 1, 1),
+        ),
+    }
+
+
+def available_option(value, count):
+    return {"value": value, "label": "Доступна" if value else "Выдана", "count": count}
+
+
+def build_facets(rows):
+    """Варианты фасетов из строк запросов facet_querysets()"""
+    # SQLite upper() не переводит кириллицу в верхний регистр,
+    # поэтому буквы разного регистра сводятся вместе уже в Python
+    initials = {}
+    for row in rows["initial"]:
+        letter = row["initial"].upper()
+        initials[letter] = initials.get(letter, 0) + row["count"]
+
+    return {
+        "publisher": [
+            {
+                "value": row["publisher_id"],
+                "label": row["publisher_name"],
+                "count": row["count"],
+            }
+            for row in rows["publisher"]
+        ],
+        "year": [
+            {
+                "value": row["decade"],
+                "label": f"{row['decade']}-е",
+                "count": row["count"],
+            }
+            for row in rows["year"]
+        ],
+        "available": [
+            available_option(row["available"], row["count"])
+            for row in rows["available"]
+        ],
+        "initial": [
+            {"value": letter, "label": letter, "count": count}
+            for letter, count in sorted(initials.items())
+        ],
+    }
+
+
+def count_facets(queryset, filters):
+    """Число книг по вариантам всех фасетов (четыре запроса с группировкой)"""
+    querysets = facet_querysets(queryset, filters)
+    return build_facets({name: list(qs) for name, qs in querysets.items()})
+
+
+async def acount_facets(queryset, filters):
+    """Асинхронный вариант count_facets()"""
+    querysets = facet_querysets(queryset, filters)
+    return build_facets(
+        {name: [row async for row in qs] for name, qs in querysets.items()}
+    )
+
+
+def get_catalogue_facets(queryset):
+    """Фасеты нефильтрованного каталога из кэша"""
+    facets = cache.get(FACETS_KEY)
+    if facets is None:
+        with use_primary():
+            facets = count_facets(queryset, {})
+        cache.set(FACETS_KEY, facets, get_timeout())
+    return facets
+
+
+async def aget_catalogue_facets(queryset):
+    """Асинхронный вариант get_catalogue_facets()"""
+    facets = await cache.aget(FACETS_KEY)
+    if facets is None:
+        with use_primary():
+            facets = await acount_facets(queryset, {})
+        await cache.aset(FACETS_KEY, facets, get_timeout())
+    return facets
+
+
+def invalidate():
+    transaction.on_commit(lambda: cache.delete(FACETS_KEY))
+
+
+def shift_available(count):
+    """
+    После фиксации транзакции переносит count книг из «Доступна» в «Выдана»
+    (выдача, count > 0) или обратно (возврат, count < 0) в кэшированной сводке
+    вместо её пересчёта четырьмя запросами с группировкой.
+    """
+
+    def shift():
+        facets = cache.get(FACETS_KEY)
+        if facets is None:
+            return
+        counts = {option["value"]: option["count"] for option in facets["available"]}
+        counts[True] = counts.get(True, 0) - count
+        counts[False] = counts.get(False, 0) + count
+        if min(counts.values()) < 0:
+            # Сводка разошлась с базой: пусть пересчитается
+            cache.delete(FACETS_KEY)
+            return
+        facets["available"] = [
+            available_option(value, counts[value])
+            for value in (True, False)
+            if counts[value]
+        ]
+        cache.set(FACETS_KEY, facets, get_timeout())
+
+    transaction.on_commit(shift)
+
+
+def with_links(facets, filters, params):
+    """
+    Добавляет к вариантам фасетов признак selected и строку запроса
+    для ссылки, которая включает вариант (или выключает выбранный).
+    """
+
+    def link(**changes):
+        query = params.copy()
+        for key in ("page", "after", "before"):
+            query.pop(key, None)
+        for key, value in changes.items():
+            query.pop(key, None)
+            if value is not None:
+                query[key] = value
+        return query.urlencode()
+
+    for option in facets["publisher"]:
+        option["selected"] = filters.get("publisher") == option["value"]
+        option["query"] = link(
+            publisher=None if option["selected"] else option["value"]
+        )
+    for option in facets["year"]:
+        decade = option["value"]
+        option["selected"] = (
+            filters.get("year_from") == decade and filters.get("year_to") == decade + 9
+        )
+        if option["selected"]:
+            option["query"] = link(year_from=None, year_to=None)
+        else:
+            option["query"] = link(year_from=decade, year_to=decade + 9)
+    for option in facets["available"]:
+        option["selected"] = filters.get("available") == option["value"]
+        value = "1" if option["value"] else "0"
+        option["query"] = link(available=None if option["selected"] else value)
+    for option in facets["initial"]:
+        option["selected"] = filters.get("initial") == option["value"]
+        option["query"] = link(initial=None if option["selected"] else option["value"])
+    return facets
+
+
+def as_groups(facets):
+    """Непустые фасеты для шаблона: [(заголовок, варианты), ...]"""
+    return [(heading, facets[name]) for name, heading in FACET_HEADINGS if facets[name]]
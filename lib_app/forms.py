@@ -1,7 +1,11 @@
+import re
 from datetime import date
 from django import forms
 from django.core.exceptions import ValidationError
+from .importer import ImportFormatError, detect_format
+from .isbn import canonical_or_raw
 from .models import Book, Author, Publisher
+from .widgets import AutocompleteSelect
 
 
 class BookModelForm(forms.ModelForm):
@@ -38,13 +42,18 @@ class BookModelForm(forms.ModelForm):
             "title": forms.TextInput(
                 attrs={"class": "form-control", "placeholder": "Введите название"}
             ),
-            "author": forms.Select(attrs={"class": "form-control"}),
-            "publisher": forms.Select(attrs={"class": "form-control"}),
+            # Варианты подгружаются по мере ввода, а не все строки справочника
+            "author": AutocompleteSelect(
+                "author_autocomplete", attrs={"class": "form-control"}
+            ),
+            "publisher": AutocompleteSelect(
+                "publisher_autocomplete", attrs={"class": "form-control"}
+            ),
             "isbn": forms.TextInput(
                 attrs={
                     "class": "form-control",
-                    "maxlength": 32,
-                    "placeholder": "Введите ISBN",
+                    "maxlength": 17,
+                    "placeholder": "ISBN-13 или ISBN-10, можно с дефисами",
                 }
             ),
             "year": forms.NumberInput(
@@ -166,3 +175,96 @@ class PublisherModelForm(forms.ModelForm):
                 }
             )
         }
+
+
+# Наибольшее значение первичного ключа (BigAutoField)
+MAX_LOAN_ID = 2**63 - 1
+
+
+class ReturnBooksForm(forms.Form):
+    """Форма пакетного возврата книг: номера выдач и/или ISBN"""
+
+    loan_ids = forms.CharField(
+        label="Номера выдач",
+        required=False,
+        widget=forms.Textarea(
+            attrs={
+                "class": "form-control",
+                "rows": 4,
+                "placeholder": "По одному номеру в строке или через пробел",
+            }
+        ),
+    )
+    isbns = forms.CharField(
+        label="ISBN",
+        required=False,
+        widget=forms.Textarea(
+            attrs={
+                "class": "form-control",
+                "rows": 8,
+                "autofocus": True,
+                "placeholder": "Сканируйте штрихкоды книг, по одному в строке",
+            }
+        ),
+    )
+
+    @staticmethod
+    def split_codes(value):
+        return [code for code in re.split(r"[\s,;]+", value or "") if code]
+
+    def clean_loan_ids(self):
+        codes = self.split_codes(self.cleaned_data.get("loan_ids"))
+        # Только цифры ASCII («²» проходит str.isdigit(), но не int())
+        # и не больше наибольшего id в базе (64-битное целое)
+        wrong = [
+            code
+            for code in codes
+            if not re.fullmatch(r"\d+", code, re.ASCII) or int(code) > MAX_LOAN_ID
+        ]
+        if wrong:
+            raise ValidationError(
+                f"Номер выдачи должен быть числом: {', '.join(wrong)}"
+            )
+        return [int(code) for code in codes]
+
+    def clean_isbns(self):
+        # ISBN приводится к виду, в котором хранится в базе: 978-5-17-...,
+        # 978517... и ISBN-10 той же книги — один код. Некорректный номер
+        # не ошибка формы: по нему вернётся «не найдено»
+        return [
+            canonical_or_raw(code)
+            for code in self.split_codes(self.cleaned_data.get("isbns"))
+        ]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get("loan_ids") and not cleaned_data.get("isbns"):
+            if not self.errors:
+                raise ValidationError("Введите хотя бы один номер выдачи или ISBN.")
+        return cleaned_data
+
+
+class BookImportForm(forms.Form):
+    """Загрузка файла каталога для пакетного импорта (lib_app.importer)"""
+
+    file = forms.FileField(
+        label="Файл CSV или JSONL",
+        help_text="Можно сжатый gzip (.csv.gz, .jsonl.gz). Столбцы: title, author, "
+        "publisher, isbn, year, short_description, key_words.",
+        widget=forms.ClearableFileInput(
+            attrs={"class": "form-control", "accept": ".csv,.jsonl,.ndjson,.gz"}
+        ),
+    )
+    update = forms.BooleanField(
+        label="Обновлять книги с существующим ISBN",
+        required=False,
+        initial=True,
+    )
+
+    def clean_file(self):
+        upload = self.cleaned_data["file"]
+        try:
+            self.format = detect_format(upload.name)
+        except ImportFormatError as error:
+            raise ValidationError(str(error))
+        return upload
@@ -0,0 +1,83 @@
+"""
+SQL полнотекстового индекса каталога (SQLite FTS5).
+
+Индекс lib_app_book_fts ведётся триггерами на таблице книг. Имя автора
+берётся из Book.author_name, поэтому переименование или удаление автора
+тоже попадает в индекс через обновление книг.
+
+SQLite при изменении схемы пересоздаёт таблицу книг и теряет её триггеры,
+поэтому install_triggers() вызывается после каждой миграции (post_migrate).
+Миграции, которые меняют данные книг после такого пересоздания,
+должны сами перестроить индекс (rebuild()).
+"""
+
+FTS_TABLE = "lib_app_book_fts"
+
+FTS_INSERT_ROW_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, author, key_words, short_description, isbn)
+    VALUES (
+        new.id, new.title, new.author_name,
+        new.key_words, new.short_description, new.isbn
+    );
+"""
+
+TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS lib_app_book_fts_ai AFTER INSERT ON lib_app_book
+    BEGIN
+        {FTS_INSERT_ROW_SQL}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS lib_app_book_fts_au
+    AFTER UPDATE OF title, author_name, key_words, short_description, isbn
+    ON lib_app_book
+    BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        {FTS_INSERT_ROW_SQL}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS lib_app_book_fts_ad AFTER DELETE ON lib_app_book
+    BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+]
+
+DROP_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS lib_app_author_fts_au",
+    "DROP TRIGGER IF EXISTS lib_app_book_fts_ad",
+    "DROP TRIGGER IF EXISTS lib_app_book_fts_au",
+    "DROP TRIGGER IF EXISTS lib_app_book_fts_ai",
+]
+
+REBUILD_SQL = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, author, key_words, short_description, isbn)
+    SELECT id, title, author_name, key_words, short_description, isbn FROM lib_app_book
+    """,
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')",
+]
+
+
+def fts_table_exists(connection):
+    with connection.cursor() as cursor:
+        return FTS_TABLE in connection.introspection.table_names(cursor)
+
+
+def install_triggers(connection):
+    """Создаёт недостающие триггеры индекса (повторный вызов безопасен)"""
+    if connection.vendor != "sqlite" or not fts_table_exists(connection):
+        return
+    with connection.cursor() as cursor:
+        for sql in TRIGGERS_SQL:
+            cursor.execute(sql)
+
+
+def rebuild(connection):
+    """Полностью перестраивает содержимое индекса по таблице книг"""
+    with connection.cursor() as cursor:
+        for sql in REBUILD_SQL:
+            cursor.execute(sql)
@@ -0,0 +1,393 @@
+"""
+Пакетный импорт каталога из CSV и JSONL.
+
+Файл читается потоком, а записи сохраняются пачками по batch_size: на пачку
+уходит несколько запросов (авторы, издательства, книги по ISBN, bulk_create
+новых книг, bulk_update изменённых) в одной транзакции. Память ограничена
+размером пачки и кэшами авторов и издательств, а не размером файла.
+
+Книги сопоставляются по ISBN (канонический ISBN-13, см. lib_app.isbn):
+запись с ISBN, который уже есть в каталоге, обновляет все экземпляры этого
+издания, запись без ISBN всегда добавляет книгу. Авторы и издательства
+ищутся по нормализованному имени (search_key) и создаются, если их нет.
+
+Поля записи: title (обязательно), author, publisher, isbn, year,
+short_description, key_words. В CSV первая строка — заголовок с этими
+именами, в JSONL каждая строка — объект JSON. Файлы .gz распаковываются
+на лету.
+
+bulk_create и bulk_update обходят save() и сигналы, поэтому search_name,
+копия имени автора, updated_at, ключевые слова и кэши каталога
+ведутся здесь явно.
+"""
+
+import csv
+import gzip
+import io
+import json
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import reset_queries, transaction
+from django.utils import timezone
+
+from lib_app import catalogue_cache, facets, keywords, leaderboard
+from lib_app.models import Author, Book, Publisher, search_key
+
+FORMATS = ("csv", "jsonl")
+
+# Поля книги, которые берутся из записи (после проверки полем модели)
+BOOK_FIELDS = ("title", "isbn", "year", "short_description", "key_words")
+# Поля, которые импорт меняет у существующей книги
+UPDATE_FIELDS = (
+    "title",
+    "author",
+    "author_name",
+    "publisher",
+    "year",
+    "short_description",
+    "key_words",
+)
+
+DEFAULT_BATCH_SIZE = 1000
+# Книг в одном UPDATE при обновлении (см. CatalogueImporter.update_books)
+UPDATE_BATCH_SIZE = 100
+# Сколько авторов и издательств помнить между пачками
+DEFAULT_CACHE_SIZE = 100_000
+# Сколько ошибок по записям хранить для отчёта (считаются все)
+MAX_ERRORS = 100
+
+
+class ImportFormatError(ValueError):
+    """Файл не удаётся прочитать как CSV или JSONL"""
+
+
+@dataclass
+class ImportStats:
+    """Ход и итог импорта"""
+
+    read: int = 0  # прочитано записей
+    created: int = 0  # добавлено книг
+    updated: int = 0  # записей, изменивших существующие книги
+    unchanged: int = 0  # записей, совпавших с каталогом
+    skipped: int = 0  # записей с существующим ISBN при update=False
+    failed: int = 0  # записей с ошибками
+    authors_created: int = 0
+    publishers_created: int = 0
+    errors: list = field(default_factory=list)  # [(номер записи, текст)]
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        """Записей в секунду"""
+        elapsed = self.elapsed
+        return self.read / elapsed if elapsed else 0.0
+
+
+class NameCache:
+    """
+    (id, имя) по нормализованному имени. Хранит не больше size имён,
+    вытесняя давно не встречавшиеся, чтобы память не росла с файлом.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+
+    def get(self, key):
+        item = self.items.get(key)
+        if item is not None:
+            self.items.move_to_end(key)
+        return item
+
+    def set(self, key, item):
+        self.items[key] = item
+        self.items.move_to_end(key)
+        if len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+
+def detect_format(name):
+    """Формат по расширению имени файла (file.csv, file.jsonl.gz, ...)"""
+    name = name.lower().removesuffix(".gz")
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ImportFormatError("Формат файла не распознан: ожидается .csv или .jsonl.")
+
+
+def open_text(fileobj, name=""):
+    """Текстовый поток поверх двоичного файла; .gz распаковывается на лету"""
+    if name.lower().endswith(".gz"):
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    # utf-8-sig: Excel сохраняет CSV с BOM
+    return io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+
+
+def read_csv(stream, delimiter=","):
+    reader = csv.DictReader(stream, delimiter=delimiter)
+    try:
+        if reader.fieldnames is not None and "title" not in reader.fieldnames:
+            raise ImportFormatError("В заголовке CSV нет столбца title.")
+        yield from reader
+    except csv.Error as error:
+        raise ImportFormatError(f"Строка {reader.line_num}: {error}")
+
+
+def read_jsonl(stream):
+    # Строка разбирается в clean_record(): некорректный JSON — ошибка
+    # одной записи, а не всего файла
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def read_records(stream, format, delimiter=","):
+    """Записи файла по одной; ошибка кодировки прерывает импорт"""
+    records = read_csv(stream, delimiter) if format == "csv" else read_jsonl(stream)
+    try:
+        yield from records
+    except (UnicodeDecodeError, gzip.BadGzipFile, EOFError) as error:
+        raise ImportFormatError(f"Файл не читается: {error}")
+
+
+def clean_name(model, value):
+    """Имя автора или издательства без лишних пробелов ("" — не указано)"""
+    name = " ".join(str(value or "").split())
+    if name:
+        model._meta.get_field("name").clean(name, None)
+    return name
+
+
+def clean_record(record):
+    """
+    Проверяет запись полями моделей и возвращает словарь значений.
+    При ошибке бросает ValidationError с именем поля в тексте.
+    """
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            raise ValidationError("Некорректный JSON.")
+    if not isinstance(record, dict):
+        raise ValidationError("Запись должна быть объектом.")
+
+    values = {}
+    for name, model in (("author", Author), ("publisher", Publisher)):
+        try:
+            values[name] = clean_name(model, record.get(name))
+        except ValidationError as error:
+            raise ValidationError(f"{name}: {' '.join(error.messages)}")
+    for name in BOOK_FIELDS:
+        value = record.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "":
+            # Пустой год — «не указан», пустое название — ошибка поля
+            value = None if name == "year" else ""
+        try:
+            values[name] = Book._meta.get_field(name).clean(value, None)
+        except ValidationError as error:
+            raise ValidationError(f"{name}: {' '.join(error.messages)}")
+    return values
+
+
+class CatalogueImporter:
+    """
+    Импорт записей пачками. progress(stats) вызывается после каждой
+    сохранённой пачки.
+    """
+
+    def __init__(
+        self,
+        batch_size=DEFAULT_BATCH_SIZE,
+        update=True,
+        cache_size=DEFAULT_CACHE_SIZE,
+        progress=None,
+    ):
+        self.batch_size = batch_size
+        self.update = update
+        self.progress = progress
+        self.authors = NameCache(cache_size)
+        self.publishers = NameCache(cache_size)
+        self.stats = ImportStats()
+
+    def run(self, records):
+        batch = []
+        for record in records:
+            self.stats.read += 1
+            try:
+                batch.append(clean_record(record))
+            except ValidationError as error:
+                self.add_error(self.stats.read, " ".join(error.messages))
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch)
+                batch = []
+        if batch:
+            self.save_batch(batch)
+        return self.stats
+
+    def add_error(self, number, message):
+        self.stats.failed += 1
+        if len(self.stats.errors) < MAX_ERRORS:
+            self.stats.errors.append((number, message))
+
+    def save_batch(self, rows):
+        with transaction.atomic():
+            authors = self.resolve(
+                Author, self.authors, [row["author"] for row in rows], "authors_created"
+            )
+            publishers = self.resolve(
+                Publisher,
+                self.publishers,
+                [row["publisher"] for row in rows],
+                "publishers_created",
+            )
+
+            # Записи с одним ISBN в пачке: действует последняя
+            by_isbn = {}
+            new_books = []
+            for row in rows:
+                author_id, author_name = authors.get(row["author"], (None, ""))
+                values = {name: row[name] for name in BOOK_FIELDS}
+                values.update(
+                    author_id=author_id,
+                    author_name=author_name,
+                    publisher_id=publishers.get(row["publisher"], (None, ""))[0],
+                )
+                if values["isbn"]:
+                    by_isbn[values["isbn"]] = values
+                else:
+                    new_books.append(values)
+
+            existing = defaultdict(list)
+            if by_isbn:
+                books = Book.objects.filter(isbn__in=by_isbn).only(
+                    "isbn", *UPDATE_FIELDS
+                )
+                for book in books:
+                    existing[book.isbn].append(book)
+
+            changed = self.update_books(by_isbn, existing)
+            new_books += [
+                values for isbn, values in by_isbn.items() if isbn not in existing
+            ]
+            created = Book.objects.bulk_create([Book(**values) for values in new_books])
+            self.stats.created += len(created)
+
+            # Ключевые слова и кэши — только если пачка что-то изменила
+            if created or changed:
+                keywords.sync_book_keywords(
+                    [book for book in created if book.key_words]
+                    + [book for book in changed if book.keywords_changed]
+                )
+                leaderboard.invalidate()
+                facets.invalidate()
+                keywords.invalidate_cloud()
+                catalogue_cache.bump_version()
+
+        # При DEBUG Django хранит текст каждого запроса, а запросы пачки
+        # велики: без сброса память росла бы с числом пачек
+        reset_queries()
+        if self.progress:
+            self.progress(self.stats)
+
+    def resolve(self, model, cache, names, counter):
+        """
+        {нормализованное имя: (id, имя)} для имён пачки: из кэша, из базы
+        или только что созданные. Ключи — search_key(имя).
+        """
+        result = {}
+        missing = {}
+        for name in names:
+            if not name:
+                continue
+            key = search_key(name)
+            item = cache.get(key)
+            if item is None:
+                missing.setdefault(key, name)
+            else:
+                result[key] = item
+        if missing:
+            # По убыванию id: при дублях в справочнике берётся самая старая запись
+            rows = (
+                model.objects.filter(search_name__in=missing)
+                .order_by("-pk")
+                .values_list("search_name", "pk", "name")
+            )
+            found = {key: (pk, name) for key, pk, name in rows}
+            created = model.objects.bulk_create(
+                [
+                    model(name=name, search_name=key)
+                    for key, name in missing.items()
+                    if key not in found
+                ]
+            )
+            setattr(self.stats, counter, getattr(self.stats, counter) + len(created))
+            found.update((obj.search_name, (obj.pk, obj.name)) for obj in created)
+            for key, item in found.items():
+                cache.set(key, item)
+            result.update(found)
+        # Записи ссылаются на имя как написано: отображаем и его
+        return {name: result[search_key(name)] for name in names if name}
+
+    def update_books(self, by_isbn, existing):
+        """Обновляет найденные по ISBN книги; возвращает изменённые"""
+        now = timezone.now()
+        changed = []
+        fields = {"updated_at"}
+        for isbn, books in existing.items():
+            values = by_isbn[isbn]
+            if not self.update:
+                self.stats.skipped += 1
+                continue
+            record_changed = False
+            for book in books:
+                book.keywords_changed = book.key_words != values["key_words"]
+                diff = {
+                    name: value
+                    for name, value in values.items()
+                    if getattr(book, name) != value
+                }
+                if diff:
+                    for name, value in diff.items():
+                        setattr(book, name, value)
+                    fields.update(diff)
+                    # bulk_update не обновляет auto_now
+                    book.updated_at = now
+                    changed.append(book)
+                    record_changed = True
+            if record_changed:
+                self.stats.updated += 1
+            else:
+                self.stats.unchanged += 1
+        if changed:
+            # UPDATE ... SET поле = CASE id WHEN ... : SQLite перебирает ветки
+            # CASE для каждой строки, поэтому обновляем небольшими порциями
+            # и только поля, которые действительно изменились
+            Book.objects.bulk_update(
+                changed, sorted(fields), batch_size=UPDATE_BATCH_SIZE
+            )
+        return changed
+
+
+def import_file(fileobj, name, format=None, delimiter=",", **options):
+    """
+    Импортирует двоичный файл fileobj (имя нужно для формата и .gz)
+    и возвращает ImportStats. options передаются в CatalogueImporter.
+    """
+    format = format or detect_format(name)
+    stream = open_text(fileobj, name)
+    try:
+        return CatalogueImporter(**options).run(read_records(stream, format, delimiter))
+    finally:
+        # Файл закрывает вызывающий код
+        stream.detach()
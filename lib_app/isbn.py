@@ -0,0 +1,63 @@
+"""
+Нормализация ISBN.
+
+В базе ISBN хранится в одной канонической форме — 13 цифр без дефисов
+(ISBN-10 переводится в ISBN-13 с префиксом 978), поэтому поиск книги
+по отсканированному штрихкоду — точное совпадение по индексу.
+"""
+
+import re
+
+# Дефисы, пробелы и прочие разделители, которые встречаются в записи ISBN
+SEPARATORS_RE = re.compile(r"[\s\-‐‑‒–—_.]")
+# Префикс «ISBN», «ISBN-13:» и т. п. перед номером
+PREFIX_RE = re.compile(r"^isbn(?:-?1[03])?:?", re.IGNORECASE)
+
+
+class InvalidISBN(ValueError):
+    """Строка не является корректным ISBN-10 или ISBN-13"""
+
+
+def isbn13_check_digit(digits):
+    """Контрольная цифра по первым 12 цифрам ISBN-13"""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits[:12]))
+    return str(-total % 10)
+
+
+def isbn10_check_digit(digits):
+    """Контрольная цифра по первым 9 цифрам ISBN-10 (может быть X)"""
+    total = sum(int(d) * (10 - i) for i, d in enumerate(digits[:9]))
+    check = -total % 11
+    return "X" if check == 10 else str(check)
+
+
+def normalize_isbn(value):
+    """
+    Возвращает ISBN-13 из 13 цифр. Принимает ISBN-10 и ISBN-13
+    с дефисами, пробелами и префиксом «ISBN». Для некорректного
+    номера (длина, символы, контрольная цифра) бросает InvalidISBN.
+    """
+    code = SEPARATORS_RE.sub("", PREFIX_RE.sub("", value.strip())).upper()
+    if re.fullmatch(r"\d{9}[\dX]", code):
+        if code[9] != isbn10_check_digit(code):
+            raise InvalidISBN("Неверная контрольная цифра ISBN-10.")
+        code = "978" + code[:9]
+        return code + isbn13_check_digit(code)
+    if re.fullmatch(r"\d{13}", code):
+        if not code.startswith(("978", "979")):
+            raise InvalidISBN("ISBN-13 должен начинаться с 978 или 979.")
+        if code[12] != isbn13_check_digit(code):
+            raise InvalidISBN("Неверная контрольная цифра ISBN-13.")
+        return code
+    raise InvalidISBN("ISBN должен содержать 10 или 13 цифр.")
+
+
+def canonical_or_raw(value):
+    """
+    Канонический ISBN, если номер корректен, иначе строка без разделителей.
+    Для мест, где некорректный номер не ошибка, а просто «не найдено».
+    """
+    try:
+        return normalize_isbn(value)
+    except InvalidISBN:
+        return SEPARATORS_RE.sub("", value.strip())
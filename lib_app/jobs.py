@@ -0,0 +1,210 @@
+"""
+Фоновые задачи в базе данных.
+
+Долгие операции обслуживания (перестройка индекса, пересчёт счётчиков,
+выгрузки, ночные проверки) ставятся в очередь — таблицу Job — и выполняются
+командой run_jobs вне HTTP-запросов. Воркер занимает задачи
+Job.objects.claim() (SKIP LOCKED, в SQLite — условный UPDATE)
+и выполняет их в пуле процессов или потоков, поэтому несколько задач
+идут параллельно на разных ядрах, а несколько воркеров не мешают друг другу.
+
+Задача, упавшая с исключением, повторяется позже (задержка растёт вдвое
+с каждой попыткой), пока не исчерпает max_attempts. Пока задача
+выполняется, воркер раз в LIBRARY_JOB_HEARTBEAT секунд обновляет
+Job.heartbeat_at. Задача без отметки дольше LIBRARY_JOB_TIMEOUT (воркер
+упал или завис) считается неудавшейся попыткой; долгая, но живая задача
+повторно не запускается. Результат попытки записывается только если
+задачу с тех пор не заняли снова (условие по attempts).
+
+Задачи регистрируются декоратором @task: функция получает kwargs задачи
+и возвращает текст результата.
+
+Настройки:
+    LIBRARY_JOB_TIMEOUT     — секунд без отметки воркера до признания
+                              задачи зависшей (300);
+    LIBRARY_JOB_HEARTBEAT   — как часто воркер отмечает задачи, секунд (30);
+    LIBRARY_JOB_RETRY_DELAY — задержка первого повтора, секунд (60);
+    LIBRARY_EXPORT_DIR      — каталог для файлов задачи export_data.
+"""
+
+import os
+import socket
+import traceback
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from lib_app.models import Job
+
+# Имя задачи: (название для персонала, функция)
+TASKS = {}
+
+# Сколько символов вывода задачи хранить в Job.result
+RESULT_MAX_LENGTH = 10_000
+
+
+def task(name, label):
+    """Регистрирует функцию как задачу name"""
+
+    def register(func):
+        TASKS[name] = (label, func)
+        return func
+
+    return register
+
+
+def get_timeout():
+    return timedelta(seconds=getattr(settings, "LIBRARY_JOB_TIMEOUT", 300))
+
+
+def get_heartbeat_interval():
+    return getattr(settings, "LIBRARY_JOB_HEARTBEAT", 30)
+
+
+def get_retry_delay(attempts):
+    """Задержка перед повтором после attempts неудачных попыток"""
+    base = getattr(settings, "LIBRARY_JOB_RETRY_DELAY", 60)
+    return timedelta(seconds=base * 2 ** max(attempts - 1, 0))
+
+
+def enqueue(name, max_attempts=3, **kwargs):
+    """
+    Ставит задачу в очередь. Внутри транзакции задача станет видна
+    воркерам только после её фиксации.
+    """
+    if name not in TASKS:
+        raise ValueError(f"Неизвестная задача: {name}")
+    return Job.objects.create(name=name, kwargs=kwargs, max_attempts=max_attempts)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def heartbeat(job_ids, worker, now=None):
+    """Отмечает, что воркер worker ещё выполняет задачи job_ids"""
+    return Job.objects.filter(
+        id__in=job_ids, status=Job.RUNNING, locked_by=worker
+    ).update(heartbeat_at=now or timezone.now())
+
+
+def fail(jobs, message, now):
+    """
+    Неудачная попытка: задача возвращается в очередь с задержкой
+    или, если попытки исчерпаны, получает статус FAILED.
+    """
+    for job in jobs:
+        if job.attempts < job.max_attempts:
+            changes = {
+                "status": Job.QUEUED,
+                "run_after": now + get_retry_delay(job.attempts),
+            }
+        else:
+            changes = {"status": Job.FAILED, "finished_at": now}
+        # Условие по попытке: задачу могли уже закрыть или занять снова
+        Job.objects.filter(id=job.id, status=Job.RUNNING, attempts=job.attempts).update(
+            result=message[-RESULT_MAX_LENGTH:], locked_by="", **changes
+        )
+
+
+def requeue_stale(now=None):
+    """Задачи без отметки воркера дольше LIBRARY_JOB_TIMEOUT — неудачная попытка"""
+    now = now or timezone.now()
+    stale = list(
+        Job.objects.filter(
+            status=Job.RUNNING, heartbeat_at__lt=now - get_timeout()
+        ).only("attempts", "max_attempts")
+    )
+    if stale:
+        with transaction.atomic():
+            fail(stale, "Воркер перестал отвечать.", now)
+    return len(stale)
+
+
+def execute_job(job_id):
+    """
+    Выполняет занятую задачу; вызывается в процессе или потоке пула.
+    Возвращает (id, новый статус).
+    """
+    close_old_connections()
+    try:
+        job = Job.objects.get(id=job_id, status=Job.RUNNING)
+        try:
+            _label, func = TASKS[job.name]
+            result = func(**job.kwargs)
+        except Exception:
+            with transaction.atomic():
+                fail([job], traceback.format_exc(), timezone.now())
+            return job.id, Job.objects.values_list("status", flat=True).get(id=job.id)
+        Job.objects.filter(id=job.id, status=Job.RUNNING, attempts=job.attempts).update(
+            status=Job.DONE,
+            finished_at=timezone.now(),
+            locked_by="",
+            result=str(result or "")[-RESULT_MAX_LENGTH:],
+        )
+        return job.id, Job.objects.values_list("status", flat=True).get(id=job.id)
+    finally:
+        # Как после HTTP-запроса: процессы и потоки пула живут долго
+        close_old_connections()
+
+
+def get_status_counts():
+    """{статус: число задач} одним GROUP BY"""
+    counts = dict.fromkeys((value for value, _ in Job.STATUS_CHOICES), 0)
+    counts.update(
+        Job.objects.order_by()
+        .values_list("status")
+        .annotate(n=Count("id"))
+        .values_list("status", "n")
+    )
+    return counts
+
+
+def run_command(name, *args, **options):
+    """Запускает команду управления и возвращает её вывод"""
+    out = StringIO()
+    call_command(name, *args, stdout=out, stderr=out, **options)
+    return out.getvalue()
+
+
+################################
+# Задачи
+################################
+
+
+@task("rebuild_search_index", "Перестроить поисковый индекс")
+def rebuild_search_index():
+    return run_command("rebuild_search_index")
+
+
+@task("repair_loan_counters", "Пересчитать счётчики выдач читателей")
+def repair_loan_counters():
+    return run_command("repair_loan_counters")
+
+
+@task("tokenize_keywords", "Разобрать ключевые слова всех книг")
+def tokenize_keywords():
+    return run_command("tokenize_keywords")
+
+
+@task("scan_overdue_loans", "Напомнить о просроченных выдачах")
+def scan_overdue_loans():
+    return run_command("scan_overdue_loans")
+
+
+@task("export_data", "Выгрузить книги в файл (CSV, gzip)")
+def export_data(name="books", format="csv", gzip=True):
+    directory = getattr(settings, "LIBRARY_EXPORT_DIR", settings.BASE_DIR / "exports")
+    os.makedirs(directory, exist_ok=True)
+    from lib_app.exporter import get_filename
+
+    path = os.path.join(
+        directory, get_filename(name, format, gzip, timezone.localdate())
+    )
+    output = run_command("export_data", name, format=format, gzip=gzip, output=path)
+    return f"{path}\n{output}"
@@ -0,0 +1,133 @@
+"""
+Ключевые слова каталога.
+
+Book.key_words остаётся свободным текстом, который редактирует персонал;
+из него разбираются записи Keyword и связи книга–слово (Book.keywords).
+Фильтр каталога по слову идёт через индекс таблицы связей, поэтому
+его стоимость зависит от числа найденных книг, а не от размера каталога.
+
+Облако слов (слова с числом книг) считается группировкой по таблице
+связей и хранится в кэше до следующего изменения ключевых слов.
+Настройка LIBRARY_KEYWORD_CLOUD_SIZE — сколько слов в облаке (по умолчанию 50).
+"""
+
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from lib_app import catalogue_cache
+from lib_app.models import Book, Keyword, search_key
+from lib_app.routers import use_primary
+
+KEYWORD_CLOUD_KEY = "lib_app:keyword_cloud"
+
+# Слова в key_words разделяются запятыми, точками с запятой и переводами строк
+SEPARATORS_RE = re.compile(r"[,;\n\r]+")
+
+NAME_MAX_LENGTH = Keyword._meta.get_field("name").max_length
+
+
+def parse_keywords(text):
+    """
+    Разбирает текст в словарь {нормализованное слово: слово как написано}
+    в порядке появления; повторы в другом регистре отбрасываются.
+    """
+    words = {}
+    for part in SEPARATORS_RE.split(text or ""):
+        name = " ".join(part.split())[:NAME_MAX_LENGTH]
+        if name:
+            words.setdefault(search_key(name), name)
+    return words
+
+
+def sync_book_keywords(books):
+    """
+    Приводит связи книг с ключевыми словами в соответствие с их key_words.
+    Работает пачкой: недостающие слова создаются одним bulk_create,
+    связи заменяются одним DELETE и одним bulk_create на всю пачку.
+    """
+    books = list(books)
+    if not books:
+        return
+    parsed = {book.pk: parse_keywords(book.key_words) for book in books}
+    names = {}
+    for words in parsed.values():
+        for normalized, name in words.items():
+            names.setdefault(normalized, name)
+
+    with transaction.atomic():
+        Keyword.objects.bulk_create(
+            [
+                Keyword(name=name, normalized=normalized)
+                for normalized, name in names.items()
+            ],
+            ignore_conflicts=True,
+        )
+        ids = dict(
+            Keyword.objects.filter(normalized__in=names).values_list("normalized", "pk")
+        )
+        Link = Book.keywords.through
+        Link.objects.filter(book_id__in=parsed).delete()
+        Link.objects.bulk_create(
+            Link(book_id=book_id, keyword_id=ids[normalized])
+            for book_id, words in parsed.items()
+            for normalized in words
+        )
+        invalidate_cloud()
+        catalogue_cache.bump_version()
+
+
+def book_keywords_changed(book):
+    """Совпадает ли сохранённый набор слов книги с её key_words"""
+    current = set(book.keywords.values_list("normalized", flat=True))
+    return current != set(parse_keywords(book.key_words))
+
+
+def get_keyword(normalized):
+    """Ключевое слово по нормализованной форме или None"""
+    return Keyword.objects.filter(normalized=search_key(normalized)).first()
+
+
+async def aget_keyword(normalized):
+    """Асинхронный вариант get_keyword()"""
+    return await Keyword.objects.filter(normalized=search_key(normalized)).afirst()
+
+
+def get_cloud_size():
+    return getattr(settings, "LIBRARY_KEYWORD_CLOUD_SIZE", 50)
+
+
+def cloud_queryset():
+    return (
+        Keyword.objects.annotate(count=Count("books"))
+        .filter(count__gt=0)
+        .order_by("-count", "normalized")
+        .values("name", "normalized", "count")[: get_cloud_size()]
+    )
+
+
+def get_keyword_cloud():
+    """Самые частые слова: [{name, normalized, count}, ...] по убыванию count"""
+    cloud = cache.get(KEYWORD_CLOUD_KEY)
+    if cloud is None:
+        with use_primary():
+            cloud = list(cloud_queryset())
+        cache.set(KEYWORD_CLOUD_KEY, cloud, None)
+    return cloud
+
+
+async def aget_keyword_cloud():
+    """Асинхронный вариант get_keyword_cloud()"""
+    cloud = await cache.aget(KEYWORD_CLOUD_KEY)
+    if cloud is None:
+        with use_primary():
+            cloud = [item async for item in cloud_queryset()]
+        await cache.aset(KEYWORD_CLOUD_KEY, cloud, None)
+    return cloud
+
+
+def invalidate_cloud():
+    transaction.on_commit(lambda: cache.delete(KEYWORD_CLOUD_KEY))
@@ -0,0 +1,144 @@
+"""
+Данные главной страницы в кэше: топ самых выдаваемых книг
+и общее число книг в каталоге.
+
+Топ хранится списком словарей и при выдаче книг обновляется
+на месте (record_issued), без повторного запроса к таблице книг:
+times_of_issued только растёт, поэтому книга, не вошедшая в топ,
+может попасть в него лишь в момент своей выдачи.
+Счётчик книг увеличивается и уменьшается сигналами создания
+и удаления книги. Изменения попадают в кэш после фиксации транзакции.
+
+Настройки:
+    LIBRARY_TOP_BOOKS_SIZE      — сколько книг в топе (по умолчанию 5);
+    LIBRARY_LEADERBOARD_TIMEOUT — время жизни записей кэша в секундах
+                                  (по умолчанию 300), ограничивает
+                                  расхождение между процессами.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from lib_app.models import Book
+from lib_app.routers import use_primary
+
+TOP_BOOKS_KEY = "lib_app:top_books"
+BOOKS_TOTAL_KEY = "lib_app:books_total"
+
+TOP_BOOK_FIELDS = ("id", "title", "author_name", "times_of_issued")
+
+
+def get_top_size():
+    return getattr(settings, "LIBRARY_TOP_BOOKS_SIZE", 5)
+
+
+def get_timeout():
+    return getattr(settings, "LIBRARY_LEADERBOARD_TIMEOUT", 300)
+
+
+def top_books_queryset(limit=None):
+    """Запрос топа по частичному индексу book_top_issued_idx"""
+    return (
+        Book.objects.filter(times_of_issued__gt=0)
+        .order_by("-times_of_issued", "pk")
+        .values(*TOP_BOOK_FIELDS)[: limit or get_top_size()]
+    )
+
+
+def sort_key(book):
+    return -book["times_of_issued"], book["id"]
+
+
+def get_top_books():
+    """Топ книг: [{id, title, author_name, times_of_issued}, ...]"""
+    top_books = cache.get(TOP_BOOKS_KEY)
+    if top_books is None:
+        with use_primary():
+            top_books = list(top_books_queryset())
+        cache.set(TOP_BOOKS_KEY, top_books, get_timeout())
+    return top_books
+
+
+async def aget_top_books():
+    """Асинхронный вариант get_top_books()"""
+    top_books = await cache.aget(TOP_BOOKS_KEY)
+    if top_books is None:
+        with use_primary():
+            top_books = [book async for book in top_books_queryset()]
+        await cache.aset(TOP_BOOKS_KEY, top_books, get_timeout())
+    return top_books
+
+
+def get_books_total():
+    """Общее число книг в каталоге"""
+    total = cache.get(BOOKS_TOTAL_KEY)
+    if total is None:
+        with use_primary():
+            total = Book.objects.count()
+        cache.set(BOOKS_TOTAL_KEY, total, get_timeout())
+    return total
+
+
+async def aget_books_total():
+    """Асинхронный вариант get_books_total()"""
+    total = await cache.aget(BOOKS_TOTAL_KEY)
+    if total is None:
+        with use_primary():
+            total = await Book.objects.acount()
+        await cache.aset(BOOKS_TOTAL_KEY, total, get_timeout())
+    return total
+
+
+def record_issued(books):
+    """
+    Учитывает выдачу книг в топе. books — словари с полями TOP_BOOK_FIELDS,
+    times_of_issued — значение уже после выдачи.
+    """
+    books = [dict(book) for book in books]
+    if not books:
+        return
+
+    def update():
+        top_books = cache.get(TOP_BOOKS_KEY)
+        if top_books is None:
+            return  # топ будет построен при следующем чтении
+        by_id = {book["id"]: book for book in top_books}
+        by_id.update((book["id"], book) for book in books)
+        top_books = sorted(by_id.values(), key=sort_key)[: get_top_size()]
+        cache.set(TOP_BOOKS_KEY, top_books, get_timeout())
+
+    transaction.on_commit(update)
+
+
+def invalidate_top_books(book_ids=None):
+    """
+    Сбрасывает топ. Если переданы book_ids, сбрасывает только когда
+    хотя бы одна из книг в нём есть (например, при изменении названия).
+    """
+
+    def invalidate():
+        if book_ids is not None:
+            top_books = cache.get(TOP_BOOKS_KEY) or []
+            if not {book["id"] for book in top_books} & set(book_ids):
+                return
+        cache.delete(TOP_BOOKS_KEY)
+
+    transaction.on_commit(invalidate)
+
+
+def change_books_total(delta):
+    """Изменяет счётчик книг; если его нет в кэше, он посчитается при чтении"""
+
+    def change():
+        try:
+            cache.incr(BOOKS_TOTAL_KEY, delta)
+        except ValueError:
+            pass
+
+    transaction.on_commit(change)
+
+
+def invalidate():
+    """Сбрасывает все данные главной страницы (после массовых изменений)"""
+    transaction.on_commit(lambda: cache.delete_many([TOP_BOOKS_KEY, BOOKS_TOTAL_KEY]))
@@ -0,0 +1,446 @@
+"""
+Нагрузочное тестирование сайта библиотеки (команда manage.py loadtest).
+
+Виртуальные пользователи работают параллельно, каждый в своём потоке,
+и выбирают следующее действие случайно по весам из своей смеси:
+
+    посетитель (аноним) — browse, search, detail;
+    читатель            — browse, search, detail, add_to_cart;
+    сотрудник           — issue (выдача корзины), return_book (возврат),
+                          borrowing_users (список читателей с книгами).
+
+Запросы идут либо в приложение WSGI этого же процесса (по умолчанию),
+либо по HTTP на запущенный сервер (--base-url). Тестовые пользователи,
+их сессии и корзины создаются напрямую в базе, поэтому сервер должен
+работать с той же базой. По каждому имени URL считаются число запросов,
+пропускная способность, p50/p95/p99 времени ответа и ошибки (статус
+не ниже 400). Итоги можно сохранить в lib_app/loadtest_baselines
+и сравнивать с ними следующие прогоны.
+"""
+
+import io
+import json
+import os
+import platform
+import random
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import date
+from http.cookies import SimpleCookie
+from pathlib import Path
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+import django
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from lib_app import catalogue_cache, facets, leaderboard
+from lib_app.models import Book, BorrowedBook, Cart
+from user_app.models import CustomUser
+
+EMAIL_PREFIX = "loadtest-"
+HOST = "localhost"
+BASELINE_DIR = Path(__file__).resolve().parent / "loadtest_baselines"
+
+VISITOR_MIX = {"browse": 50, "search": 30, "detail": 20}
+PATRON_MIX = {"browse": 40, "search": 25, "detail": 25, "add_to_cart": 10}
+STAFF_MIX = {"issue": 30, "return_book": 30, "borrowing_users": 40}
+
+# Cookie сообщений не храним: перенаправления не открываются,
+# и непрочитанные сообщения копились бы в каждом запросе
+SKIPPED_COOKIES = {"messages"}
+
+
+def percentile(timings, q):
+    """Перцентиль q (0..1) по отсортированному списку"""
+    if not timings:
+        return 0
+    return timings[min(int(len(timings) * q), len(timings) - 1)]
+
+
+def parse_mix(value, default):
+    """Смесь действий из строки вида "browse=40,search=30" поверх default"""
+    mix = dict(default)
+    if not value:
+        return mix
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in default:
+            raise ValueError(f"Неизвестное действие: {name}")
+        mix[name] = int(weight)
+    if not any(mix.values()):
+        raise ValueError("Все веса смеси нулевые.")
+    return mix
+
+
+def summarize(samples, duration):
+    """{имя URL: {count, rps, p50, p95, p99, errors}} по списку (имя, мс, ok)"""
+    grouped = {}
+    for url_name, elapsed, ok in samples:
+        timings, errors = grouped.setdefault(url_name, ([], [0]))
+        timings.append(elapsed)
+        errors[0] += not ok
+    results = {}
+    for url_name, (timings, errors) in sorted(grouped.items()):
+        timings.sort()
+        results[url_name] = {
+            "count": len(timings),
+            "rps": round(len(timings) / duration, 2),
+            "p50": round(percentile(timings, 0.5), 2),
+            "p95": round(percentile(timings, 0.95), 2),
+            "p99": round(percentile(timings, 0.99), 2),
+            "errors": errors[0],
+        }
+    return results
+
+
+def baseline_path(name):
+    return BASELINE_DIR / f"{name}.json"
+
+
+def save_baseline(name, results, options):
+    BASELINE_DIR.mkdir(exist_ok=True)
+    data = {
+        "meta": {
+            "date": date.today().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "options": options,
+        },
+        "results": results,
+    }
+    path = baseline_path(name)
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n")
+    return path
+
+
+def load_baseline(name):
+    return json.loads(baseline_path(name).read_text())["results"]
+
+
+def compare(results, baseline):
+    """Изменение p95 и пропускной способности относительно базовых итогов, %"""
+
+    def change(new, old):
+        return round((new - old) / old * 100, 1) if old else None
+
+    return {
+        url_name: {
+            "p95": change(result["p95"], baseline[url_name]["p95"]),
+            "rps": change(result["rps"], baseline[url_name]["rps"]),
+        }
+        for url_name, result in results.items()
+        if url_name in baseline
+    }
+
+
+class WSGITransport:
+    """Запросы в приложение config.wsgi этого же процесса"""
+
+    def __init__(self):
+        from config.wsgi import application
+
+        self.application = application
+
+    def request(self, method, path, query="", body=b"", headers=None):
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": path,
+            "QUERY_STRING": query,
+            "HTTP_HOST": HOST,
+            "wsgi.input": io.BytesIO(body),
+            "CONTENT_LENGTH": str(len(body)),
+        }
+        for name, value in (headers or {}).items():
+            key = name.upper().replace("-", "_")
+            if key != "CONTENT_TYPE":
+                key = f"HTTP_{key}"
+            environ[key] = value
+        setup_testing_defaults(environ)
+        status = []
+
+        def start_response(line, response_headers, exc_info=None):
+            status.append((int(line.split()[0]), response_headers))
+
+        result = self.application(environ, start_response)
+        try:
+            b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return status[0]
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPTransport:
+    """Запросы по HTTP на запущенный сервер"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(NoRedirect)
+
+    def request(self, method, path, query="", body=b"", headers=None):
+        url = self.base_url + path + (f"?{query}" if query else "")
+        request = urllib.request.Request(
+            url, data=body if method == "POST" else None, method=method
+        )
+        for name, value in (headers or {}).items():
+            request.add_header(name, value)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status, response.headers.items()
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, error.headers.items()
+
+
+class Workload:
+    """Общие данные прогона: книги, слова для поиска, тестовые пользователи"""
+
+    def __init__(self):
+        self.book_ids = list(Book.objects.values_list("pk", flat=True))
+        if not self.book_ids:
+            raise ValueError("Каталог пуст.")
+        titles = Book.objects.values_list("title", flat=True)[:2000]
+        self.words = sorted(
+            {word for title in titles for word in title.split() if len(word) > 3}
+        ) or ["книга"]
+        self.initials = sorted(
+            {
+                name[:1].upper()
+                for name in Book.objects.values_list("author_name", flat=True)[:2000]
+                if name
+            }
+        )
+        # Счётчики выдач доступных книг: выданные при прогоне восстановим
+        self.snapshot = dict(
+            Book.objects.filter(available=True).values_list("pk", "times_of_issued")
+        )
+        self.session_keys = []
+
+    def create_user(self, role, n, **extra_fields):
+        return CustomUser.objects.create_user(
+            email=f"{EMAIL_PREFIX}{role}-{n}@example.com",
+            full_name=f"Нагрузка {role} {n}",
+            date_of_birth=date(2000, 1, 1),
+            **extra_fields,
+        )
+
+    def login(self, user):
+        """Ключ новой сессии пользователя"""
+        client = Client()
+        client.force_login(user)
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.session_keys.append(session_key)
+        return session_key
+
+    def available_book_ids(self, rng, count):
+        return list(
+            Book.objects.filter(
+                pk__in=rng.sample(self.book_ids, min(count * 4, len(self.book_ids))),
+                available=True,
+            ).values_list("pk", flat=True)[:count]
+        )
+
+    def cleanup(self):
+        issued = set(
+            BorrowedBook.objects.filter(
+                user__email__startswith=EMAIL_PREFIX
+            ).values_list("book_id", flat=True)
+        ) & set(self.snapshot)
+        Session.objects.filter(session_key__in=self.session_keys).delete()
+        CustomUser.objects.filter(email__startswith=EMAIL_PREFIX).delete()
+        Book.objects.bulk_update(
+            [
+                Book(pk=pk, times_of_issued=self.snapshot[pk], available=True)
+                for pk in issued
+            ],
+            ["times_of_issued", "available"],
+            batch_size=500,
+        )
+        # bulk_update обходит сигналы: сбрасываем кэши каталога явно
+        leaderboard.invalidate()
+        facets.invalidate()
+        catalogue_cache.bump_version()
+
+
+class VirtualUser:
+    """Пользователь со своими cookie, смесью действий и журналом запросов"""
+
+    def __init__(self, workload, transport, mix, seed, user=None):
+        self.workload = workload
+        self.transport = transport
+        self.mix = mix
+        self.rng = random.Random(seed)
+        self.user = user
+        self.samples = []
+        # Секрет CSRF из 32 символов Django принимает и в cookie, и в заголовке
+        self.cookies = {settings.CSRF_COOKIE_NAME: secrets.token_hex(16)}
+        if user is not None:
+            self.cookies[settings.SESSION_COOKIE_NAME] = workload.login(user)
+
+    def run(self, deadline, think_time):
+        actions, weights = zip(*((name, w) for name, w in self.mix.items() if w))
+        try:
+            while time.monotonic() < deadline:
+                getattr(self, self.rng.choices(actions, weights)[0])()
+                if think_time:
+                    time.sleep(self.rng.uniform(0, 2 * think_time))
+        finally:
+            connections.close_all()
+
+    def request(self, method, url_name, args=(), params=None):
+        path = reverse(url_name, args=args)
+        headers = {"Cookie": "; ".join(f"{k}={v}" for k, v in self.cookies.items())}
+        query, body = "", b""
+        if method == "POST":
+            headers["X-CSRFToken"] = self.cookies[settings.CSRF_COOKIE_NAME]
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            body = urlencode(params or {}).encode()
+        elif params:
+            query = urlencode(params)
+        started = time.perf_counter()
+        try:
+            status, response_headers = self.transport.request(
+                method, path, query, body, headers
+            )
+        except OSError:
+            status, response_headers = 599, []
+        self.samples.append(
+            (url_name, (time.perf_counter() - started) * 1000, status < 400)
+        )
+        for name, value in response_headers:
+            if name.lower() == "set-cookie":
+                for morsel in SimpleCookie(value).values():
+                    if morsel.key not in SKIPPED_COOKIES:
+                        self.cookies[morsel.key] = morsel.value
+        return status
+
+
+class Visitor(VirtualUser):
+    def browse(self):
+        params = {}
+        if self.workload.initials and self.rng.random() < 0.5:
+            params["initial"] = self.rng.choice(self.workload.initials)
+        self.request("GET", "book_list", params=params)
+
+    def search(self):
+        self.request(
+            "GET", "book_list", params={"q": self.rng.choice(self.workload.words)}
+        )
+
+    def detail(self):
+        self.request(
+            "GET", "book_detail", args=(self.rng.choice(self.workload.book_ids),)
+        )
+
+
+class Patron(Visitor):
+    cart_limit = 10
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cart = []
+
+    def add_to_cart(self):
+        book_id = self.rng.choice(self.workload.book_ids)
+        self.request("POST", "add_to_cart", args=(book_id,))
+        self.cart.append(book_id)
+        # Корзина не растёт бесконечно: лишнее убирается без замера.
+        # Через менеджер связи, чтобы сигнал m2m_changed сбросил кэш корзины
+        if len(self.cart) > self.cart_limit:
+            book_id = self.cart.pop(0)
+            cart = Cart.objects.filter(user=self.user).first()
+            if cart is not None:
+                cart.books.remove(book_id)
+
+
+class Staff(VirtualUser):
+    """Сотрудник за стойкой выдачи; у каждого свой читатель для выдач"""
+
+    cart_size = 3
+
+    def __init__(self, *args, reader, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reader = reader
+        self.cart, _ = Cart.objects.get_or_create(user=reader)
+
+    def issue(self):
+        # Корзина читателя собирается без замера, как если бы он сделал это сам
+        self.cart.books.add(*self.workload.available_book_ids(self.rng, self.cart_size))
+        self.request("POST", "issue_books_from_cart", args=(self.reader.pk,))
+
+    def return_book(self):
+        loan_id = (
+            BorrowedBook.objects.filter(user=self.reader, returned=False)
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if loan_id is None:
+            return self.issue()
+        self.request("POST", "return_book", args=(loan_id,))
+
+    def borrowing_users(self):
+        self.request("GET", "borrowing_users_list")
+
+
+def run(transport, counts, mixes, duration, think_time=0, seed=None):
+    """
+    Прогон нагрузки. counts и mixes — по ролям visitor, patron, staff.
+    Возвращает итоги summarize() и фактическую длительность.
+    """
+    rng = random.Random(seed)
+    workload = Workload()
+    users = []
+    try:
+        for _ in range(counts["visitor"]):
+            users.append(Visitor(workload, transport, mixes["visitor"], rng.random()))
+        for n in range(counts["patron"]):
+            patron = workload.create_user("patron", n)
+            users.append(
+                Patron(workload, transport, mixes["patron"], rng.random(), patron)
+            )
+        for n in range(counts["staff"]):
+            staff = workload.create_user("staff", n, is_staff=True)
+            users.append(
+                Staff(
+                    workload,
+                    transport,
+                    mixes["staff"],
+                    rng.random(),
+                    staff,
+                    reader=workload.create_user("desk", n),
+                )
+            )
+
+        started = time.monotonic()
+        deadline = started + duration
+        threads = [
+            threading.Thread(target=user.run, args=(deadline, think_time))
+            for user in users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        workload.cleanup()
+
+    samples = [sample for user in users for sample in user.samples]
+    return summarize(samples, elapsed), elapsed
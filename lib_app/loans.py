@@ -0,0 +1,120 @@
+"""
+Сроки возврата и просроченные выдачи.
+
+Срок возврата (BorrowedBook.due_at) ставится при выдаче политикой выдачи —
+классом из настройки LIBRARY_LOAN_POLICY (по умолчанию LoanPolicy).
+LoanPolicy даёт всем LIBRARY_LOAN_PERIOD_DAYS дней (по умолчанию 14);
+другой срок (по читателю, по книге) задаётся подклассом с get_period().
+
+Просроченная выдача — открытая выдача со сроком в прошлом. Такие выдачи
+читаются по частичному индексу borrowed_open_by_due_idx (due_at, id только
+открытых выдач): отчёт персонала и ночная команда scan_overdue_loans
+идут по нему курсором и не просматривают историю выдач.
+
+Настройки:
+    LIBRARY_LOAN_POLICY         — путь к классу политики выдачи;
+    LIBRARY_LOAN_PERIOD_DAYS    — срок выдачи в днях для LoanPolicy;
+    LIBRARY_OVERDUE_REMIND_DAYS — через сколько дней повторять напоминание.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from lib_app.models import BorrowedBook
+from lib_app.pagination import KeysetPaginator
+
+# Ключ курсора по частичному индексу borrowed_open_by_due_idx
+OVERDUE_KEYSET = ("due_at", "pk")
+
+
+class LoanPolicy:
+    """Одинаковый срок выдачи для всех читателей и книг"""
+
+    def get_period(self, user, book):
+        return timedelta(days=getattr(settings, "LIBRARY_LOAN_PERIOD_DAYS", 14))
+
+    def get_due_at(self, user, book, borrowed_at):
+        return borrowed_at + self.get_period(user, book)
+
+
+def get_loan_policy():
+    policy_path = getattr(settings, "LIBRARY_LOAN_POLICY", None)
+    if policy_path:
+        return import_string(policy_path)()
+    return LoanPolicy()
+
+
+def get_remind_interval():
+    return timedelta(days=getattr(settings, "LIBRARY_OVERDUE_REMIND_DAYS", 7))
+
+
+def overdue_loans(now=None):
+    """Открытые выдачи со сроком до now"""
+    return BorrowedBook.objects.filter(returned=False, due_at__lt=now or timezone.now())
+
+
+def due_for_reminder(now=None):
+    """Просроченные выдачи, по которым пора напомнить (или ещё не напоминали)"""
+    now = now or timezone.now()
+    return overdue_loans(now).exclude(reminded_at__gt=now - get_remind_interval())
+
+
+def iter_batches(queryset, batch_size):
+    """
+    Пачки строк queryset по курсору (due_at, id): каждый запрос начинается
+    в индексе с места, где закончился предыдущий, поэтому стоимость пачки
+    не растёт к концу списка.
+    """
+    paginator = KeysetPaginator(queryset, OVERDUE_KEYSET, batch_size)
+    after = None
+    while True:
+        rows = list(paginator.page_queryset(after_values=after))
+        batch = rows[:batch_size]
+        if batch:
+            yield batch
+        if len(rows) <= batch_size:
+            return
+        after = [batch[-1].due_at, batch[-1].pk]
+
+
+def reminder_message(user, loans, now):
+    lines = [
+        f"«{loan.book.title}» — срок возврата {timezone.localtime(loan.due_at):%d.%m.%Y}"
+        f" (просрочено дней: {(now - loan.due_at).days})"
+        for loan in loans
+    ]
+    body = (
+        f"Здравствуйте, {user.full_name}!\n\n"
+        "Истёк срок возврата книг:\n" + "\n".join(lines) + "\n\n"
+        "Пожалуйста, верните их в библиотеку."
+    )
+    return ("Напоминание о возврате книг", body, None, [user.email])
+
+
+def remind_batch(loans, now=None):
+    """
+    Отправляет по одному письму на читателя за пачку (одно соединение
+    с почтовым сервером), затем отмечает reminded_at одним UPDATE.
+    Возвращает число писем.
+    """
+    now = now or timezone.now()
+    by_user = {}
+    for loan in loans:
+        by_user.setdefault(loan.user_id, (loan.user, []))[1].append(loan)
+    # Письма отправляются вне транзакции: иначе на время обмена с почтовым
+    # сервером была бы занята запись в базу и стояли бы выдача и возврат.
+    # Если отправка упадёт, отметок не будет и пачка повторится
+    send_mass_mail(
+        [
+            reminder_message(user, user_loans, now)
+            for user, user_loans in by_user.values()
+        ]
+    )
+    BorrowedBook.objects.filter(pk__in=[loan.pk for loan in loans]).update(
+        reminded_at=now
+    )
+    return len(by_user)
@@ -0,0 +1,180 @@
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from lib_app.loadtest import percentile
+from lib_app.models import Book
+from user_app.models import CustomUser
+
+BENCH_EMAIL = "bench-asgi@example.com"
+HOST = "localhost"
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает страницы каталога под WSGI (config.wsgi, синхронные "
+        "представления, пул потоков) и под ASGI (config.asgi, асинхронные "
+        "представления, одна петля asyncio) при заданной конкурентности. "
+        "Приложения вызываются в этом же процессе, без HTTP-сервера: "
+        "сравнивается код Django и представлений. С --login запросы идут "
+        "от имени читателя и не попадают в кэш страниц анонимов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--paths",
+            help="Пути через запятую (по умолчанию главная, списки книг "
+            "и авторов, карточка первой книги)",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Запросов на каждый путь"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=16,
+            help="Одновременных запросов (по умолчанию 16)",
+        )
+        parser.add_argument(
+            "--login", action="store_true", help="Запросы от имени читателя"
+        )
+
+    def handle(self, *args, **options):
+        from config.asgi import application as asgi_application
+        from config.wsgi import application as wsgi_application
+
+        paths = options["paths"]
+        if paths:
+            paths = paths.split(",")
+        else:
+            book = Book.objects.order_by("pk").first()
+            if book is None:
+                raise CommandError("Каталог пуст.")
+            paths = ["/", "/books/", "/authors/", f"/book/{book.pk}/"]
+
+        cookie = self.login() if options["login"] else ""
+        self.stdout.write(
+            f"{'сервер':<6} {'путь':<24} {'запросов/с':>11} {'p50, мс':>8} "
+            f"{'p95, мс':>8} {'p99, мс':>8} {'ошибок':>7}"
+        )
+        try:
+            for path in paths:
+                self.report(
+                    "wsgi",
+                    path,
+                    options,
+                    self.run_wsgi(wsgi_application, path, cookie, options),
+                )
+                self.report(
+                    "asgi",
+                    path,
+                    options,
+                    asyncio.run(self.run_asgi(asgi_application, path, cookie, options)),
+                )
+        finally:
+            if cookie:
+                SessionStore(session_key=self.session_key).delete()
+                CustomUser.objects.filter(email=BENCH_EMAIL).delete()
+
+    def login(self):
+        """Сессия тестового читателя; возвращает значение заголовка Cookie"""
+        user, _ = CustomUser.objects.get_or_create(
+            email=BENCH_EMAIL,
+            defaults={"full_name": "Бенчмарк", "date_of_birth": date(2000, 1, 1)},
+        )
+        client = Client()
+        client.force_login(user)
+        self.session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        return f"{settings.SESSION_COOKIE_NAME}={self.session_key}"
+
+    def report(self, server, path, options, result):
+        timings, errors, elapsed = result
+        timings.sort()
+        self.stdout.write(
+            f"{server:<6} {path:<24} {len(timings) / elapsed:>11.1f} "
+            f"{percentile(timings, 0.5):>8.1f} {percentile(timings, 0.95):>8.1f} "
+            f"{percentile(timings, 0.99):>8.1f} {errors:>7}"
+        )
+
+    def run_wsgi(self, application, path, cookie, options):
+        def request(_):
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": path,
+                "HTTP_HOST": HOST,
+                "wsgi.input": io.BytesIO(),
+            }
+            if cookie:
+                environ["HTTP_COOKIE"] = cookie
+            setup_testing_defaults(environ)
+            status = []
+            started = time.perf_counter()
+            body = application(environ, lambda s, headers: status.append(s))
+            try:
+                b"".join(body)
+            finally:
+                body.close()
+            return (time.perf_counter() - started) * 1000, status[0].startswith("200")
+
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            request(None)  # прогрев кэшей и соединений
+            started = time.perf_counter()
+            results = list(pool.map(request, range(options["requests"])))
+            elapsed = time.perf_counter() - started
+        timings = [timing for timing, ok in results if ok]
+        return timings, len(results) - len(timings), elapsed
+
+    async def run_asgi(self, application, path, cookie, options):
+        headers = [(b"host", HOST.encode())]
+        if cookie:
+            headers.append((b"cookie", cookie.encode()))
+        semaphore = asyncio.Semaphore(options["concurrency"])
+
+        async def request():
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "GET",
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": b"",
+                "root_path": "",
+                "headers": headers,
+                "client": ("127.0.0.1", 0),
+                "server": (HOST, 80),
+            }
+            body_sent = asyncio.Event()
+            status = []
+
+            async def receive():
+                if body_sent.is_set():
+                    # Клиент не отключается: ждём, пока Django отменит ожидание
+                    await asyncio.Future()
+                body_sent.set()
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+
+            async with semaphore:
+                started = time.perf_counter()
+                await application(scope, receive, send)
+                return (time.perf_counter() - started) * 1000, status[0] == 200
+
+        await request()  # прогрев кэшей и соединений
+        started = time.perf_counter()
+        results = await asyncio.gather(*(request() for _ in range(options["requests"])))
+        elapsed = time.perf_counter() - started
+        timings = [timing for timing, ok in results if ok]
+        return timings, len(results) - len(timings), elapsed
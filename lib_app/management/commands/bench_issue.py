@@ -0,0 +1,77 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from lib_app.models import Book, Cart
+from lib_app.services import issue_books_from_cart
+from user_app.models import CustomUser
+
+
+class Rollback(Exception):
+    """Откат тестовых данных бенчмарка"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк выдачи книг из корзины для разных размеров корзины. "
+        "Все тестовые данные создаются в транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="1,5,10,20,30,40,50",
+            help="Размеры корзины через запятую (по умолчанию 1,5,10,20,30,40,50)",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Повторов на каждый размер"
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        repeat = options["repeat"]
+
+        self.stdout.write(
+            f"{'книг':>6} {'запросов':>9} {'мс (медиана)':>13} {'мс (макс)':>10}"
+        )
+        try:
+            with transaction.atomic():
+                user = CustomUser.objects.create_user(
+                    email="bench-issue@example.com",
+                    full_name="Бенчмарк",
+                    date_of_birth=date(2000, 1, 1),
+                )
+                cart = Cart.objects.create(user=user)
+                for size in sizes:
+                    self.bench_size(cart, size, repeat)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def bench_size(self, cart, size, repeat):
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            books = Book.objects.bulk_create(
+                Book(title=f"Бенчмарк {i}") for i in range(size)
+            )
+            cart.books.add(*books)
+
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                result = issue_books_from_cart(cart)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = len(ctx.captured_queries)
+            if len(result.issued) != size:
+                raise CommandError(
+                    f"Выдано книг: {len(result.issued)}, ожидалось {size}."
+                )
+
+        timings.sort()
+        median = timings[len(timings) // 2]
+        self.stdout.write(
+            f"{size:>6} {queries:>9} {median:>13.2f} {timings[-1]:>10.2f}"
+        )
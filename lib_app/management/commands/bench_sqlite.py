@@ -0,0 +1,195 @@
+import multiprocessing
+import random
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+
+from lib_app import catalogue_cache, facets, leaderboard
+from lib_app.models import Book, BorrowedBook, Cart
+from lib_app.services import issue_books_from_cart, return_books
+from lib_app.sqlite import read_pragmas
+from user_app.models import CustomUser
+
+BENCH_EMAIL_PREFIX = "bench-sqlite-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк конкурентного доступа к SQLite: процессы-читатели запрашивают "
+        "страницы каталога, пока процессы-писатели выдают книги из корзин "
+        "и возвращают их (как IssueBooksFromCartView и BatchReturnBooksView). "
+        "Сравниваются профили соединений из LIBRARY_SQLITE_PROFILES. "
+        "После прогона тестовые читатели удаляются, а счётчики выдач книг "
+        "восстанавливаются; режим журнала сохраняется в файле базы, "
+        "поэтому запускайте бенчмарк на копии базы. Нужен запуск процессов "
+        "через fork (Linux, macOS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profiles",
+            default="default,production",
+            help="Профили через запятую (по умолчанию default,production)",
+        )
+        parser.add_argument(
+            "--readers", type=int, default=4, help="Процессов чтения (по умолчанию 4)"
+        )
+        parser.add_argument(
+            "--writers", type=int, default=2, help="Процессов записи (по умолчанию 2)"
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=5,
+            help="Длительность прогона каждого профиля, секунд (по умолчанию 5)",
+        )
+        parser.add_argument(
+            "--cart-size", type=int, default=5, help="Книг в корзине при выдаче"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Бенчмарк рассчитан на SQLite.")
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise CommandError("Бенчмарку нужен запуск процессов через fork.")
+        profiles = options["profiles"].split(",")
+        unknown = set(profiles) - set(settings.LIBRARY_SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f"Неизвестные профили: {', '.join(sorted(unknown))}")
+
+        # Выдаются только доступные книги; их счётчики выдач восстановим в конце
+        self.snapshot = dict(
+            Book.objects.filter(available=True).values_list("pk", "times_of_issued")
+        )
+        self.book_ids = list(self.snapshot)
+        if len(self.book_ids) < options["cart_size"]:
+            raise CommandError("В каталоге слишком мало доступных книг для бенчмарка.")
+        self.initials = list(
+            Book.objects.exclude(author_name="")
+            .values_list("author_name", flat=True)
+            .distinct()[:200]
+        ) or [""]
+        touched = set()
+
+        self.stdout.write(
+            f"{'профиль':<12} {'журнал':<7} {'чтений/с':>9} {'p95 чтения, мс':>15} "
+            f"{'книг выдано/с':>14} {'блокировок':>11}"
+        )
+        try:
+            for profile in profiles:
+                touched |= self.run_profile(profile, options)
+        finally:
+            # Соединения рабочего профиля вернут его режим журнала
+            connections.close_all()
+            self.cleanup(touched)
+
+    def cleanup(self, touched):
+        CustomUser.objects.filter(email__startswith=BENCH_EMAIL_PREFIX).delete()
+        Book.objects.bulk_update(
+            [
+                Book(pk=pk, times_of_issued=self.snapshot[pk], available=True)
+                for pk in touched
+            ],
+            ["times_of_issued", "available"],
+            batch_size=500,
+        )
+        # bulk_update обходит сигналы: сбрасываем кэши каталога явно
+        leaderboard.invalidate()
+        facets.invalidate()
+        catalogue_cache.bump_version()
+
+    def run_profile(self, profile, options):
+        """Прогон одного профиля; возвращает id книг, которые выдавались"""
+        context = multiprocessing.get_context("fork")
+        stop = context.Event()
+        results = context.Queue()
+        # Новое соединение откроется уже с PRAGMA профиля
+        connections.close_all()
+        with override_settings(LIBRARY_SQLITE_PROFILE=profile):
+            journal = read_pragmas(connection, ["journal_mode"])["journal_mode"]
+            # Дочерние процессы не должны унаследовать открытые соединения
+            connections.close_all()
+            workers = [
+                context.Process(target=self.reader, args=(stop, results))
+                for _ in range(options["readers"])
+            ]
+            workers += [
+                context.Process(
+                    target=self.writer,
+                    args=(profile, n, options["cart_size"], stop, results),
+                )
+                for n in range(options["writers"])
+            ]
+            for worker in workers:
+                worker.start()
+            time.sleep(options["duration"])
+            stop.set()
+            reports = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+
+        timings = sorted(t for report in reports for t in report["timings"])
+        issued = sum(report["issued"] for report in reports)
+        locked = sum(report["locked"] for report in reports)
+        duration = options["duration"]
+        p95 = timings[int(len(timings) * 0.95)] if timings else 0
+        self.stdout.write(
+            f"{profile:<12} {journal:<7} {len(timings) / duration:>9.0f} "
+            f"{p95:>15.2f} {issued / duration:>14.1f} {locked:>11}"
+        )
+        return {pk for report in reports for pk in report["touched"]}
+
+    def report(self, results, **values):
+        connection.close()
+        report = {"timings": [], "issued": 0, "locked": 0, "touched": set()}
+        report.update(values)
+        results.put(report)
+
+    def reader(self, stop, results):
+        """Первая страница каталога с произвольного автора (как BookListView)"""
+        timings = []
+        locked = 0
+        while not stop.is_set():
+            initial = random.choice(self.initials)
+            started = time.perf_counter()
+            try:
+                list(
+                    Book.objects.select_related("author")
+                    .filter(author_name__gte=initial)
+                    .order_by("author_name", "title", "pk")[:10]
+                )
+            except OperationalError as error:
+                if "locked" not in str(error):
+                    raise
+                locked += 1
+                continue
+            timings.append((time.perf_counter() - started) * 1000)
+        self.report(results, timings=timings, locked=locked)
+
+    def writer(self, profile, n, cart_size, stop, results):
+        """Цикл: книги в корзину, выдача корзины, возврат выданного"""
+        user = CustomUser.objects.create_user(
+            email=f"{BENCH_EMAIL_PREFIX}{profile}-{n}@example.com",
+            full_name="Бенчмарк",
+            date_of_birth=date(2000, 1, 1),
+        )
+        cart = Cart.objects.create(user=user)
+        issued = locked = 0
+        touched = set()
+        while not stop.is_set():
+            book_ids = random.sample(self.book_ids, cart_size)
+            touched.update(book_ids)
+            try:
+                cart.books.add(*book_ids)
+                issued += len(issue_books_from_cart(cart).issued)
+                loans = BorrowedBook.objects.filter(user=user, returned=False)
+                return_books(loan_ids=list(loans.values_list("pk", flat=True)))
+            except OperationalError as error:
+                if "locked" not in str(error):
+                    raise
+                locked += 1
+        self.report(results, issued=issued, locked=locked, touched=touched)
@@ -0,0 +1,62 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lib_app import exporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает книги, историю выдач или читателей в CSV или JSONL "
+        "потоком: строки читаются из базы порциями, память не зависит "
+        "от объёма. Без --output данные пишутся в стандартный вывод."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=sorted(exporter.EXPORTS))
+        parser.add_argument(
+            "--format",
+            choices=exporter.FORMATS,
+            default="csv",
+            help="Формат (по умолчанию csv)",
+        )
+        parser.add_argument("--gzip", action="store_true", help="Сжать gzip")
+        parser.add_argument("-o", "--output", help="Файл для выгрузки")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=exporter.DEFAULT_BATCH_SIZE,
+            help=f"Строк за один запрос к базе (по умолчанию "
+            f"{exporter.DEFAULT_BATCH_SIZE})",
+        )
+
+    def handle(self, *args, **options):
+        chunks = exporter.stream_export(
+            options["name"],
+            options["format"],
+            options["gzip"],
+            options["batch_size"],
+        )
+        started = time.perf_counter()
+        if options["output"]:
+            try:
+                output = open(options["output"], "wb")
+            except OSError as error:
+                raise CommandError(error)
+        else:
+            output = sys.stdout.buffer
+        size = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if options["output"]:
+                output.close()
+            else:
+                output.flush()
+        self.stderr.write(
+            f"Выгружено {size / 1024 / 1024:.1f} МБ "
+            f"за {time.perf_counter() - started:.1f} с"
+        )
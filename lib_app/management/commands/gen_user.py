@@ -1,7 +1,424 @@
-from django.core.management.base import BaseCommand
-from lib_app.models import User
+import itertools
 import random
+from array import array
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from lib_app import catalogue_cache, facets, keywords, leaderboard
+from lib_app.isbn import isbn13_check_digit
+from lib_app.loans import get_loan_policy
+from lib_app.models import Author, Book, BorrowedBook, Cart, Publisher, search_key
+from user_app.models import CustomUser
+
+FIRST_NAMES = (
+    "Александр Алексей Анна Борис Вера Виктор Галина Дмитрий Евгений Екатерина "
+    "Елена Иван Игорь Ирина Кирилл Константин Лариса Лев Людмила Максим Марина "
+    "Мария Михаил Надежда Наталья Николай Ольга Павел Пётр Роман Светлана "
+    "Сергей Софья Татьяна Фёдор Юлия Юрий Ярослав"
+).split()
+LAST_NAMES = (
+    "Иванов Смирнов Кузнецов Попов Васильев Петров Соколов Михайлов Новиков "
+    "Фёдоров Морозов Волков Алексеев Лебедев Семёнов Егоров Павлов Козлов "
+    "Степанов Николаев Орлов Андреев Макаров Никитин Захаров Зайцев Соловьёв "
+    "Борисов Яковлев Григорьев Романов Воробьёв Сергеев Кузьмин Фролов Беляев"
+).split()
+TITLE_WORDS = (
+    "тайна дорога дом сад море ночь город война мир зима лето река небо огонь "
+    "камень ветер память голос остров сердце путь тень свет звезда берег "
+    "письмо время сон поле лес гора"
+).split()
+TITLE_ADJECTIVES = (
+    "тихий долгий последний северный белый старый новый далёкий золотой "
+    "зелёный первый чужой забытый тёмный ясный"
+).split()
+KEYWORDS = (
+    "роман повесть рассказы поэзия история философия фантастика детектив "
+    "приключения классика биография мемуары наука психология экономика право "
+    "искусство музыка живопись архитектура путешествия природа техника "
+    "программирование математика физика химия биология медицина педагогика "
+    "детская литература драма комедия сказки мифы религия политика война "
+    "любовь семья спорт кулинария"
+).split()
+RUBRICS = (
+    "Художественная литература",
+    "Научно-популярная литература",
+    "Учебная литература",
+    "Справочные издания",
+    "Детская литература",
+    "Публицистика",
+)
+PUBLISHER_WORDS = (
+    "Книга Слово Наука Мир Просвещение Азбука Эксмо Вече Феникс Дрофа Альфа "
+    "Литера Речь Глобус Лань Пионер Логос Гранд"
+).split()
+
+
+def zipf_cum_weights(n, s):
+    """Накопленные веса закона Ципфа для рангов 1..n с показателем s"""
+    return list(itertools.accumulate(1 / rank**s for rank in range(1, n + 1)))
+
+
+def chunks(total, size):
+    """Границы пачек: (начало, конец) для range(total)"""
+    for start in range(0, total, size):
+        yield start, min(start + size, total)
+
+
+@contextmanager
+def explicit_dates(model, *names):
+    """На время блока auto_now_add не перезаписывает заданные даты"""
+    fields = [model._meta.get_field(name) for name in names]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
 
 
 class Command(BaseCommand):
-    help = 'Генерация пользователей библиотеки'
\ No newline at end of file
+    help = (
+        "Генерация тестовых данных библиотеки для нагрузочных испытаний: "
+        "читатели, сотрудники, авторы, издательства, книги, выдачи и корзины. "
+        "Данные детерминированы зерном (--seed). Популярность книг при выдаче, "
+        "число книг у автора и активность читателей подчиняются закону Ципфа. "
+        "Строки вставляются пачками через bulk_create; пароль хэшируется "
+        "один раз на всех читателей (по умолчанию — непригодный для входа)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000, help="Читателей")
+        parser.add_argument("--staff", type=int, default=5, help="Сотрудников")
+        parser.add_argument("--authors", type=int, default=2000, help="Авторов")
+        parser.add_argument("--publishers", type=int, default=200, help="Издательств")
+        parser.add_argument("--books", type=int, default=50000, help="Книг")
+        parser.add_argument(
+            "--loans", type=int, default=200000, help="Записей о выдачах"
+        )
+        parser.add_argument(
+            "--carts",
+            type=float,
+            default=0.02,
+            help="Доля читателей с непустой корзиной (по умолчанию 0.02)",
+        )
+        parser.add_argument(
+            "--copies",
+            type=float,
+            default=0.2,
+            help="Доля книг — экземпляров предыдущего издания с тем же ISBN",
+        )
+        parser.add_argument(
+            "--history-days",
+            type=int,
+            default=730,
+            help="За сколько дней назад распределены выдачи",
+        )
+        parser.add_argument(
+            "--zipf",
+            type=float,
+            default=1.1,
+            help="Показатель закона Ципфа для популярности книг (по умолчанию 1.1)",
+        )
+        parser.add_argument("--seed", type=int, default=1, help="Зерно генератора")
+        parser.add_argument(
+            "--password",
+            help="Пароль всех сгенерированных пользователей (по умолчанию вход "
+            "невозможен)",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=5000, help="Строк в одной вставке"
+        )
+
+    def handle(self, *args, **options):
+        if options["books"] < 1 or options["users"] < 1:
+            raise CommandError("Нужна хотя бы одна книга и один читатель.")
+        self.rng = random.Random(options["seed"])
+        self.options = options
+        self.batch_size = options["batch_size"]
+        self.now = timezone.now()
+        self.email_domain = f"seed{options['seed']}.example.org"
+        if CustomUser.objects.filter(email__endswith=f"@{self.email_domain}").exists():
+            raise CommandError(
+                f"Данные с зерном {options['seed']} уже сгенерированы "
+                f"(адреса @{self.email_domain})."
+            )
+
+        self.plan_loans()
+        author_ids = self.create_authors()
+        publisher_ids = self.create_publishers()
+        book_ids = self.create_books(author_ids, publisher_ids)
+        user_ids = self.create_users()
+        self.create_loans(book_ids, user_ids)
+        self.create_carts(book_ids, user_ids)
+
+        # bulk_create обходит сигналы: сбрасываем кэши каталога явно
+        leaderboard.invalidate()
+        facets.invalidate()
+        keywords.invalidate_cloud()
+        catalogue_cache.bump_version()
+        self.stdout.write(self.style.SUCCESS("Данные сгенерированы."))
+
+    def progress(self, label, done, total):
+        self.stdout.write(f"{label}: {done} из {total}")
+
+    def plan_loans(self):
+        """
+        Выдачи планируются до вставки: по ним считаются счётчики книг
+        и читателей, а книги с открытой выдачей вставляются недоступными.
+        Книги и читатели здесь — номера по порядку вставки.
+        """
+        n_books, n_users = self.options["books"], self.options["users"]
+        history = self.options["history_days"]
+        loan_days = 30
+        # Ранги популярности перемешаны, чтобы популярные книги
+        # не были сплошь первыми по id
+        book_order = list(range(n_books))
+        self.rng.shuffle(book_order)
+        user_order = list(range(n_users))
+        self.rng.shuffle(user_order)
+        book_weights = zipf_cum_weights(n_books, self.options["zipf"])
+        # Активность читателей распределена мягче популярности книг
+        user_weights = zipf_cum_weights(n_users, 0.8)
+
+        self.book_loans = array("i", bytes(4 * n_books))
+        self.user_loans = array("i", bytes(4 * n_users))
+        self.user_active = array("i", bytes(4 * n_users))
+        self.open_books = set()
+        self.loan_book = array("i")
+        self.loan_user = array("i")
+        # Сколько дней назад выдана и возвращена книга (-1 — ещё на руках)
+        self.loan_borrowed = array("f")
+        self.loan_returned = array("f")
+
+        for start, end in chunks(self.options["loans"], self.batch_size):
+            size = end - start
+            books = self.rng.choices(book_order, cum_weights=book_weights, k=size)
+            users = self.rng.choices(user_order, cum_weights=user_weights, k=size)
+            for book, user in zip(books, users):
+                age = self.rng.random() * history
+                returned = -1
+                if (
+                    age > loan_days
+                    or book in self.open_books
+                    or self.rng.random() < 0.5
+                ):
+                    returned = max(0, age - self.rng.uniform(1, loan_days))
+                else:
+                    self.open_books.add(book)
+                    self.user_active[user] += 1
+                self.book_loans[book] += 1
+                self.user_loans[user] += 1
+                self.loan_book.append(book)
+                self.loan_user.append(user)
+                self.loan_borrowed.append(age)
+                self.loan_returned.append(returned)
+
+    def create_authors(self):
+        total = self.options["authors"]
+        self.author_names = {}
+        ids = []
+        for start, end in chunks(total, self.batch_size):
+            authors = []
+            for _ in range(start, end):
+                born = date(self.rng.randint(1750, 1995), 1, 1) + timedelta(
+                    days=self.rng.randrange(365)
+                )
+                died = born + timedelta(days=365 * self.rng.randint(40, 90))
+                name = f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+                authors.append(
+                    Author(
+                        name=name,
+                        search_name=search_key(name),
+                        date_of_birth=born,
+                        date_of_death=died if died < date.today() else None,
+                    )
+                )
+            for author in Author.objects.bulk_create(authors):
+                self.author_names[author.pk] = author.name
+                ids.append(author.pk)
+            self.progress("Авторы", end, total)
+        return ids
+
+    def create_publishers(self):
+        total = self.options["publishers"]
+        existing = set(Publisher.objects.values_list("name", flat=True))
+        ids = []
+        for start, end in chunks(total, self.batch_size):
+            publishers = []
+            for n in range(start, end):
+                # Название издательства уникально
+                name = f"{self.rng.choice(PUBLISHER_WORDS)}-{self.options['seed']}-{n}"
+                if name not in existing:
+                    publishers.append(
+                        Publisher(name=name, search_name=search_key(name))
+                    )
+            ids += [p.pk for p in Publisher.objects.bulk_create(publishers)]
+            self.progress("Издательства", end, total)
+        return ids
+
+    def make_isbn(self, n):
+        digits = f"978{(self.isbn_offset + n) % 10**9:09d}"
+        return digits + str(isbn13_check_digit(digits))
+
+    def create_books(self, author_ids, publisher_ids):
+        total = self.options["books"]
+        year = date.today().year
+        self.isbn_offset = self.rng.randrange(10**9)
+        # У немногих авторов и издательств много книг, у большинства — единицы
+        author_weights = zipf_cum_weights(len(author_ids), 1.0) if author_ids else None
+        publisher_weights = (
+            zipf_cum_weights(len(publisher_ids), 1.2) if publisher_ids else None
+        )
+        ids = []
+        previous = None
+        for start, end in chunks(total, self.batch_size):
+            books = []
+            for n in range(start, end):
+                if previous is not None and self.rng.random() < self.options["copies"]:
+                    # Ещё один экземпляр того же издания
+                    book = Book(
+                        **{
+                            name: getattr(previous, name)
+                            for name in (
+                                "title",
+                                "author_id",
+                                "author_name",
+                                "publisher_id",
+                                "isbn",
+                                "year",
+                                "short_description",
+                                "key_words",
+                            )
+                        }
+                    )
+                else:
+                    author_id = (
+                        self.rng.choices(author_ids, cum_weights=author_weights)[0]
+                        if author_ids
+                        else None
+                    )
+                    book = Book(
+                        title=self.make_title(),
+                        author_id=author_id,
+                        publisher_id=(
+                            self.rng.choices(
+                                publisher_ids, cum_weights=publisher_weights
+                            )[0]
+                            if publisher_ids
+                            else None
+                        ),
+                        isbn=self.make_isbn(n),
+                        year=max(1800, year - int(self.rng.expovariate(1 / 25))),
+                        short_description=self.rng.choice(RUBRICS),
+                        key_words=", ".join(
+                            self.rng.sample(KEYWORDS, self.rng.randint(1, 4))
+                        ),
+                    )
+                    book.author_name = self.author_names.get(author_id, "")
+                book.times_of_issued = self.book_loans[n]
+                book.available = n not in self.open_books
+                books.append(book)
+                previous = book
+            with transaction.atomic():
+                created = Book.objects.bulk_create(books)
+                keywords.sync_book_keywords(created)
+            ids += [book.pk for book in created]
+            self.progress("Книги", end, total)
+        return ids
+
+    def make_title(self):
+        words = self.rng.sample(TITLE_WORDS, 2)
+        title = f"{self.rng.choice(TITLE_ADJECTIVES)} {words[0]}"
+        if self.rng.random() < 0.4:
+            title += f" и {words[1]}"
+        return title.capitalize()
+
+    def create_users(self):
+        total = self.options["users"]
+        staff = self.options["staff"]
+        # Хэш считается один раз: иначе генерация упирается в процессор
+        password = make_password(self.options["password"])
+        ids = []
+        for start, end in chunks(staff + total, self.batch_size):
+            users = []
+            for n in range(start, end):
+                is_staff = n < staff
+                reader = n - staff
+                users.append(
+                    CustomUser(
+                        email=(
+                            f"staff{n}@{self.email_domain}"
+                            if is_staff
+                            else f"reader{reader}@{self.email_domain}"
+                        ),
+                        full_name=(
+                            f"{self.rng.choice(LAST_NAMES)} {self.rng.choice(FIRST_NAMES)}"
+                        ),
+                        date_of_birth=date(self.rng.randint(1940, 2012), 1, 1)
+                        + timedelta(days=self.rng.randrange(365)),
+                        password=password,
+                        is_staff=is_staff,
+                        date_joined=self.now
+                        - timedelta(days=self.rng.randrange(3 * 365)),
+                        active_loans_count=0 if is_staff else self.user_active[reader],
+                        total_loans_count=0 if is_staff else self.user_loans[reader],
+                    )
+                )
+            created = CustomUser.objects.bulk_create(users)
+            ids += [user.pk for user in created if not user.is_staff]
+            self.progress("Пользователи", end, staff + total)
+        return ids
+
+    def create_loans(self, book_ids, user_ids):
+        total = len(self.loan_book)
+        period = get_loan_policy().get_period(None, None)
+        with explicit_dates(BorrowedBook, "borrowed_at"):
+            for start, end in chunks(total, self.batch_size):
+                loans = []
+                for n in range(start, end):
+                    returned = self.loan_returned[n]
+                    borrowed_at = self.now - timedelta(days=self.loan_borrowed[n])
+                    loans.append(
+                        BorrowedBook(
+                            book_id=book_ids[self.loan_book[n]],
+                            user_id=user_ids[self.loan_user[n]],
+                            borrowed_at=borrowed_at,
+                            due_at=borrowed_at + period,
+                            returned=returned >= 0,
+                            returned_at=(
+                                self.now - timedelta(days=returned)
+                                if returned >= 0
+                                else None
+                            ),
+                        )
+                    )
+                BorrowedBook.objects.bulk_create(loans)
+                self.progress("Выдачи", end, total)
+
+    def create_carts(self, book_ids, user_ids):
+        available = [
+            book_id for n, book_id in enumerate(book_ids) if n not in self.open_books
+        ]
+        count = int(len(user_ids) * self.options["carts"])
+        if not available or not count:
+            return
+        owners = self.rng.sample(user_ids, count)
+        Link = Cart.books.through
+        for start, end in chunks(count, self.batch_size):
+            carts = Cart.objects.bulk_create(
+                Cart(user_id=user_id) for user_id in owners[start:end]
+            )
+            Link.objects.bulk_create(
+                Link(cart_id=cart.pk, book_id=book_id)
+                for cart in carts
+                for book_id in set(
+                    self.rng.choices(available, k=self.rng.randint(1, 5))
+                )
+            )
+            self.progress("Корзины", end, count)
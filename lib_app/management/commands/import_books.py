@@ -0,0 +1,84 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lib_app import importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует каталог из CSV или JSONL (можно .gz) пачками: книги "
+        "с уже известным ISBN обновляются, остальные добавляются, авторы "
+        "и издательства создаются по имени. Файл читается потоком, поэтому "
+        "подходит и для миллионов записей. Путь «-» — стандартный ввод."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл .csv, .jsonl (можно с .gz) или -")
+        parser.add_argument(
+            "--format",
+            choices=importer.FORMATS,
+            help="Формат файла (по умолчанию по расширению)",
+        )
+        parser.add_argument("--delimiter", default=",", help="Разделитель столбцов CSV")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=importer.DEFAULT_BATCH_SIZE,
+            help=f"Записей в одной транзакции (по умолчанию "
+            f"{importer.DEFAULT_BATCH_SIZE})",
+        )
+        parser.add_argument(
+            "--no-update",
+            action="store_true",
+            help="Не менять книги с существующим ISBN, только добавлять новые",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if path == "-":
+            if not options["format"]:
+                raise CommandError("Для стандартного ввода укажите --format.")
+            self.run(sys.stdin.buffer, "", options)
+            return
+        try:
+            fileobj = open(path, "rb")
+        except OSError as error:
+            raise CommandError(error)
+        with fileobj:
+            self.run(fileobj, path, options)
+
+    def run(self, fileobj, name, options):
+        try:
+            stats = importer.import_file(
+                fileobj,
+                name,
+                format=options["format"],
+                delimiter=options["delimiter"],
+                batch_size=options["batch_size"],
+                update=not options["no_update"],
+                progress=self.progress,
+            )
+        except importer.ImportFormatError as error:
+            raise CommandError(error)
+
+        for number, message in stats.errors:
+            self.stderr.write(f"Запись {number}: {message}")
+        if stats.failed > len(stats.errors):
+            self.stderr.write(f"... и ещё {stats.failed - len(stats.errors)} ошибок")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово за {stats.elapsed:.1f} с: записей {stats.read}, "
+                f"добавлено {stats.created}, обновлено {stats.updated}, "
+                f"без изменений {stats.unchanged}, пропущено {stats.skipped}, "
+                f"ошибок {stats.failed}; новых авторов {stats.authors_created}, "
+                f"издательств {stats.publishers_created}."
+            )
+        )
+
+    def progress(self, stats):
+        self.stdout.write(
+            f"Записей: {stats.read}, добавлено {stats.created}, "
+            f"обновлено {stats.updated}, ошибок {stats.failed} — "
+            f"{stats.rate:.0f} зап./с"
+        )
@@ -0,0 +1,132 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from lib_app import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон: анонимные посетители, читатели и сотрудники "
+        "параллельно работают с сайтом по своим смесям действий "
+        "(см. lib_app.loadtest). Выводит по каждому имени URL число запросов, "
+        "запросов в секунду, p50/p95/p99 в миллисекундах и ошибки. "
+        "Тестовые пользователи удаляются, а выданные книги возвращаются "
+        "после прогона; всё же запускайте его на копии базы."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url",
+            help="Адрес запущенного сервера (по умолчанию запросы идут "
+            "в config.wsgi этого процесса)",
+        )
+        parser.add_argument("--visitors", type=int, default=2)
+        parser.add_argument("--patrons", type=int, default=4)
+        parser.add_argument("--staff", type=int, default=1)
+        parser.add_argument(
+            "--visitor-mix",
+            help=f"Веса действий посетителя, по умолчанию {loadtest.VISITOR_MIX}",
+        )
+        parser.add_argument(
+            "--patron-mix",
+            help=f"Веса действий читателя, по умолчанию {loadtest.PATRON_MIX}",
+        )
+        parser.add_argument(
+            "--staff-mix",
+            help=f"Веса действий сотрудника, по умолчанию {loadtest.STAFF_MIX}",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=20, help="Длительность, секунд"
+        )
+        parser.add_argument(
+            "--think-time",
+            type=float,
+            default=0,
+            help="Средняя пауза между действиями пользователя, секунд",
+        )
+        parser.add_argument("--seed", type=int, help="Зерно генератора действий")
+        parser.add_argument(
+            "--save-baseline", metavar="NAME", help="Сохранить итоги как базовые"
+        )
+        parser.add_argument(
+            "--compare", metavar="NAME", help="Сравнить с базовыми итогами NAME"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mixes = {
+                "visitor": loadtest.parse_mix(
+                    options["visitor_mix"], loadtest.VISITOR_MIX
+                ),
+                "patron": loadtest.parse_mix(
+                    options["patron_mix"], loadtest.PATRON_MIX
+                ),
+                "staff": loadtest.parse_mix(options["staff_mix"], loadtest.STAFF_MIX),
+            }
+            baseline = (
+                loadtest.load_baseline(options["compare"])
+                if options["compare"]
+                else None
+            )
+        except (ValueError, OSError) as error:
+            raise CommandError(error)
+
+        if options["base_url"]:
+            transport = loadtest.HTTPTransport(options["base_url"])
+        else:
+            transport = loadtest.WSGITransport()
+        counts = {
+            "visitor": options["visitors"],
+            "patron": options["patrons"],
+            "staff": options["staff"],
+        }
+        try:
+            results, elapsed = loadtest.run(
+                transport,
+                counts,
+                mixes,
+                options["duration"],
+                options["think_time"],
+                options["seed"],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        changes = loadtest.compare(results, baseline) if baseline else {}
+        header = (
+            f"{'URL':<24} {'запросов':>9} {'в секунду':>10} {'p50, мс':>8} "
+            f"{'p95, мс':>8} {'p99, мс':>8} {'ошибок':>7}"
+        )
+        if baseline:
+            header += f" {'Δ p95':>8} {'Δ rps':>8}"
+        self.stdout.write(header)
+        for url_name, result in results.items():
+            line = (
+                f"{url_name:<24} {result['count']:>9} {result['rps']:>10.1f} "
+                f"{result['p50']:>8.1f} {result['p95']:>8.1f} {result['p99']:>8.1f} "
+                f"{result['errors']:>7}"
+            )
+            if url_name in changes:
+                change = changes[url_name]
+                line += "".join(
+                    f" {'—' if change[key] is None else f'{change[key]:+.1f}%':>8}"
+                    for key in ("p95", "rps")
+                )
+            self.stdout.write(line)
+        self.stdout.write(f"Длительность: {elapsed:.1f} с")
+
+        if options["save_baseline"]:
+            saved = {
+                key: options[key]
+                for key in (
+                    "visitors",
+                    "patrons",
+                    "staff",
+                    "duration",
+                    "think_time",
+                    "seed",
+                )
+            }
+            saved["base_url"] = options["base_url"]
+            saved["mixes"] = mixes
+            path = loadtest.save_baseline(options["save_baseline"], results, saved)
+            self.stdout.write(f"Базовые итоги сохранены: {path}")
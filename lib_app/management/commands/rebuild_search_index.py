@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from lib_app.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Полная перестройка поискового индекса каталога"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Псевдоним базы данных (по умолчанию default)",
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        backend = get_search_backend(using)
+        backend.rebuild_index(using=using)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Поисковый индекс перестроен ({backend.__class__.__name__})."
+            )
+        )
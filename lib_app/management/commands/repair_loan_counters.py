@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Q
+
+from lib_app.services import actual_loan_counts
+from user_app.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает счётчики выдач читателей (книг на руках и всего выдач) "
+        "по записям о выдачах. Читатели обрабатываются пачками по id, "
+        "перезаписываются только расходящиеся счётчики."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Читателей в одной транзакции (по умолчанию 1000)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать число расходящихся счётчиков",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Псевдоним базы данных (по умолчанию default)",
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        batch_size = options["batch_size"]
+        users = CustomUser.objects.using(using).order_by("pk")
+        counts = actual_loan_counts()
+        # Расхождение хотя бы в одном из счётчиков
+        drifted = Q()
+        for name in counts:
+            drifted |= ~Q(**{name: F(f"actual_{name}")})
+
+        checked = repaired = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                users.filter(pk__gt=last_pk).values_list("pk", flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1]
+            checked += len(batch)
+            with transaction.atomic(using=using):
+                wrong = list(
+                    users.filter(pk__in=batch)
+                    .annotate(
+                        **{f"actual_{name}": expr for name, expr in counts.items()}
+                    )
+                    .filter(drifted)
+                    .values_list("pk", flat=True)
+                )
+                if wrong and not options["dry_run"]:
+                    users.filter(pk__in=wrong).update(**counts)
+            repaired += len(wrong)
+
+        verb = "Расходятся" if options["dry_run"] else "Исправлены"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Проверено читателей: {checked}. {verb} счётчики у {repaired}."
+            )
+        )
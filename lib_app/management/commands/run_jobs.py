@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from lib_app import jobs
+from lib_app.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        "Воркер фоновых задач: занимает задачи из очереди (таблица Job) "
+        "и выполняет их параллельно в пуле процессов или потоков. "
+        "Несколько воркеров могут работать одновременно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Задач одновременно (по умолчанию — число ядер)",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=("process", "thread"),
+            default="process",
+            help="Пул процессов (задачи на разных ядрах) или потоков",
+        )
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=2.0,
+            help="Пауза между проверками пустой очереди, секунд",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить готовые задачи и завершиться",
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options["workers"], 1)
+        if options["mode"] == "process":
+            # spawn: процессы не наследуют открытые соединения с базой
+            executor = ProcessPoolExecutor(
+                workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        else:
+            executor = ThreadPoolExecutor(workers)
+        worker = jobs.worker_name()
+        self.stdout.write(f"Воркер {worker}: {workers} ({options['mode']})")
+
+        # Future задачи: id задачи
+        running = {}
+        done = failed = 0
+        beat_at = time.monotonic()
+        with executor:
+            while True:
+                stale = jobs.requeue_stale()
+                if stale:
+                    self.stderr.write(f"Зависших задач возвращено: {stale}")
+                if time.monotonic() - beat_at >= jobs.get_heartbeat_interval():
+                    jobs.heartbeat(running.values(), worker)
+                    beat_at = time.monotonic()
+                free = workers - len(running)
+                if free:
+                    for job_id in Job.objects.claim(worker, limit=free):
+                        running[executor.submit(jobs.execute_job, job_id)] = job_id
+                # Между опросами соединение воркеру не нужно
+                connections.close_all()
+                if not running:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll"])
+                    continue
+                finished, _ = wait(
+                    running, timeout=options["poll"], return_when=FIRST_COMPLETED
+                )
+                for future in finished:
+                    del running[future]
+                    try:
+                        job_id, status = future.result()
+                    except Exception as error:
+                        # Отметок больше не будет: задача вернётся в очередь по таймауту
+                        self.stderr.write(f"Сбой воркера: {error!r}")
+                        failed += 1
+                        continue
+                    if status == Job.DONE:
+                        done += 1
+                    else:
+                        failed += 1
+                    self.stdout.write(f"Задача #{job_id}: {status}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово: выполнено задач {done}, неудачных попыток {failed}."
+            )
+        )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from lib_app.routers import get_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную базу SQLite в файлы реплик (LIBRARY_DB_REPLICAS) "
+        "через backup API SQLite. Для локальной схемы «основная база + реплика» "
+        "из двух файлов; запускайте по расписанию, период определяет отставание "
+        "реплики (он должен быть меньше LIBRARY_DB_PIN_SECONDS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "aliases",
+            nargs="*",
+            help="Алиасы реплик (по умолчанию все из LIBRARY_DB_REPLICAS)",
+        )
+
+    def handle(self, *args, **options):
+        aliases = options["aliases"] or get_replicas()
+        if not aliases:
+            raise CommandError("Реплики не настроены (LIBRARY_DB_REPLICAS пуст).")
+
+        source = connections[DEFAULT_DB_ALIAS]
+        if source.vendor != "sqlite":
+            raise CommandError("Команда копирует только базы SQLite.")
+        source.ensure_connection()
+        for alias in aliases:
+            if alias not in connections or alias == DEFAULT_DB_ALIAS:
+                raise CommandError(f"Неизвестная реплика: {alias}")
+            target = connections[alias]
+            if target.vendor != "sqlite":
+                raise CommandError(f"Реплика {alias} — не SQLite.")
+            target.ensure_connection()
+            source.connection.backup(target.connection)
+            self.stdout.write(f"Реплика {alias} обновлена.")
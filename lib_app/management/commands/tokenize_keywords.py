@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from lib_app.keywords import sync_book_keywords
+from lib_app.models import Book
+
+
+class Command(BaseCommand):
+    help = (
+        "Разбирает Book.key_words всех книг в таблицу ключевых слов и связи "
+        "книга–слово. Книги обрабатываются пачками по id, каждая пачка — "
+        "отдельная транзакция; повторный запуск безопасен."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Книг в одной пачке (по умолчанию 500)",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        books = Book.objects.only("id", "key_words").order_by("pk")
+        total = books.count()
+        done = 0
+        last_pk = 0
+        while True:
+            batch = list(books.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            sync_book_keywords(batch)
+            last_pk = batch[-1].pk
+            done += len(batch)
+            self.stdout.write(f"Обработано книг: {done} из {total}")
+        self.stdout.write(self.style.SUCCESS("Ключевые слова разобраны."))
@@ -0,0 +1,131 @@
+"""
+Учёт SQL-запросов на каждый HTTP-запрос.
+
+QueryBudgetMiddleware считает запросы к базе, их суммарное время и
+повторяющиеся запросы (признак N+1) и сравнивает число запросов
+с бюджетом, объявленным у представления атрибутом query_budget.
+
+Настройки:
+    LIBRARY_QUERY_BUDGET_HEADER  — добавлять заголовок X-SQL-Queries в ответ;
+    LIBRARY_QUERY_BUDGET_LOG     — писать в лог lib_app.sql превышения бюджета
+                                   и повторяющиеся запросы;
+    LIBRARY_QUERY_REPEAT_THRESHOLD — сколько одинаковых запросов считать N+1.
+"""
+
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("lib_app.sql")
+
+DEFAULT_REPEAT_THRESHOLD = 3
+
+
+class QueryRecorder:
+    """
+    Обёртка выполнения запросов (connection.execute_wrapper).
+    Работает и при DEBUG = False, в отличие от connection.queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0  # секунды
+        # Текст запроса до подстановки параметров: одинаковый шаблон
+        # с разными параметрами и есть повторяющийся запрос
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    @contextmanager
+    def record(self):
+        """Подключает счётчик ко всем соединениям на время блока"""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def repeated(self, threshold=None):
+        """Запросы, выполненные не меньше threshold раз: {sql: сколько раз}"""
+        if threshold is None:
+            threshold = getattr(
+                settings, "LIBRARY_QUERY_REPEAT_THRESHOLD", DEFAULT_REPEAT_THRESHOLD
+            )
+        return {sql: n for sql, n in self.statements.items() if n >= threshold}
+
+
+def get_query_budget(resolver_match):
+    """Бюджет запросов представления (атрибут query_budget класса) или None"""
+    if resolver_match is None:
+        return None
+    view_class = getattr(resolver_match.func, "view_class", None)
+    return getattr(view_class, "query_budget", None)
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы каждого HTTP-запроса и сверяет их с бюджетом"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+        return self.report(request, response, recorder)
+
+    async def __acall__(self, request):
+        # Запросы асинхронного ORM выполняются в потоке sync_to_async,
+        # а соединения у каждого потока свои: счётчик подключается
+        # к соединениям того потока и там же отключается
+        recorder = QueryRecorder()
+        stack = ExitStack()
+        await sync_to_async(stack.enter_context)(recorder.record())
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.report(request, response, recorder)
+
+    def report(self, request, response, recorder):
+        request.sql_stats = recorder
+        url_name = getattr(request.resolver_match, "url_name", None) or request.path
+        budget = get_query_budget(request.resolver_match)
+        duration_ms = recorder.duration * 1000
+
+        if getattr(settings, "LIBRARY_QUERY_BUDGET_HEADER", settings.DEBUG):
+            value = f"{recorder.count}; time={duration_ms:.1f}ms"
+            if budget is not None:
+                value += f"; budget={budget}"
+            response["X-SQL-Queries"] = value
+
+        if getattr(settings, "LIBRARY_QUERY_BUDGET_LOG", True):
+            if budget is not None and recorder.count > budget:
+                logger.warning(
+                    "%s: %d SQL-запросов при бюджете %d (%.1f мс)",
+                    url_name,
+                    recorder.count,
+                    budget,
+                    duration_ms,
+                )
+            for sql, times in recorder.repeated().items():
+                logger.warning("%s: возможный N+1, %d раз: %s", url_name, times, sql)
+        return response
@@ -0,0 +1,121 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Полнотекстовый индекс каталога существует только в SQLite (FTS5).
+# Индекс ведётся триггерами, поэтому он обновляется при любой записи
+# в книги и авторов, включая массовые update() и SET_NULL при удалении автора.
+FTS_CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS lib_app_book_fts USING fts5(
+        title, author, key_words, short_description, isbn,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    # Веса столбцов для релевантности: название и ISBN важнее описания
+    """
+    INSERT INTO lib_app_book_fts (lib_app_book_fts, rank)
+    VALUES ('rank', 'bm25(10.0, 5.0, 3.0, 1.0, 10.0)')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lib_app_book_fts_ai AFTER INSERT ON lib_app_book
+    BEGIN
+        INSERT INTO lib_app_book_fts (rowid, title, author, key_words, short_description, isbn)
+        VALUES (
+            new.id, new.title,
+            (SELECT name FROM lib_app_author WHERE id = new.author_id),
+            new.key_words, new.short_description, new.isbn
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lib_app_book_fts_au
+    AFTER UPDATE OF title, author_id, key_words, short_description, isbn ON lib_app_book
+    BEGIN
+        DELETE FROM lib_app_book_fts WHERE rowid = old.id;
+        INSERT INTO lib_app_book_fts (rowid, title, author, key_words, short_description, isbn)
+        VALUES (
+            new.id, new.title,
+            (SELECT name FROM lib_app_author WHERE id = new.author_id),
+            new.key_words, new.short_description, new.isbn
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lib_app_book_fts_ad AFTER DELETE ON lib_app_book
+    BEGIN
+        DELETE FROM lib_app_book_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lib_app_author_fts_au AFTER UPDATE OF name ON lib_app_author
+    BEGIN
+        UPDATE lib_app_book_fts SET author = new.name
+        WHERE rowid IN (SELECT id FROM lib_app_book WHERE author_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO lib_app_book_fts (rowid, title, author, key_words, short_description, isbn)
+    SELECT b.id, b.title, a.name, b.key_words, b.short_description, b.isbn
+    FROM lib_app_book b LEFT JOIN lib_app_author a ON a.id = b.author_id
+    """,
+]
+
+FTS_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS lib_app_author_fts_au",
+    "DROP TRIGGER IF EXISTS lib_app_book_fts_ad",
+    "DROP TRIGGER IF EXISTS lib_app_book_fts_au",
+    "DROP TRIGGER IF EXISTS lib_app_book_fts_ai",
+    "DROP TABLE IF EXISTS lib_app_book_fts",
+]
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in FTS_CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in FTS_DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib_app', '0003_remove_book_translator_delete_translator'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchIndex',
+            fields=[
+                ('book', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='lib_app.book')),
+                ('title', models.TextField()),
+                ('author', models.TextField()),
+                ('key_words', models.TextField()),
+                ('short_description', models.TextField()),
+                ('isbn', models.TextField()),
+                ('document', models.TextField(db_column='lib_app_book_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'lib_app_book_fts',
+                'managed': False,
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='author',
+            options={'ordering': ['name']},
+        ),
+        migrations.AlterModelOptions(
+            name='publisher',
+            options={'ordering': ['name'], 'verbose_name': 'Издательство', 'verbose_name_plural': 'Издательства'},
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:42
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from lib_app import fts
+
+
+def fill_author_name(apps, schema_editor):
+    Author = apps.get_model("lib_app", "Author")
+    Book = apps.get_model("lib_app", "Book")
+    author_name = Author.objects.filter(pk=OuterRef("author_id")).values("name")[:1]
+    Book.objects.using(schema_editor.connection.alias).update(
+        author_name=Coalesce(Subquery(author_name), Value(""))
+    )
+
+
+def drop_fts_triggers(apps, schema_editor):
+    # Триггер на авторах ссылается на таблицу книг и не даёт SQLite
+    # пересоздать её при добавлении поля
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in fts.DROP_TRIGGERS_SQL:
+            schema_editor.execute(sql)
+
+
+def install_fts_triggers(apps, schema_editor):
+    # Триггеры индекса теперь берут имя автора из author_name
+    fts.install_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib_app', '0004_book_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_fts_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='book',
+            name='author_name',
+            field=models.CharField(default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(fill_author_name, migrations.RunPython.noop),
+        migrations.RunPython(install_fts_triggers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['name'], name='author_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_name', 'title', 'id'], name='book_catalogue_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('times_of_issued__gt', 0)), fields=['-times_of_issued'], name='book_top_issued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['isbn'], name='book_isbn_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowedbook',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['user'], name='borrowed_open_by_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowedbook',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['book'], name='borrowed_open_by_book_idx'),
+        ),
+    ]
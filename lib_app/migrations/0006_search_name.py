@@ -0,0 +1,51 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:54
+
+from django.db import migrations, models
+
+
+def search_key(value):
+    # Копия lib_app.models.search_key на момент миграции
+    return ' '.join(value.split()).casefold()
+
+
+def fill_search_name(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    for model_name in ('Author', 'Publisher'):
+        model = apps.get_model('lib_app', model_name)
+        batch = []
+        for obj in model.objects.using(db_alias).only('id', 'name').iterator():
+            obj.search_name = search_key(obj.name)
+            batch.append(obj)
+            if len(batch) >= 1000:
+                model.objects.using(db_alias).bulk_update(batch, ['search_name'])
+                batch = []
+        model.objects.using(db_alias).bulk_update(batch, ['search_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib_app', '0005_catalogue_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='search_name',
+            field=models.CharField(default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='publisher',
+            name='search_name',
+            field=models.CharField(default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['search_name', 'id'], name='author_search_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publisher',
+            index=models.Index(fields=['search_name', 'id'], name='publisher_search_name_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:55
+
+import lib_app.models
+from django.db import migrations
+
+from lib_app import fts
+from lib_app.isbn import canonical_or_raw
+
+
+def install_fts_triggers(apps, schema_editor):
+    # SQLite пересоздал таблицу книг при изменении поля и потерял триггеры индекса
+    fts.install_triggers(schema_editor.connection)
+
+
+def normalize_isbns(apps, schema_editor):
+    """
+    Приводит корректные ISBN к ISBN-13 без разделителей. Некорректные номера
+    (например, заглушки с неверной контрольной цифрой) не теряются: у них
+    убираются только разделители, как при поиске (canonical_or_raw).
+    Изменения записываются пачками.
+    """
+    Book = apps.get_model('lib_app', 'Book')
+    books = Book.objects.using(schema_editor.connection.alias)
+    changed = []
+    for pk, isbn in books.exclude(isbn=None).values_list('pk', 'isbn').iterator():
+        canonical = canonical_or_raw(isbn) if isbn.strip() else None
+        if canonical != isbn:
+            changed.append(Book(pk=pk, isbn=canonical))
+    books.bulk_update(changed, ['isbn'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib_app', '0006_search_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='isbn',
+            field=lib_app.models.IsbnField(blank=True, null=True),
+        ),
+        migrations.RunPython(install_fts_triggers, migrations.RunPython.noop),
+        migrations.RunPython(normalize_isbns, migrations.RunPython.noop),
+    ]
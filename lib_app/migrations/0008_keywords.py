@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib_app', '0007_canonical_isbn'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Keyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Ключевое слово')),
+                ('normalized', models.CharField(editable=False, max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Ключевое слово',
+                'verbose_name_plural': 'Ключевые слова',
+                'ordering': ['normalized'],
+            },
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='keywords',
+            field=models.ManyToManyField(blank=True, editable=False, related_name='books', to='lib_app.keyword'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_due_dates(apps, schema_editor):
+    """Срок для существующих выдач — по сроку выдачи по умолчанию"""
+    BorrowedBook = apps.get_model('lib_app', 'BorrowedBook')
+    period = timedelta(days=getattr(settings, 'LIBRARY_LOAN_PERIOD_DAYS', 14))
+    BorrowedBook.objects.using(schema_editor.connection.alias).update(
+        due_at=models.F('borrowed_at') + period
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib_app', '0009_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowedbook',
+            name='due_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='borrowedbook',
+            name='reminded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_due_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='borrowedbook',
+            name='due_at',
+            field=models.DateTimeField(blank=True),
+        ),
+        migrations.AddIndex(
+            model_name='borrowedbook',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['due_at', 'id'], name='borrowed_open_by_due_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+def set_heartbeat(apps, schema_editor):
+    # Выполняющиеся задачи получают отметку с момента запуска,
+    # иначе их никогда не сочли бы зависшими
+    Job = apps.get_model('lib_app', 'Job')
+    Job.objects.using(schema_editor.connection.alias).filter(
+        status='running'
+    ).update(heartbeat_at=models.F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib_app', '0011_job'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_running_idx',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_heartbeat, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['heartbeat_at'], name='job_running_idx'),
+        ),
+    ]
@@ -1,20 +1,40 @@
-from django.db import models
+from django.db import connections, models, router, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from datetime import datetime, date, timedelta
 from django.conf import settings
+from django.utils import timezone
+
+from lib_app.isbn import InvalidISBN, canonical_or_raw, normalize_isbn
+
+
+def search_key(value):
+    """
+    Нормализованная форма имени для поиска по префиксу: без учёта регистра
+    и лишних пробелов. Нужна потому, что LIKE в SQLite не различает регистр
+    только для латиницы и не использует индекс.
+    """
+    return " ".join(value.split()).casefold()
 
 
 class Author(models.Model):
     """Модель автора книги"""
 
     name = models.CharField(max_length=200)
+    # Копия name для автодополнения (см. search_key)
+    search_name = models.CharField(max_length=200, default="", editable=False)
     date_of_birth = models.DateField(null=True, blank=True)
     date_of_death = models.DateField(null=True, blank=True)
+    # Время последнего изменения: Last-Modified детальной страницы книги
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         # Порядок сортировки по умолчанию
         ordering = ["name"]
+        indexes = [
+            models.Index(fields=["name"], name="author_name_idx"),
+            models.Index(fields=["search_name", "id"], name="author_search_name_idx"),
+        ]
 
     def clean(self):
         """
@@ -32,7 +52,12 @@ class Author(models.Model):
         Переопределяем save(), чтобы автоматически вызывать валидацию.
         """
         self.full_clean()  # вызывает clean() и другие валидации
+        self.search_name = search_key(self.name)
         super().save(*args, **kwargs)
+        # Книги хранят копию имени автора для сортировки каталога по индексу
+        self.books.exclude(author_name=self.name).update(
+            author_name=self.name, updated_at=timezone.now()
+        )
 
     def __str__(self):
         return self.name
@@ -42,17 +67,128 @@ class Publisher(models.Model):
     """Модель издательства книги"""
 
     name = models.CharField("Название издательства", max_length=64, unique=True)
+    # Копия name для автодополнения (см. search_key)
+    search_name = models.CharField(max_length=64, default="", editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Издательство"
         verbose_name_plural = "Издательства"
         # Порядок сортировки по умолчанию
         ordering = ["name"]
+        indexes = [
+            models.Index(
+                fields=["search_name", "id"], name="publisher_search_name_idx"
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.search_name = search_key(self.name)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+
+class Keyword(models.Model):
+    """
+    Ключевое слово каталога. Разбирается из Book.key_words
+    (см. lib_app.keywords), одинаковые слова в разном регистре — одна запись.
+    """
+
+    name = models.CharField("Ключевое слово", max_length=100)
+    # search_key(name): по нему ищутся слова при разборе и в фильтре каталога
+    normalized = models.CharField(max_length=100, unique=True, editable=False)
+
+    class Meta:
+        verbose_name = "Ключевое слово"
+        verbose_name_plural = "Ключевые слова"
+        ordering = ["normalized"]
+
+    def save(self, *args, **kwargs):
+        self.normalized = search_key(self.name)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 
+class IsbnField(models.CharField):
+    """
+    ISBN в канонической форме: 13 цифр без разделителей.
+    При валидации и сохранении книги ISBN-10 и номера с дефисами
+    приводятся к ISBN-13, номер с неверной контрольной цифрой отклоняется.
+    Значение в фильтрах (isbn=...) нормализуется так же, поэтому
+    Book.objects.filter(isbn="5-17-...") находит книгу по индексу.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs["max_length"] = 13
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs["max_length"]
+        return name, path, args, kwargs
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value is None or not value.strip():
+            return None if self.null else ""
+        try:
+            return normalize_isbn(value)
+        except InvalidISBN as error:
+            raise ValidationError(str(error), code="invalid_isbn")
+
+    def get_prep_value(self, value):
+        # Без to_python() из CharField: некорректный номер в фильтре
+        # не ошибка, а просто «не найдено»
+        value = models.Field.get_prep_value(self, value)
+        if value:
+            value = canonical_or_raw(str(value))
+        return value
+
+    def formfield(self, **kwargs):
+        # В форме допускаем дефисы и пробелы: ISBN-13 с разделителями — 17 символов
+        return super().formfield(**{"max_length": 17, **kwargs})
+
+
+class BookQuerySet(models.QuerySet):
+    def claim(self, book_ids):
+        """
+        Атомарно занимает доступные книги для выдачи и возвращает множество id,
+        которые удалось занять. Книга занимается условным UPDATE
+        (... WHERE available = true), поэтому две стойки выдачи не могут
+        получить одну и ту же книгу ни в SQLite, ни на серверных СУБД.
+        """
+        book_ids = list(dict.fromkeys(book_ids))
+        if not book_ids:
+            return set()
+        using = self._db or router.db_for_write(self.model)
+        changes = {
+            "available": False,
+            "times_of_issued": models.F("times_of_issued") + 1,
+            "updated_at": timezone.now(),
+        }
+
+        with transaction.atomic(using=using):
+            # Обычный случай: все книги свободны, хватает одного UPDATE
+            sid = transaction.savepoint(using=using)
+            claimed = self.filter(id__in=book_ids, available=True).update(**changes)
+            if claimed == len(book_ids):
+                transaction.savepoint_commit(sid, using=using)
+                return set(book_ids)
+
+            # Часть книг успели занять другие: откатываем и занимаем по одной,
+            # чтобы точно знать, какие книги достались нам
+            transaction.savepoint_rollback(sid, using=using)
+            return {
+                book_id
+                for book_id in book_ids
+                if self.filter(id=book_id, available=True).update(**changes)
+            }
+
+
 class Book(models.Model):
     """Модель книги с привязкой к автору"""
 
@@ -60,6 +196,8 @@ class Book(models.Model):
     author = models.ForeignKey(
         Author, on_delete=models.SET_NULL, related_name="books", null=True, blank=True
     )
+    # Копия Author.name: каталог сортируется по (author_name, title, id) по индексу
+    author_name = models.CharField(max_length=200, default="", editable=False)
     publisher = models.ForeignKey(
         Publisher,
         on_delete=models.SET_NULL,
@@ -67,9 +205,8 @@ class Book(models.Model):
         null=True,
         blank=True,
     )
-    isbn = models.CharField(
-        max_length=13, null=True, blank=True  # ISBN должен содержать ровно 13 цифр
-    )
+    # Канонический ISBN-13 (см. IsbnField), поиск по нему — точное совпадение
+    isbn = IsbnField(null=True, blank=True)
     # Год издания
     year = models.PositiveIntegerField(
         null=True,
@@ -83,13 +220,69 @@ class Book(models.Model):
     short_description = models.TextField(default="", null=True, blank=True)
     # ключевые слова
     key_words = models.TextField(default="", null=True, blank=True)
+    # Разобранные key_words; ведётся автоматически (lib_app.keywords)
+    keywords = models.ManyToManyField(
+        Keyword, related_name="books", blank=True, editable=False
+    )
     available = models.BooleanField(default=True)  # доступна ли для выдачи
     times_of_issued = models.PositiveIntegerField(default=0)  # сколько раз выдана книга
+    # Время последнего изменения; UPDATE мимо save() (выдача, возврат,
+    # переименование автора) ставят его явно
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Порядок каталога и курсорная пагинация
+            models.Index(
+                fields=["author_name", "title", "id"], name="book_catalogue_order_idx"
+            ),
+            # Топ выдаваемых книг на главной: только книги, которые уже выдавались
+            models.Index(
+                fields=["-times_of_issued"],
+                condition=models.Q(times_of_issued__gt=0),
+                name="book_top_issued_idx",
+            ),
+            models.Index(fields=["isbn"], name="book_isbn_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.author_name = self.author.name if self.author else ""
+        self.isbn = self._meta.get_field("isbn").to_python(self.isbn)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.author}, {self.title}"
 
 
+class BookSearchIndex(models.Model):
+    """
+    Полнотекстовый индекс каталога (виртуальная таблица SQLite FTS5).
+    Таблица создаётся миграцией и заполняется триггерами, Django её не ведёт.
+    """
+
+    book = models.OneToOneField(
+        Book,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="search_index",
+    )
+    title = models.TextField()
+    author = models.TextField()
+    key_words = models.TextField()
+    short_description = models.TextField()
+    isbn = models.TextField()
+    # Скрытые столбцы FTS5: вся строка индекса (для MATCH) и релевантность
+    document = models.TextField(db_column="lib_app_book_fts")
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "lib_app_book_fts"
+
+
 class Cart(models.Model):
     """Корзина пользователя: временный выбор книг перед выдачей"""
 
@@ -114,9 +307,147 @@ class BorrowedBook(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     borrowed_at = models.DateTimeField(auto_now_add=True)
+    # Срок возврата; если не задан, при сохранении его ставит политика
+    # выдачи (lib_app.loans)
+    due_at = models.DateTimeField(blank=True)
     returned_at = models.DateTimeField(null=True, blank=True)
     returned = models.BooleanField(default=False)
+    # Последнее напоминание о просрочке (команда scan_overdue_loans)
+    reminded_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Частичные индексы только по открытым выдачам: «книги на руках»
+            # у читателя и проверка, выдана ли книга
+            models.Index(
+                fields=["user"],
+                condition=models.Q(returned=False),
+                name="borrowed_open_by_user_idx",
+            ),
+            models.Index(
+                fields=["book"],
+                condition=models.Q(returned=False),
+                name="borrowed_open_by_book_idx",
+            ),
+            # Просроченные выдачи: отчёт персонала и ночная проверка
+            models.Index(
+                fields=["due_at", "id"],
+                condition=models.Q(returned=False),
+                name="borrowed_open_by_due_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.due_at is None:
+            # lib_app.loans импортирует модели, поэтому импорт здесь
+            from lib_app.loans import get_loan_policy
+
+            self.due_at = get_loan_policy().get_due_at(
+                self.user, self.book, self.borrowed_at or timezone.now()
+            )
+        super().save(*args, **kwargs)
+
+    @property
+    def is_overdue(self):
+        return not self.returned and self.due_at < timezone.now()
 
     def __str__(self):
         status = "возвращена" if self.returned else "выдана"
         return f"{self.user.full_name} — {self.book.title} ({status})"
+
+
+class JobQuerySet(models.QuerySet):
+    def claim(self, worker, limit=1):
+        """
+        Занимает до limit готовых к запуску задач для воркера worker
+        и возвращает их id. На PostgreSQL и других СУБД с SKIP LOCKED
+        задачи выбираются SELECT ... FOR UPDATE SKIP LOCKED: воркеры
+        не ждут друг друга и не получают одну задачу. В SQLite запись
+        и так идёт по одной транзакции (transaction_mode IMMEDIATE),
+        а условный UPDATE (... WHERE status = 'queued') не даёт занять
+        задачу дважды и при другом режиме транзакций.
+        """
+        using = self._db or router.db_for_write(self.model)
+        now = timezone.now()
+        changes = {
+            "status": Job.RUNNING,
+            "locked_by": worker,
+            "started_at": now,
+            "heartbeat_at": now,
+            "finished_at": None,
+            "attempts": models.F("attempts") + 1,
+        }
+        with transaction.atomic(using=using):
+            ready = self.filter(status=Job.QUEUED, run_after__lte=now).order_by(
+                "run_after", "id"
+            )
+            if connections[using].features.has_select_for_update_skip_locked:
+                ids = list(
+                    ready.select_for_update(skip_locked=True).values_list(
+                        "id", flat=True
+                    )[:limit]
+                )
+                self.filter(id__in=ids).update(**changes)
+                return ids
+            return [
+                job_id
+                for job_id in ready.values_list("id", flat=True)[:limit]
+                if self.filter(id=job_id, status=Job.QUEUED).update(**changes)
+            ]
+
+
+class Job(models.Model):
+    """Фоновая задача: выполняется командой run_jobs (см. lib_app.jobs)"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Выполнена"),
+        (FAILED, "Ошибка"),
+    ]
+
+    # Имя задачи из реестра lib_app.jobs.TASKS и её аргументы
+    name = models.CharField("Задача", max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Не запускать раньше: так откладываются повторы после ошибки
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Воркер отмечает выполняющиеся задачи; без отметки дольше
+    # LIBRARY_JOB_TIMEOUT задача считается зависшей
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Воркер, который выполняет задачу (хост:pid)
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    # Вывод задачи или текст последней ошибки
+    result = models.TextField(blank=True, default="")
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            # Выбор следующей задачи читает только ожидающие
+            models.Index(
+                fields=["run_after", "id"],
+                condition=models.Q(status="queued"),
+                name="job_queued_idx",
+            ),
+            # Поиск зависших задач
+            models.Index(
+                fields=["heartbeat_at"],
+                condition=models.Q(status="running"),
+                name="job_running_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
@@ -0,0 +1,234 @@
+"""
+Курсорная (keyset) пагинация для списков.
+
+Вместо OFFSET и COUNT(*) следующая страница выбирается условием
+«строки после последней показанной» по ключу сортировки, например
+(имя автора, название, pk). Поэтому любая страница стоит столько же,
+сколько первая. Ссылки «следующая» и «предыдущая» содержат
+подписанные непрозрачные токены с ключом крайней строки страницы.
+"""
+
+from django.core import signing
+from django.db.models import F, Q
+from django.db.models.constants import LOOKUP_SEP
+
+CURSOR_SALT = "lib_app.pagination.cursor"
+
+
+def encode_cursor(values):
+    """Упаковывает значения ключа в непрозрачный токен для URL"""
+    return signing.dumps(list(values), salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token, length):
+    """Распаковывает токен; для повреждённого или чужого токена возвращает None"""
+    try:
+        values = signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def is_nullable_path(model, path):
+    """Может ли поле (в том числе через связи) принимать значение NULL"""
+    opts = model._meta
+    for part in path.split(LOOKUP_SEP):
+        field = opts.pk if part == "pk" else opts.get_field(part)
+        if field.null:
+            return True
+        if field.is_relation:
+            opts = field.related_model._meta
+    return False
+
+
+def get_path_value(obj, path):
+    """Значение поля объекта по пути вида book__author__name"""
+    for part in path.split(LOOKUP_SEP):
+        if obj is None:
+            return None
+        obj = getattr(obj, part)
+    return obj
+
+
+class KeysetPage:
+    """Страница курсорной пагинации (аналог django.core.paginator.Page)"""
+
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по ключу сортировки. Все поля ключа сортируются по возрастанию,
+    NULL идут первыми; последнее поле ключа должно быть уникальным (обычно pk).
+    """
+
+    def __init__(self, queryset, keyset_fields, per_page):
+        self.queryset = queryset
+        self.keyset_fields = tuple(keyset_fields)
+        self.per_page = per_page
+        self.nullable = {
+            path: is_nullable_path(queryset.model, path) for path in self.keyset_fields
+        }
+
+    def _compare(self, path, value, forward):
+        """Условие «строго после» (forward) или «строго до» значения по одному полю"""
+        if self.nullable[path]:
+            if value is None:
+                return Q(**{f"{path}__isnull": False}) if forward else Q(pk__in=[])
+            if not forward:
+                return Q(**{f"{path}__lt": value}) | Q(**{f"{path}__isnull": True})
+        return Q(**{f"{path}__{'gt' if forward else 'lt'}": value})
+
+    def _equal(self, path, value):
+        if value is None:
+            return Q(**{f"{path}__isnull": True})
+        return Q(**{path: value})
+
+    def _seek(self, values, forward):
+        """Лексикографическое условие (a, b, c) > (x, y, z) с учётом NULL"""
+        condition = Q(pk__in=[])
+        prefix = Q()
+        for path, value in zip(self.keyset_fields, values):
+            condition |= prefix & self._compare(path, value, forward)
+            prefix &= self._equal(path, value)
+
+        # Дублируем условие по первому полю (a >= x), чтобы СУБД начала
+        # чтение индекса сразу с нужного места, а не с начала таблицы
+        first, value = self.keyset_fields[0], values[0]
+        if value is not None and not self.nullable[first]:
+            condition &= Q(**{f"{first}__{'gte' if forward else 'lte'}": value})
+        return condition
+
+    def _ordering(self, forward):
+        ordering = []
+        for path in self.keyset_fields:
+            # NULLS FIRST/LAST указываем только для полей, где NULL возможен
+            nulls = True if self.nullable[path] else None
+            if forward:
+                ordering.append(F(path).asc(nulls_first=nulls))
+            else:
+                ordering.append(F(path).desc(nulls_last=nulls))
+        return ordering
+
+    def _cursor_for(self, obj):
+        return encode_cursor(get_path_value(obj, path) for path in self.keyset_fields)
+
+    def page_queryset(self, after_values=None, before_values=None):
+        """
+        Запрос одной страницы (на строку больше, чтобы узнать, есть ли ещё).
+        Отдельным методом, чтобы план запроса можно было проверить в тестах.
+        """
+        forward = before_values is None
+        queryset = self.queryset.order_by(*self._ordering(forward))
+        if not forward:
+            queryset = queryset.filter(self._seek(before_values, False))
+        elif after_values is not None:
+            queryset = queryset.filter(self._seek(after_values, True))
+        return queryset[: self.per_page + 1]
+
+    def decode(self, after, before):
+        length = len(self.keyset_fields)
+        after_values = decode_cursor(after, length) if after else None
+        before_values = decode_cursor(before, length) if before else None
+        return after_values, before_values
+
+    def page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или перед курсором before"""
+        after_values, before_values = self.decode(after, before)
+        rows = list(self.page_queryset(after_values, before_values))
+        return self.make_page(rows, after_values, before_values)
+
+    async def apage(self, after=None, before=None):
+        """Асинхронный вариант page() (асинхронный ORM)"""
+        after_values, before_values = self.decode(after, before)
+        rows = [row async for row in self.page_queryset(after_values, before_values)]
+        return self.make_page(rows, after_values, before_values)
+
+    def make_page(self, rows, after_values, before_values):
+        forward = before_values is None
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if not forward:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows)
+
+        if forward:
+            has_next, has_previous = has_more, after_values is not None
+        else:
+            has_next, has_previous = True, has_more
+        return KeysetPage(
+            rows,
+            next_cursor=self._cursor_for(rows[-1]) if has_next else None,
+            previous_cursor=self._cursor_for(rows[0]) if has_previous else None,
+        )
+
+
+class KeysetPaginationMixin:
+    """
+    Подключает курсорную пагинацию к ListView.
+    В шаблоне page_obj.next_cursor и page_obj.previous_cursor передаются
+    в параметрах after и before, а pagination_query хранит остальные
+    GET-параметры (поиск, фильтры).
+    """
+
+    keyset_fields = ()
+    after_kwarg = "after"
+    before_kwarg = "before"
+
+    def use_keyset_pagination(self):
+        """Можно переопределить, чтобы для части запросов вернуться к OFFSET"""
+        return bool(self.keyset_fields)
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, self.keyset_fields, page_size)
+        page = paginator.page(
+            after=self.request.GET.get(self.after_kwarg),
+            before=self.request.GET.get(self.before_kwarg),
+        )
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def apaginate_keyset(self, queryset, page_size):
+        """Курсорная пагинация асинхронным ORM (см. lib_app.async_views)"""
+        paginator = KeysetPaginator(queryset, self.keyset_fields, page_size)
+        page = await paginator.apage(
+            after=self.request.GET.get(self.after_kwarg),
+            before=self.request.GET.get(self.before_kwarg),
+        )
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.copy()
+        for key in (self.page_kwarg, self.after_kwarg, self.before_kwarg):
+            query.pop(key, None)
+        encoded = query.urlencode()
+        context["pagination_query"] = f"{encoded}&" if encoded else ""
+        return context
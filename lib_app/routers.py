@@ -0,0 +1,152 @@
+"""
+Чтение каталога с реплик базы.
+
+Представления каталога, объявившие атрибут use_replica = True, читают
+модели lib_app с одной из реплик из LIBRARY_DB_REPLICAS. Всё остальное —
+запись, сессии, пользователи, выдача — идёт в основную базу (default).
+
+Чтение своих записей: после изменяющего запроса (POST, PUT, PATCH, DELETE —
+выдача, возврат, корзина, редактирование) в сессии запоминается срок
+LIBRARY_DB_PIN_SECONDS, и до его истечения все запросы этой сессии читают
+основную базу. Срок должен быть больше отставания реплик. Признак записи
+берётся по методу запроса, а не по db_for_write: Django спрашивает базу
+для записи и при чтении (get_or_create, связанные менеджеры).
+
+Под ASGI выбор базы так же действует и на асинхронный ORM: sync_to_async
+выполняет запросы с копией контекста, где установлен read_alias.
+
+Данные, которые кладутся в общий кэш (страницы, топ, фасеты, облако слов),
+читаются в блоке use_primary(): иначе отставшая реплика закрепила бы
+в кэше устаревшие данные под новой версией каталога.
+
+Настройки:
+    LIBRARY_DB_REPLICAS    — алиасы реплик из DATABASES (по умолчанию пусто —
+                             всё читается из default);
+    LIBRARY_DB_PIN_SECONDS — сколько секунд после записи сессия читает
+                             основную базу (по умолчанию 30).
+"""
+
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Приложения, модели которых можно читать с реплики
+REPLICA_APP_LABELS = {"lib_app"}
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+PIN_SESSION_KEY = "_lib_app_db_pinned_until"
+
+read_alias = ContextVar("lib_app_read_alias", default=None)
+
+
+def get_replicas():
+    return list(getattr(settings, "LIBRARY_DB_REPLICAS", []))
+
+
+def get_pin_seconds():
+    return getattr(settings, "LIBRARY_DB_PIN_SECONDS", 30)
+
+
+@contextmanager
+def use_primary():
+    """Чтение из основной базы внутри блока"""
+    token = read_alias.set(None)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+@contextmanager
+def use_replica(alias):
+    """Чтение моделей lib_app из реплики alias внутри блока"""
+    token = read_alias.set(alias)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias and model._meta.app_label in REPLICA_APP_LABELS:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы, связи между ними допустимы
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Включает чтение с реплики для представлений с use_replica = True
+    и закрепляет сессию за основной базой после записи.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.replica_previous = None
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.set(request.replica_previous)
+        self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        # Синхронный process_view выполняется в sync_to_async, и его токен
+        # ContextVar принадлежит другому контексту: восстанавливаем значение
+        request.replica_previous = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_alias.set(request.replica_previous)
+        await sync_to_async(self.pin)(request)
+        return response
+
+    def pin(self, request):
+        # Без реплик закреплять нечего, и сессию лишний раз не сохраняем
+        if (
+            request.method not in SAFE_METHODS
+            and hasattr(request, "session")
+            and get_replicas()
+        ):
+            request.session[PIN_SESSION_KEY] = time.time() + get_pin_seconds()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas = get_replicas()
+        view_class = getattr(view_func, "view_class", None)
+        if (
+            replicas
+            and getattr(view_class, "use_replica", False)
+            and request.method in SAFE_METHODS
+            and not self.is_pinned(request)
+        ):
+            request.replica_previous = read_alias.get()
+            read_alias.set(random.choice(replicas))
+
+    def is_pinned(self, request):
+        session = getattr(request, "session", None)
+        if session is None:
+            return False
+        return session.get(PIN_SESSION_KEY, 0) > time.time()
@@ -0,0 +1,127 @@
+"""
+Поиск по каталогу книг.
+
+Поиск вынесен в подключаемые бэкенды: вид выбирает бэкенд через
+get_search_backend() и получает обычный QuerySet, поэтому результаты
+работают со стандартной пагинацией ListView.
+
+Бэкенд задаётся настройкой LIBRARY_SEARCH_BACKEND (путь к классу).
+Если настройка не задана, бэкенд выбирается по типу базы данных:
+для SQLite — полнотекстовый индекс FTS5, для остальных — поиск по подстроке.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Lookup, Q
+from django.utils.module_loading import import_string
+
+from lib_app import fts
+from lib_app.models import Book, BookSearchIndex
+
+# Слова запроса: буквы, цифры и подчёркивание в любом алфавите
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class FullTextMatch(Lookup):
+    """Условие MATCH для виртуальной таблицы FTS5"""
+
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+BookSearchIndex._meta.get_field("document").register_lookup(FullTextMatch)
+
+
+# Наибольший символ Unicode: строки с префиксом p лежат в диапазоне [p, p + MAX_CHAR)
+MAX_CHAR = "\U0010ffff"
+
+
+def prefix_filter(field, prefix):
+    """
+    Условие «поле начинается с prefix» в виде диапазона, который
+    читается по обычному индексу (в отличие от LIKE 'prefix%' в SQLite).
+    Сравнение учитывает регистр, поэтому поле и префикс нормализуются
+    заранее (см. lib_app.models.search_key).
+    """
+    if not prefix:
+        return Q()
+    return Q(**{f"{field}__gte": prefix, f"{field}__lt": prefix + MAX_CHAR})
+
+
+class BaseSearchBackend:
+    """Базовый класс бэкенда поиска по каталогу"""
+
+    def search(self, queryset, query):
+        """
+        Возвращает queryset книг, отфильтрованный по строке запроса
+        и упорядоченный по релевантности.
+        """
+        raise NotImplementedError
+
+    def rebuild_index(self, using="default"):
+        """Полностью перестраивает поисковый индекс (если он есть)"""
+
+
+class SubstringSearchBackend(BaseSearchBackend):
+    """
+    Поиск по подстроке (LIKE) для баз данных без полнотекстового индекса.
+    Читает всю таблицу книг, поэтому годится только для небольших каталогов.
+    """
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query)
+            | Q(author_name__icontains=query)
+            | Q(isbn__icontains=query)
+            | Q(key_words__icontains=query)
+            | Q(short_description__icontains=query)
+        )
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """
+    Полнотекстовый поиск через виртуальную таблицу FTS5.
+
+    Таблица lib_app_book_fts ведётся триггерами базы данных (см. lib_app.fts),
+    поэтому индекс обновляется при любой записи в книги, в том числе
+    при массовых update().
+    """
+
+    def build_match_expression(self, query):
+        """
+        Превращает пользовательский ввод в безопасное выражение FTS5:
+        каждое слово берётся в кавычки и ищется по префиксу, все слова
+        должны встретиться в книге одновременно.
+        """
+        words = WORD_RE.findall(query)
+        return " ".join(f'"{word}"*' for word in words)
+
+    def search(self, queryset, query):
+        expression = self.build_match_expression(query)
+        if not expression:
+            return queryset.none()
+        # rank — встроенный столбец FTS5 (bm25), чем меньше, тем релевантнее
+        return queryset.filter(search_index__document__match=expression).order_by(
+            "search_index__rank", "author_name", "title", "pk"
+        )
+
+    def rebuild_index(self, using="default"):
+        fts.rebuild(connections[using])
+
+
+def get_search_backend(using=None):
+    """Возвращает экземпляр бэкенда поиска, подходящий для базы данных"""
+    backend_path = getattr(settings, "LIBRARY_SEARCH_BACKEND", None)
+    if backend_path:
+        return import_string(backend_path)()
+
+    using = using or router.db_for_read(Book)
+    if connections[using].vendor == "sqlite":
+        return SQLiteFTSSearchBackend()
+    return SubstringSearchBackend()
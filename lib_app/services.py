@@ -0,0 +1,232 @@
+"""
+Операции выдачи и возврата книг.
+
+Логика вынесена из представлений, чтобы её можно было вызывать
+из команд управления и бенчмарков, а не только из HTTP-запросов.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from lib_app import catalogue_cache, facets, leaderboard
+from lib_app.loans import get_loan_policy
+from lib_app.models import Book, BorrowedBook
+from user_app.models import CustomUser
+
+
+@dataclass
+class IssueResult:
+    """Итог выдачи книг из корзины"""
+
+    issued: list = field(default_factory=list)  # выданные книги
+    due_at: object = None  # самый ранний срок возврата выданных книг
+    not_issued: list = field(default_factory=list)  # уже недоступные книги
+
+
+@dataclass
+class ReturnItem:
+    """Результат возврата по одному отсканированному коду"""
+
+    RETURNED = "returned"
+    ALREADY_RETURNED = "already_returned"
+    NOT_FOUND = "not_found"
+
+    code: str  # номер выдачи или ISBN, как его ввели
+    kind: str  # "loan" или "isbn"
+    status: str = NOT_FOUND
+    loan_id: int = None
+    user_id: int = None
+    title: str = ""
+
+
+def adjust_loan_counters(deltas, issued=False):
+    """
+    Одним UPDATE меняет счётчик книг на руках у читателей: deltas —
+    {id читателя: на сколько изменить}. При issued=True те же значения
+    прибавляются и к общему числу выдач. Вызывается внутри транзакции
+    выдачи или возврата, поэтому счётчики не расходятся с записями о выдачах.
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    delta = Case(
+        *(When(pk=user_id, then=Value(n)) for user_id, n in deltas.items()),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    # Выдачи, созданные в обход сервиса (админка, импорт), счётчики не учитывают:
+    # не уходим ниже нуля, расхождение исправит repair_loan_counters
+    changes = {"active_loans_count": Greatest(F("active_loans_count") + delta, 0)}
+    if issued:
+        changes["total_loans_count"] = F("total_loans_count") + delta
+    CustomUser.objects.filter(pk__in=deltas).update(**changes)
+
+
+def actual_loan_counts():
+    """
+    Выражения для пересчёта счётчиков читателя по записям о выдачах:
+    {поле счётчика: коррелированный подзапрос COUNT}.
+    """
+
+    def loans_count(**filters):
+        loans = (
+            BorrowedBook.objects.filter(user=OuterRef("pk"), **filters)
+            .order_by()
+            .values("user")
+            .annotate(n=Count("id"))
+            .values("n")
+        )
+        return Coalesce(Subquery(loans), Value(0), output_field=IntegerField())
+
+    return {
+        "active_loans_count": loans_count(returned=False),
+        "total_loans_count": loans_count(),
+    }
+
+
+def issue_books_from_cart(cart):
+    """
+    Выдаёт читателю все доступные книги из корзины одной транзакцией:
+    книги занимаются через Book.objects.claim() (условный UPDATE),
+    один bulk_create создаёт записи о выдаче со сроком возврата по политике
+    выдачи (lib_app.loans), счётчики читателя
+    и топ выдаваемых книг обновляются, затем корзина очищается.
+    Если что-то упадёт посередине, транзакция откатится целиком.
+    """
+    result = IssueResult()
+    with transaction.atomic():
+        books = list(
+            cart.books.only(
+                "id", "title", "author_name", "available", "times_of_issued"
+            )
+        )
+        # Книги, недоступные уже при чтении, даже не пытаемся занять
+        claimed = Book.objects.claim(book.id for book in books if book.available)
+        for book in books:
+            (result.issued if book.id in claimed else result.not_issued).append(book)
+        # claim() увеличил times_of_issued на единицу в базе, повторяем это в топе
+        leaderboard.record_issued(
+            {
+                "id": book.id,
+                "title": book.title,
+                "author_name": book.author_name,
+                "times_of_issued": book.times_of_issued + 1,
+            }
+            for book in result.issued
+        )
+
+        # bulk_create обходит BorrowedBook.save(): срок возврата ставим здесь
+        policy = get_loan_policy()
+        now = timezone.now()
+        loans = BorrowedBook.objects.bulk_create(
+            BorrowedBook(
+                user_id=cart.user_id,
+                book_id=book.id,
+                due_at=policy.get_due_at(cart.user, book, now),
+            )
+            for book in result.issued
+        )
+        result.due_at = min((loan.due_at for loan in loans), default=None)
+        adjust_loan_counters({cart.user_id: len(result.issued)}, issued=True)
+        if result.issued:
+            # Доступность книг в фасетах и страницах каталога устарела
+            facets.shift_available(len(result.issued))
+            catalogue_cache.bump_version()
+        cart.books.clear()
+    return result
+
+
+def return_books(loan_ids=(), isbns=()):
+    """
+    Закрывает много выдач одной транзакцией и возвращает результат по каждому
+    коду в порядке ввода. Выдачи ищутся одним запросом по номерам выдач
+    и по ISBN книг; по одному ISBN закрывается самая ранняя открытая выдача
+    (повторный скан того же ISBN закрывает следующий экземпляр).
+    Запись идёт тремя UPDATE: по выдачам, по книгам и по счётчикам читателей.
+    """
+    items = [ReturnItem(code=str(loan_id), kind="loan") for loan_id in loan_ids]
+    items += [ReturnItem(code=isbn, kind="isbn") for isbn in isbns]
+    if not items:
+        return items
+
+    with transaction.atomic():
+        # На серверных СУБД найденные выдачи блокируются до конца транзакции
+        open_loans = list(
+            BorrowedBook.objects.select_for_update()
+            .filter(returned=False)
+            .filter(Q(id__in=loan_ids) | Q(book__isbn__in=isbns))
+            .order_by("borrowed_at", "id")
+            .values("id", "user_id", "book_id", "book__isbn", "book__title")
+        )
+        by_id = {loan["id"]: loan for loan in open_loans}
+        by_isbn = {}
+        for loan in open_loans:
+            by_isbn.setdefault(loan["book__isbn"], []).append(loan)
+
+        closing = {}
+        for item in items:
+            if item.kind == "loan":
+                loan = by_id.get(int(item.code))
+                if loan is not None and loan["id"] in closing:
+                    # Тот же номер выдачи отсканирован повторно
+                    item.status = ReturnItem.ALREADY_RETURNED
+                    continue
+            else:
+                candidates = [
+                    loan
+                    for loan in by_isbn.get(item.code, [])
+                    if loan["id"] not in closing
+                ]
+                loan = candidates[0] if candidates else None
+            if loan is None:
+                continue
+            closing[loan["id"]] = loan
+            item.status = ReturnItem.RETURNED
+            item.loan_id = loan["id"]
+            item.user_id = loan["user_id"]
+            item.title = loan["book__title"]
+
+        # Номера выдач, которые существуют, но уже закрыты
+        missing = [
+            int(item.code)
+            for item in items
+            if item.kind == "loan" and item.status == ReturnItem.NOT_FOUND
+        ]
+        if missing:
+            closed = set(
+                BorrowedBook.objects.filter(id__in=missing, returned=True).values_list(
+                    "id", flat=True
+                )
+            )
+            for item in items:
+                if item.status == ReturnItem.NOT_FOUND and item.kind == "loan":
+                    if int(item.code) in closed:
+                        item.status = ReturnItem.ALREADY_RETURNED
+
+        if closing:
+            BorrowedBook.objects.filter(id__in=closing, returned=False).update(
+                returned=True, returned_at=timezone.now()
+            )
+            Book.objects.filter(
+                id__in={loan["book_id"] for loan in closing.values()}
+            ).update(available=True, updated_at=timezone.now())
+            returned_by = Counter(loan["user_id"] for loan in closing.values())
+            adjust_loan_counters({user_id: -n for user_id, n in returned_by.items()})
+            facets.shift_available(-len({loan["book_id"] for loan in closing.values()}))
+            catalogue_cache.bump_version()
+    return items
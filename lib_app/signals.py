@@ -0,0 +1,113 @@
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from lib_app import (
+    cart_cache,
+    catalogue_cache,
+    facets,
+    fts,
+    keywords,
+    leaderboard,
+    sqlite,
+)
+from lib_app.models import Author, Book, Cart, Publisher
+
+
+@receiver(pre_delete, sender=Author)
+def clear_author_name(sender, instance, **kwargs):
+    """
+    При удалении автора у книг обнуляется author (SET_NULL),
+    поэтому заодно очищаем копию имени автора в книгах.
+    """
+    instance.books.update(author_name="", updated_at=timezone.now())
+    leaderboard.invalidate_top_books()
+    facets.invalidate()
+    catalogue_cache.bump_version()
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, created, **kwargs):
+    """Имя автора в топе книг главной страницы и в фасетах могло устареть"""
+    if not created:
+        leaderboard.invalidate_top_books()
+        facets.invalidate()
+    catalogue_cache.bump_version()
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        leaderboard.change_books_total(1)
+    else:
+        leaderboard.invalidate_top_books([instance.pk])
+    facets.invalidate()
+    catalogue_cache.bump_version()
+
+    # Разбираем key_words в связи с ключевыми словами
+    if update_fields is None or "key_words" in update_fields:
+        if created:
+            if instance.key_words:
+                keywords.sync_book_keywords([instance])
+        elif keywords.book_keywords_changed(instance):
+            keywords.sync_book_keywords([instance])
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    leaderboard.change_books_total(-1)
+    leaderboard.invalidate_top_books([instance.pk])
+    keywords.invalidate_cloud()
+    facets.invalidate()
+    catalogue_cache.bump_version()
+
+
+@receiver(post_save, sender=Publisher)
+@receiver(post_delete, sender=Publisher)
+def publisher_changed(sender, instance, **kwargs):
+    """Название или состав издательств в фасетах каталога мог измениться"""
+    facets.invalidate()
+    catalogue_cache.bump_version()
+
+
+@receiver(connection_created)
+def apply_sqlite_profile(sender, connection, **kwargs):
+    """PRAGMA профиля SQLite для нового соединения (lib_app.sqlite)"""
+    sqlite.apply_pragmas(connection)
+
+
+@receiver(post_migrate)
+def restore_fts_triggers(sender, using, **kwargs):
+    """
+    SQLite пересоздаёт таблицу книг при изменении схемы и теряет триггеры
+    полнотекстового индекса — восстанавливаем их после миграций.
+    """
+    if sender.name == "lib_app":
+        fts.install_triggers(connections[using])
+        # Миграции могли изменить данные каталога
+        catalogue_cache.bump_version()
+
+
+@receiver(m2m_changed, sender=Cart.books.through)
+def cart_books_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сбрасывает закэшированный состав изменённых корзин (lib_app.cart_cache)"""
+    if reverse:
+        # Изменение со стороны книги (book.carts): сбрасываем затронутые корзины.
+        # Для clear список корзин известен только до удаления связей
+        if action == "pre_clear":
+            carts = instance.carts.all()
+        elif action in ("post_add", "post_remove"):
+            carts = Cart.objects.filter(pk__in=pk_set)
+        else:
+            return
+        cart_cache.invalidate_carts(carts.values_list("user_id", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        cart_cache.invalidate_carts([instance.user_id])
@@ -0,0 +1,67 @@
+"""
+Профиль соединений SQLite.
+
+При открытии каждого соединения с SQLite (сигнал connection_created,
+см. lib_app.signals) выполняются PRAGMA из выбранного профиля.
+Профиль рабочего сервера включает журнал WAL: читатели не ждут
+пишущую транзакцию и не получают "database is locked", а запись
+не блокирует чтение каталога. synchronous=NORMAL в режиме WAL
+безопасен для целостности базы и убирает fsync на каждой фиксации.
+
+Настройки:
+    LIBRARY_SQLITE_PROFILES — {имя профиля: {pragma: значение}};
+    LIBRARY_SQLITE_PROFILE  — имя используемого профиля
+                              (в config.settings — из переменной окружения
+                              LIBRARY_SQLITE_PROFILE).
+
+Режим журнала сохраняется в файле базы, остальные PRAGMA действуют
+только в пределах соединения.
+"""
+
+import re
+
+from django.conf import settings
+
+PRAGMA_NAME_RE = re.compile(r"[a-z_]+")
+
+# busy_timeout ставится первым, чтобы смена журнала ждала чужую блокировку
+PRAGMA_ORDER = ("busy_timeout", "journal_mode", "synchronous")
+
+
+def get_pragmas(profile=None):
+    """PRAGMA профиля в порядке выполнения"""
+    profile = profile or getattr(settings, "LIBRARY_SQLITE_PROFILE", None)
+    if not profile:
+        return {}
+    profiles = getattr(settings, "LIBRARY_SQLITE_PROFILES", {})
+    pragmas = profiles[profile]
+    ordered = {name: pragmas[name] for name in PRAGMA_ORDER if name in pragmas}
+    ordered.update(pragmas)
+    return ordered
+
+
+def apply_pragmas(connection, pragmas=None):
+    """
+    Выполняет PRAGMA на соединении Django. Запросы идут напрямую через
+    драйвер, мимо execute_wrapper: учёт запросов страниц их не видит.
+    """
+    if connection.vendor != "sqlite":
+        return
+    if pragmas is None:
+        pragmas = get_pragmas()
+    for name, value in pragmas.items():
+        if not PRAGMA_NAME_RE.fullmatch(name):
+            raise ValueError(f"Недопустимое имя PRAGMA: {name!r}")
+        if not isinstance(value, int) and not PRAGMA_NAME_RE.fullmatch(str(value)):
+            raise ValueError(f"Недопустимое значение PRAGMA {name}: {value!r}")
+        connection.connection.execute(f"PRAGMA {name} = {value}")
+
+
+def read_pragmas(connection, names):
+    """Текущие значения PRAGMA соединения: {имя: значение}"""
+    connection.ensure_connection()
+    return {
+        name: connection.connection.execute(f"PRAGMA {name}").fetchone()[0]
+        for name in names
+        if PRAGMA_NAME_RE.fullmatch(name)
+    }
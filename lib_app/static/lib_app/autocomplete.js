@@ -0,0 +1,74 @@
+// Автодополнение для списков с атрибутом data-autocomplete-url
+// (виджет lib_app.widgets.AutocompleteSelect). Над списком появляется
+// поле ввода; по введённому началу названия варианты списка
+// подгружаются из JSON-точки: {"results": [{"id": ..., "text": ...}], "more": bool}
+(function () {
+    "use strict";
+
+    var DELAY_MS = 250;
+
+    function option(value, text) {
+        var element = document.createElement("option");
+        element.value = value;
+        element.textContent = text;
+        return element;
+    }
+
+    function setup(select) {
+        var input = document.createElement("input");
+        input.type = "search";
+        input.className = "form-control mb-1";
+        input.placeholder = "Начните вводить название…";
+        input.autocomplete = "off";
+        select.parentNode.insertBefore(input, select);
+
+        var timer = null;
+        var request = 0;
+
+        function load() {
+            var current = request += 1;
+            var url = select.dataset.autocompleteUrl + "?q=" + encodeURIComponent(input.value);
+            fetch(url, {credentials: "same-origin", headers: {"Accept": "application/json"}})
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    if (current !== request) {
+                        return;  // пришёл ответ на устаревший ввод
+                    }
+                    var selected = select.options[select.selectedIndex];
+                    var empty = select.querySelector('option[value=""]');
+                    select.innerHTML = "";
+                    if (empty) {
+                        select.appendChild(empty);
+                    }
+                    if (selected && selected.value) {
+                        select.appendChild(selected);
+                    }
+                    data.results.forEach(function (item) {
+                        if (!selected || String(item.id) !== selected.value) {
+                            select.appendChild(option(item.id, item.text));
+                        }
+                    });
+                    if (data.more) {
+                        var more = option("", "… уточните запрос");
+                        more.disabled = true;
+                        select.appendChild(more);
+                    }
+                });
+        }
+
+        input.addEventListener("input", function () {
+            clearTimeout(timer);
+            timer = setTimeout(load, DELAY_MS);
+        });
+        select.addEventListener("focus", function () {
+            if (!select.dataset.autocompleteLoaded) {
+                select.dataset.autocompleteLoaded = "1";
+                load();
+            }
+        });
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        document.querySelectorAll("select[data-autocomplete-url]").forEach(setup);
+    });
+})();
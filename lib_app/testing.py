@@ -0,0 +1,76 @@
+"""
+Помощники для тестов: запуск тестов с отдельным кэшем и проверка
+бюджета SQL-запросов представлений.
+"""
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from lib_app.middleware import QueryRecorder, get_query_budget
+from lib_app.tiered_cache import TieredCache
+
+
+def get_test_caches(caches):
+    """
+    CACHES для тестов: те же алиасы, но общие кэши (файловый, Redis)
+    заменены кэшем в памяти. Двухуровневый кэш остаётся двухуровневым.
+    """
+    backend_path = f"{TieredCache.__module__}.{TieredCache.__name__}"
+    return {
+        alias: (
+            config
+            if config["BACKEND"] == backend_path
+            else {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": f"test:{alias}",
+            }
+        )
+        for alias, config in caches.items()
+    }
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Тесты со своим кэшем в памяти процесса: cache.clear() в тестах
+    не стирает файловый кэш, общий с запущенным сайтом.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.caches_override = override_settings(
+            CACHES=get_test_caches(settings.CACHES)
+        )
+        self.caches_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.caches_override.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetTestMixin:
+    """
+    Примесь к TestCase. assertWithinQueryBudget() выполняет запрос тестовым
+    клиентом и проверяет, что представление уложилось в свой query_budget
+    и не выполнило один и тот же запрос много раз (N+1).
+    """
+
+    def assertWithinQueryBudget(self, method, url, *args, **kwargs):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = getattr(self.client, method)(url, *args, **kwargs)
+
+        budget = get_query_budget(response.resolver_match)
+        self.assertIsNotNone(budget, f"У представления {url} не объявлен query_budget")
+        queries = "\n".join(
+            f"{n} × {sql}" for sql, n in recorder.statements.most_common()
+        )
+        self.assertLessEqual(
+            recorder.count,
+            budget,
+            f"{url}: {recorder.count} SQL-запросов при бюджете {budget}:\n{queries}",
+        )
+        self.assertEqual(
+            recorder.repeated(), {}, f"{url}: повторяющиеся запросы (N+1):\n{queries}"
+        )
+        return response
@@ -1,3 +1,2142 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import re
+import threading
+from io import BytesIO, StringIO
+from tempfile import NamedTemporaryFile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import Permission
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count, F
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from lib_app import (
+    cart_cache,
+    catalogue_cache,
+    facets,
+    fts,
+    importer,
+    jobs,
+    keywords,
+    leaderboard,
+    loadtest,
+    search,
+    tiered_cache,
+    views,
+)
+from lib_app.isbn import InvalidISBN, normalize_isbn
+from lib_app.loans import LoanPolicy
+from lib_app.middleware import QueryRecorder
+from lib_app.routers import PIN_SESSION_KEY, use_replica
+from lib_app.models import Author, Book, BorrowedBook, Cart, Job, Keyword, Publisher
+from lib_app.pagination import KeysetPaginator
+from lib_app.search import prefix_filter
+from lib_app.sqlite import apply_pragmas, get_pragmas, read_pragmas
+from lib_app.services import (
+    IssueResult,
+    ReturnItem,
+    issue_books_from_cart,
+    return_books,
+)
+from lib_app.testing import QueryBudgetTestMixin
+from user_app.models import CustomUser
+from user_app.views import UserListView
+
+
+def create_reader(n):
+    return CustomUser.objects.create_user(
+        email=f"reader{n}@example.com",
+        full_name=f"Читатель {n}",
+        date_of_birth=date(2000, 1, 1),
+    )
+
+
+class BookClaimTests(TestCase):
+    def test_claim_skips_unavailable_books(self):
+        free = Book.objects.create(title="Свободная")
+        taken = Book.objects.create(title="Выданная", available=False)
+
+        claimed = Book.objects.claim([free.id, taken.id])
+
+        self.assertEqual(claimed, {free.id})
+        free.refresh_from_db()
+        taken.refresh_from_db()
+        self.assertFalse(free.available)
+        self.assertEqual(free.times_of_issued, 1)
+        self.assertEqual(taken.times_of_issued, 0)
+
+    def test_claim_falls_back_to_one_book_at_a_time(self):
+        books = [Book.objects.create(title=f"Книга {n}") for n in range(5)]
+        Book.objects.filter(id__in=[books[1].id, books[3].id]).update(available=False)
+        ids = [book.id for book in books]
+
+        # Повтор id и несуществующая книга не должны ничего занять лишнего
+        with CaptureQueriesContext(connection) as queries:
+            claimed = Book.objects.claim(ids + [books[0].id, 10**6])
+
+        self.assertEqual(claimed, {books[0].id, books[2].id, books[4].id})
+        updates = [q for q in queries if q["sql"].startswith("UPDATE")]
+        # Общий UPDATE (откачен до точки сохранения) и по одному на каждый id
+        self.assertEqual(len(updates), 1 + 6)
+        # Откаченный общий UPDATE не увеличил счётчик выдач второй раз
+        self.assertEqual(
+            dict(Book.objects.values_list("id", "times_of_issued")),
+            dict(zip(ids, (1, 0, 1, 0, 1))),
+        )
+        self.assertFalse(Book.objects.filter(available=True).exists())
+
+    def test_claim_all_available_in_one_update(self):
+        books = [Book.objects.create(title=f"Книга {n}") for n in range(3)]
+        ids = [book.id for book in books]
+
+        with CaptureQueriesContext(connection) as queries:
+            claimed = Book.objects.claim(ids)
+
+        self.assertEqual(claimed, set(ids))
+        updates = [q for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertFalse(Book.objects.filter(available=True).exists())
+
+    def test_issue_reports_books_taken_after_cart_was_read(self):
+        reader = create_reader(1)
+        cart = Cart.objects.create(user=reader)
+        books = [Book.objects.create(title=f"Книга {i}") for i in range(3)]
+        cart.books.add(*books)
+        # Другая стойка успела выдать книгу, пока корзина лежала у читателя
+        Book.objects.filter(id=books[1].id).update(available=False)
+
+        result = issue_books_from_cart(cart)
+
+        self.assertEqual({b.id for b in result.issued}, {books[0].id, books[2].id})
+        self.assertEqual([b.id for b in result.not_issued], [books[1].id])
+        self.assertEqual(BorrowedBook.objects.filter(user=reader).count(), 2)
+        self.assertFalse(cart.books.exists())
+
+
+class IssueFromCartTests(TestCase):
+    """Выдача книг из корзины одной транзакцией"""
+
+    def setUp(self):
+        self.reader = create_reader(1)
+        self.cart = Cart.objects.create(user=self.reader)
+        self.books = [Book.objects.create(title=f"Книга {n}") for n in range(3)]
+        self.books[1].available = False
+        self.books[1].save()
+        self.cart.books.add(*self.books)
+
+    def test_partial_availability(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = issue_books_from_cart(self.cart)
+
+        self.assertEqual(
+            [b.id for b in result.issued], [self.books[0].id, self.books[2].id]
+        )
+        self.assertEqual([b.id for b in result.not_issued], [self.books[1].id])
+        self.assertIsNotNone(result.due_at)
+        self.assertEqual(
+            set(
+                BorrowedBook.objects.filter(user=self.reader).values_list(
+                    "book_id", flat=True
+                )
+            ),
+            {self.books[0].id, self.books[2].id},
+        )
+        self.assertEqual(
+            dict(Book.objects.values_list("id", "times_of_issued")),
+            {self.books[0].id: 1, self.books[1].id: 0, self.books[2].id: 1},
+        )
+        self.assertFalse(Book.objects.filter(available=True).exists())
+        self.assertFalse(self.cart.books.exists())
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.active_loans_count, 2)
+
+    def test_failed_step_rolls_back_everything(self):
+        for target in (
+            "lib_app.services.adjust_loan_counters",
+            "lib_app.models.BorrowedBook.objects.bulk_create",
+        ):
+            with self.subTest(target=target):
+                with self.captureOnCommitCallbacks() as callbacks:
+                    with mock.patch(target, side_effect=RuntimeError("сбой")):
+                        with self.assertRaises(RuntimeError):
+                            issue_books_from_cart(self.cart)
+
+                # Ни выдач, ни занятых книг, корзина на месте, кэши не тронуты
+                self.assertFalse(BorrowedBook.objects.exists())
+                self.assertEqual(
+                    set(
+                        Book.objects.filter(available=True).values_list("id", flat=True)
+                    ),
+                    {self.books[0].id, self.books[2].id},
+                )
+                self.assertFalse(Book.objects.filter(times_of_issued__gt=0).exists())
+                self.assertEqual(self.cart.books.count(), 3)
+                self.reader.refresh_from_db()
+                self.assertEqual(self.reader.active_loans_count, 0)
+                self.assertEqual(callbacks, [])
+
+    def test_bench_issue_checks_issued_count(self):
+        books = Book.objects.count()
+        call_command("bench_issue", "--sizes=2", "--repeat=1", stdout=StringIO())
+        with mock.patch(
+            "lib_app.management.commands.bench_issue.issue_books_from_cart",
+            return_value=IssueResult(),
+        ):
+            with self.assertRaisesMessage(CommandError, "Выдано книг: 0, ожидалось 2"):
+                call_command(
+                    "bench_issue", "--sizes=2", "--repeat=1", stdout=StringIO()
+                )
+        # Данные бенчмарка откатываются в обоих случаях
+        self.assertEqual(Book.objects.count(), books)
+
+
+class LoanCounterTests(TestCase):
+    def setUp(self):
+        self.reader = create_reader(1)
+        self.books = [Book.objects.create(title=f"Книга {n}") for n in range(3)]
+        cart = Cart.objects.create(user=self.reader)
+        cart.books.add(*self.books)
+        issue_books_from_cart(cart)
+
+    def assertCounters(self, active, total):
+        self.reader.refresh_from_db()
+        self.assertEqual(
+            (self.reader.active_loans_count, self.reader.total_loans_count),
+            (active, total),
+        )
+
+    def test_issue_and_return_update_counters(self):
+        self.assertCounters(active=3, total=3)
+        loan = BorrowedBook.objects.filter(user=self.reader).first()
+        return_books(loan_ids=[loan.pk, loan.pk])
+        self.assertCounters(active=2, total=3)
+
+    def test_repair_command(self):
+        CustomUser.objects.filter(pk=self.reader.pk).update(
+            active_loans_count=0, total_loans_count=7
+        )
+        call_command("repair_loan_counters", "--batch-size=1", stdout=StringIO())
+        self.assertCounters(active=3, total=3)
+
+
+class BatchReturnTests(TestCase):
+    """Пакетный возврат: номера выдач и ISBN в одном запросе"""
+
+    def setUp(self):
+        self.reader = create_reader(1)
+        self.staff = CustomUser.objects.create_user(
+            email="staff@example.com",
+            full_name="Библиотекарь",
+            date_of_birth=date(1990, 1, 1),
+            is_staff=True,
+        )
+        self.copies = [
+            Book.objects.create(title="Экземпляр", isbn="9780306406157")
+            for _ in range(2)
+        ]
+        self.other = Book.objects.create(title="Другая")
+        cart = Cart.objects.create(user=self.reader)
+        cart.books.add(*self.copies, self.other)
+        issue_books_from_cart(cart)
+        self.loans = {
+            loan.book_id: loan for loan in BorrowedBook.objects.filter(user=self.reader)
+        }
+        self.client.force_login(self.staff)
+
+    def post_json(self, payload):
+        return self.client.post(
+            reverse("return_books"),
+            json.dumps(payload),
+            content_type="application/json",
+        )
+
+    def test_isbns_and_loan_numbers(self):
+        other_loan = self.loans[self.other.pk]
+        response = self.client.post(
+            reverse("return_books"),
+            {
+                "loan_ids": f"{other_loan.pk} {other_loan.pk} 999999",
+                # ISBN-10, ISBN-13 с дефисами и без: один и тот же код
+                "isbns": "0-306-40615-2\n978-0-306-40615-7\n9780306406157\n12345",
+            },
+        )
+
+        items = response.context["results"]
+        self.assertEqual(
+            [item.status for item in items],
+            [
+                ReturnItem.RETURNED,
+                ReturnItem.ALREADY_RETURNED,
+                ReturnItem.NOT_FOUND,
+                ReturnItem.RETURNED,
+                ReturnItem.RETURNED,
+                ReturnItem.NOT_FOUND,
+                ReturnItem.NOT_FOUND,
+            ],
+        )
+        # Повторный скан ISBN закрывает следующий экземпляр
+        self.assertEqual(
+            {items[3].loan_id, items[4].loan_id},
+            {self.loans[book.pk].pk for book in self.copies},
+        )
+        self.assertFalse(BorrowedBook.objects.filter(returned=False).exists())
+        self.assertFalse(Book.objects.filter(available=False).exists())
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.active_loans_count, 0)
+
+    def test_closed_loan_is_already_returned(self):
+        loan = self.loans[self.other.pk]
+        return_books(loan_ids=[loan.pk])
+        (item,) = return_books(loan_ids=[loan.pk])
+        self.assertEqual(item.status, ReturnItem.ALREADY_RETURNED)
+
+    def test_json_response(self):
+        loan = self.loans[self.other.pk]
+        response = self.post_json({"loan_ids": [loan.pk], "isbns": ["12345"]})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(
+            [(item["code"], item["kind"], item["status"]) for item in results],
+            [
+                (str(loan.pk), "loan", ReturnItem.RETURNED),
+                ("12345", "isbn", ReturnItem.NOT_FOUND),
+            ],
+        )
+        self.assertEqual(results[0]["title"], "Другая")
+
+    def test_bad_input_is_400(self):
+        loan = self.loans[self.other.pk]
+        for payload in (
+            {"loan_ids": str(loan.pk)},
+            {"loan_ids": 5},
+            {"loan_ids": [True]},
+            {"isbns": [["9780306406157"]]},
+            [loan.pk],
+            {},
+        ):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.post_json(payload).status_code, 400)
+        for loan_ids in ("²", "-1", str(10**30)):
+            with self.subTest(loan_ids=loan_ids):
+                response = self.client.post(
+                    reverse("return_books"), {"loan_ids": loan_ids}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("loan_ids", response.context["form"].errors)
+        self.assertEqual(self.post_json({"loan_ids": ["²"]}).status_code, 400)
+        self.assertFalse(BorrowedBook.objects.filter(returned=True).exists())
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = create_reader(1)
+        author = Author.objects.create(name="Автор")
+        self.books = [
+            Book.objects.create(title=f"Книга {n}", author=author, times_of_issued=n)
+            for n in range(8)
+        ]
+
+    def top_titles(self):
+        return [book["title"] for book in leaderboard.get_top_books()]
+
+    def test_issue_updates_cached_top(self):
+        self.assertEqual(
+            self.top_titles(), ["Книга 7", "Книга 6", "Книга 5", "Книга 4", "Книга 3"]
+        )
+        cart = Cart.objects.create(user=self.reader)
+        cart.books.add(self.books[1], self.books[2])
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(5):
+                cart.books.add(self.books[2])
+                issue_books_from_cart(cart)
+                Book.objects.filter(pk=self.books[2].pk).update(available=True)
+
+        with self.assertNumQueries(0):
+            top_titles = self.top_titles()
+        self.assertEqual(top_titles[:2], ["Книга 2", "Книга 7"])
+        self.assertEqual(
+            top_titles, [b["title"] for b in leaderboard.top_books_queryset()]
+        )
+
+    def test_books_total_follows_create_and_delete(self):
+        self.assertEqual(leaderboard.get_books_total(), 8)
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title="Новая")
+            self.books[0].delete()
+            Book.objects.create(title="Ещё одна")
+        with self.assertNumQueries(0):
+            self.assertEqual(leaderboard.get_books_total(), 9)
+
+    def test_renamed_book_leaves_top(self):
+        leaderboard.get_top_books()
+        self.books[7].title = "Новое название"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[7].save()
+        self.assertEqual(self.top_titles()[0], "Новое название")
+
+    def test_index_page_does_not_read_books(self):
+        self.client.get("/")
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.client.get("/")
+        self.assertFalse([sql for sql in recorder.statements if "lib_app_book" in sql])
+        self.assertContains(response, "Книга 7")
+
+
+class CartCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = create_reader(1)
+        self.staff = CustomUser.objects.create_superuser(
+            email="staff@example.com",
+            full_name="Библиотекарь",
+            date_of_birth=date(1990, 1, 1),
+        )
+        self.books = [Book.objects.create(title=f"Книга {n}") for n in range(3)]
+
+    def cart_ids(self):
+        return cart_cache.get_cart_book_ids(self.reader.pk)
+
+    def post(self, name, *args):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse(name, args=args))
+
+    def test_catalogue_reads_cart_once(self):
+        self.client.force_login(self.reader)
+        self.post("add_to_cart", self.books[0].pk)
+        # Добавление сменило версию корзины: первое чтение идёт в базу
+        self.cart_ids()
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.client.get(reverse("book_list"))
+        self.assertEqual(response.context["cart_book_ids"], {self.books[0].pk})
+        self.assertFalse([sql for sql in recorder.statements if "lib_app_cart" in sql])
+
+    def test_cart_changes_update_cache(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.cart_ids(), set())
+        self.post("add_to_cart", self.books[0].pk)
+        self.post("add_to_cart", self.books[1].pk)
+        self.post("add_to_cart", self.books[2].pk)
+        self.post("remove_from_cart", self.books[0].pk)
+        self.assertEqual(self.cart_ids(), {self.books[1].pk, self.books[2].pk})
+
+        self.client.force_login(self.staff)
+        self.post("staff_remove_from_cart", self.reader.pk, self.books[1].pk)
+        self.assertEqual(self.cart_ids(), {self.books[2].pk})
+        self.post("issue_books_from_cart", self.reader.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cart_ids(), set())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cart_ids(), set())
+
+    def test_cart_views_do_not_trust_stale_cache(self):
+        self.client.force_login(self.reader)
+        cart = Cart.objects.create(user=self.reader)
+        # Кэш отстаёт от базы, как память другого процесса при TieredCache:
+        # в кэше книга 0 лежит в корзине, книги 1 нет; в базе наоборот
+        cart.books.add(self.books[1])
+        _book_ids, version = cart_cache.get_cached(self.reader.pk)
+        cart_cache.store(self.reader.pk, version, frozenset([self.books[0].pk]))
+        self.assertEqual(self.cart_ids(), {self.books[0].pk})
+
+        self.post("add_to_cart", self.books[0].pk)
+        self.assertTrue(cart.books.filter(pk=self.books[0].pk).exists())
+
+        _book_ids, version = cart_cache.get_cached(self.reader.pk)
+        cart_cache.store(self.reader.pk, version, frozenset())
+        self.assertEqual(self.cart_ids(), set())
+        response = self.client.post(
+            reverse("remove_from_cart", args=(self.books[1].pk,)), follow=True
+        )
+        self.assertFalse(cart.books.filter(pk=self.books[1].pk).exists())
+        self.assertContains(response, "удалена из корзины")
+
+        response = self.client.post(
+            reverse("remove_from_cart", args=(self.books[1].pk,)), follow=True
+        )
+        self.assertContains(response, "не была в вашей корзине")
+
+    def test_change_during_read_does_not_leave_stale_entry(self):
+        cart = Cart.objects.create(user=self.reader)
+        # Запрос взял версию и прочитал пустую корзину...
+        book_ids, version = cart_cache.get_cached(self.reader.pk)
+        self.assertIsNone(book_ids)
+        stale = frozenset(
+            Cart.books.through.objects.filter(cart=cart).values_list(
+                "book_id", flat=True
+            )
+        )
+        # ...тем временем другая транзакция добавила книгу...
+        with self.captureOnCommitCallbacks(execute=True):
+            cart.books.add(self.books[0])
+        # ...и только потом запрос сохранил прочитанное
+        cart_cache.store(self.reader.pk, version, stale)
+
+        self.assertEqual(self.cart_ids(), {self.books[0].pk})
+
+    def test_changes_from_book_side_reset_cache(self):
+        cart = Cart.objects.create(user=self.reader)
+        cart.books.add(self.books[0])
+        self.assertEqual(self.cart_ids(), {self.books[0].pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[0].carts.clear()
+        self.assertEqual(self.cart_ids(), set())
+
+
+@skipUnless(connection.vendor == "sqlite", "индекс FTS5 есть только в SQLite")
+class SearchTests(TestCase):
+    """Полнотекстовый поиск: ранжирование и триггеры индекса"""
+
+    def setUp(self):
+        self.backend = search.SQLiteFTSSearchBackend()
+
+    def found(self, query):
+        return list(self.backend.search(Book.objects.all(), query))
+
+    def indexed_ids(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT rowid FROM {fts.FTS_TABLE} ORDER BY rowid")
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_results_ordered_by_rank(self):
+        # По алфавиту автора первой была бы книга, где слово встречается
+        # один раз в длинном описании; выше должна быть книга с ним в названии
+        passing = Book.objects.create(
+            title="Путешествие",
+            author=Author.objects.create(name="Аксаков"),
+            short_description="Долгая дорога через степь, леса, горы и реки "
+            "к городу, где путник впервые увидел море и остался там жить.",
+        )
+        exact = Book.objects.create(
+            title="Море", author=Author.objects.create(name="Янссон")
+        )
+        Book.objects.create(title="Степь", author=Author.objects.get(name="Аксаков"))
+
+        self.assertEqual(self.found("море"), [exact, passing])
+        # Слова ищутся по префиксу и все сразу
+        self.assertEqual(self.found("мор янс"), [exact])
+        self.assertEqual(self.found("!!!"), [])
+
+    def test_triggers_keep_index_in_sync(self):
+        author = Author.objects.create(name="Толстой")
+        book = Book.objects.create(title="Война и мир", author=author)
+        self.assertEqual(self.indexed_ids(), [book.pk])
+        self.assertEqual(self.found("война"), [book])
+
+        book.title = "Анна Каренина"
+        book.save()
+        self.assertEqual(self.found("война"), [])
+        self.assertEqual(self.found("каренина"), [book])
+
+        # Массовое обновление проходит мимо save(), но не мимо триггера
+        Book.objects.filter(pk=book.pk).update(key_words="роман")
+        self.assertEqual(self.found("роман"), [book])
+
+        author.name = "Лев Толстой"
+        author.save()
+        self.assertEqual(self.found("лев"), [book])
+
+        book.delete()
+        self.assertEqual(self.indexed_ids(), [])
+        self.assertEqual(self.found("каренина"), [])
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_superuser(
+            email="staff@example.com",
+            full_name="Библиотекарь",
+            date_of_birth=date(1990, 1, 1),
+        )
+        for name in ("Толстой Лев", "толстая  Татьяна", "Пушкин Александр"):
+            Author.objects.create(name=name)
+        cls.book = Book.objects.create(
+            title="Война и мир", author=Author.objects.get(name="Толстой Лев")
+        )
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_prefix_search_ignores_case(self):
+        response = self.client.get(reverse("author_autocomplete"), {"q": "ТОЛСТ"})
+        self.assertEqual(
+            [item["text"] for item in response.json()["results"]],
+            ["толстая  Татьяна", "Толстой Лев"],
+        )
+        self.assertFalse(response.json()["more"])
+
+    def test_book_form_renders_only_selected_author(self):
+        response = self.client.get(reverse("book_edit", args=(self.book.pk,)))
+        self.assertContains(response, "Толстой Лев")
+        self.assertContains(response, "data-autocomplete-url")
+        self.assertNotContains(response, "Пушкин")
+        response = self.client.get(
+            reverse("admin:lib_app_book_change", args=(self.book.pk,))
+        )
+        self.assertContains(response, reverse("author_autocomplete"))
+        self.assertNotContains(response, "Пушкин")
+
+    def test_tampered_value_rerenders_form(self):
+        for author in ("abc", "1.5", "0", str(10**30)):
+            with self.subTest(author=author):
+                response = self.client.post(
+                    reverse("book_add"), {"title": "Книга", "author": author}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("author", response.context["form"].errors)
+
+    def test_readers_have_no_access(self):
+        self.client.force_login(create_reader(1))
+        response = self.client.get(reverse("author_autocomplete"), {"q": "т"})
+        self.assertEqual(response.status_code, 403)
+
+
+class IsbnTests(TestCase):
+    def test_normalize(self):
+        for value in (
+            "0-306-40615-2",
+            "978-0-306-40615-7",
+            "ISBN 0306406152",
+            " 978 0 306 40615 7 ",
+        ):
+            self.assertEqual(normalize_isbn(value), "9780306406157")
+        self.assertEqual(normalize_isbn("0-8044-2957-x"), "9780804429573")
+        for value in ("0-306-40615-3", "9780306406158", "1234567890123", "12345"):
+            with self.assertRaises(InvalidISBN):
+                normalize_isbn(value)
+
+    def test_book_stores_canonical_isbn(self):
+        book = Book.objects.create(title="Книга", isbn="0-306-40615-2")
+        self.assertEqual(book.isbn, "9780306406157")
+        self.assertEqual(Book.objects.get(isbn="0306406152"), book)
+        with self.assertRaises(ValidationError):
+            Book.objects.create(title="Книга", isbn="0-306-40615-3")
+
+    def test_lookup_endpoint(self):
+        copies = [
+            Book.objects.create(title="Книга", isbn="9780306406157") for _ in range(2)
+        ]
+        response = self.client.get(reverse("book_by_isbn", args=("0-306-40615-2",)))
+        self.assertEqual(
+            [book["id"] for book in response.json()["books"]], [b.pk for b in copies]
+        )
+        response = self.client.get(reverse("book_by_isbn", args=("9780804429573",)))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("book_by_isbn", args=("12345",)))
+        self.assertEqual(response.status_code, 400)
+
+    def test_catalogue_search_by_isbn(self):
+        book = Book.objects.create(title="Книга", isbn="9780306406157")
+        Book.objects.create(title="Другая книга")
+        response = self.client.get(reverse("book_list"), {"q": "0-306-40615-2"})
+        self.assertEqual(list(response.context["object_list"]), [book])
+
+    def test_form_rejects_wrong_check_digit(self):
+        form = views.BookModelForm(data={"title": "Книга", "isbn": "978-0-306-40615-8"})
+        self.assertFalse(form.is_valid())
+        self.assertIn("isbn", form.errors)
+
+
+class KeywordTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def book_keywords(self, book):
+        return sorted(book.keywords.values_list("name", flat=True))
+
+    def test_parse(self):
+        self.assertEqual(
+            keywords.parse_keywords("Классика; классика ,\nВойна  1812,,"),
+            {"классика": "Классика", "война 1812": "Война 1812"},
+        )
+
+    def test_book_save_syncs_keywords(self):
+        book = Book.objects.create(
+            title="Война и мир", key_words="Классика, Война 1812"
+        )
+        self.assertEqual(self.book_keywords(book), ["Война 1812", "Классика"])
+        other = Book.objects.create(title="Анна Каренина", key_words="классика")
+        self.assertEqual(self.book_keywords(other), ["Классика"])
+
+        book.key_words = "Роман-эпопея"
+        book.save()
+        self.assertEqual(self.book_keywords(book), ["Роман-эпопея"])
+        self.assertEqual(Keyword.objects.count(), 3)
+
+    def test_cloud_counts_books(self):
+        for n in range(3):
+            Book.objects.create(
+                title=f"Книга {n}", key_words="Классика" if n else "Сказки"
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            cloud = keywords.get_keyword_cloud()
+        self.assertEqual(
+            [(item["name"], item["count"]) for item in cloud],
+            [("Классика", 2), ("Сказки", 1)],
+        )
+        with self.assertNumQueries(0):
+            keywords.get_keyword_cloud()
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title="Ещё", key_words="Сказки")
+        self.assertEqual(keywords.get_keyword_cloud()[0]["count"], 2)
+
+    def test_catalogue_keyword_filter(self):
+        book = Book.objects.create(title="Война и мир", key_words="Классика")
+        Book.objects.create(title="Детектив", key_words="Детектив")
+        response = self.client.get(reverse("book_list"), {"keyword": "КЛАССИКА"})
+        self.assertEqual(list(response.context["object_list"]), [book])
+        response = self.client.get(reverse("book_list"), {"keyword": "нет такого"})
+        self.assertEqual(list(response.context["object_list"]), [])
+
+    def test_tokenize_command(self):
+        books = [
+            Book.objects.create(title=f"Книга {n}", key_words=f"Слово {n % 2}")
+            for n in range(5)
+        ]
+        Book.keywords.through.objects.all().delete()
+        Keyword.objects.all().delete()
+        call_command("tokenize_keywords", "--batch-size=2", stdout=StringIO())
+        self.assertEqual(self.book_keywords(books[3]), ["Слово 1"])
+        self.assertEqual(Keyword.objects.count(), 2)
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.eksmo = Publisher.objects.create(name="Эксмо")
+        self.ast = Publisher.objects.create(name="АСТ")
+        tolstoy = Author.objects.create(name="Толстой")
+        chekhov = Author.objects.create(name="Чехов")
+        self.books = [
+            Book.objects.create(
+                title="Война и мир", author=tolstoy, publisher=self.eksmo, year=1869
+            ),
+            Book.objects.create(
+                title="Анна Каренина", author=tolstoy, publisher=self.ast, year=1877
+            ),
+            Book.objects.create(
+                title="Вишнёвый сад",
+                author=chekhov,
+                publisher=self.eksmo,
+                year=1904,
+                available=False,
+            ),
+        ]
+
+    def options(self, counts, name):
+        return [(option["value"], option["count"]) for option in counts[name]]
+
+    def test_counts_ignore_own_filter(self):
+        filters = facets.parse_filters({"publisher": str(self.eksmo.pk)})
+        with self.assertNumQueries(4):
+            counts = facets.count_facets(Book.objects.all(), filters)
+        # Фасет издательства не сужается собственным фильтром
+        self.assertEqual(
+            self.options(counts, "publisher"), [(self.eksmo.pk, 2), (self.ast.pk, 1)]
+        )
+        self.assertEqual(self.options(counts, "year"), [(1900, 1), (1860, 1)])
+        self.assertEqual(self.options(counts, "available"), [(True, 1), (False, 1)])
+        self.assertEqual(self.options(counts, "initial"), [("Т", 1), ("Ч", 1)])
+
+    def test_catalogue_summary_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = facets.get_catalogue_facets(Book.objects.all())
+        self.assertEqual(self.options(counts, "available"), [(True, 2), (False, 1)])
+        with self.assertNumQueries(0):
+            facets.get_catalogue_facets(Book.objects.all())
+
+        # Выдача и возврат поправляют сводку без пересчёта
+        reader = create_reader(1)
+        cart = Cart.objects.create(user=reader)
+        cart.books.add(self.books[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            issue_books_from_cart(cart)
+        with self.assertNumQueries(0):
+            counts = facets.get_catalogue_facets(Book.objects.all())
+        self.assertEqual(self.options(counts, "available"), [(True, 1), (False, 2)])
+        with self.captureOnCommitCallbacks(execute=True):
+            return_books(
+                loan_ids=list(BorrowedBook.objects.values_list("pk", flat=True))
+            )
+        with self.assertNumQueries(0):
+            counts = facets.get_catalogue_facets(Book.objects.all())
+        self.assertEqual(self.options(counts, "available"), [(True, 2), (False, 1)])
+        self.assertEqual(counts, facets.count_facets(Book.objects.all(), {}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title="Новая", publisher=self.ast)
+        counts = facets.get_catalogue_facets(Book.objects.all())
+        self.assertEqual(
+            self.options(counts, "publisher"), [(self.ast.pk, 2), (self.eksmo.pk, 2)]
+        )
+
+    def test_catalogue_filter(self):
+        response = self.client.get(
+            reverse("book_list"),
+            {"publisher": self.eksmo.pk, "year_from": 1900, "year_to": 1909},
+        )
+        self.assertEqual(list(response.context["object_list"]), [self.books[2]])
+        selected = [
+            option["label"]
+            for name in ("publisher", "year")
+            for option in response.context["facets"][name]
+            if option["selected"]
+        ]
+        self.assertEqual(selected, ["Эксмо", "1900-е"])
+
+        response = self.client.get(reverse("book_list"), {"initial": "т"})
+        self.assertEqual(len(response.context["object_list"]), 2)
+
+    def test_initial_matches_its_count_in_both_cases(self):
+        Book.objects.create(
+            title="Стихи", author=Author.objects.create(name="тэффи"), year=1910
+        )
+        counts = facets.count_facets(Book.objects.all(), {})
+        self.assertEqual(self.options(counts, "initial"), [("Т", 3), ("Ч", 1)])
+
+        response = self.client.get(reverse("book_list"), {"initial": "Т"})
+        self.assertEqual(len(response.context["object_list"]), 3)
+        option = response.context["facets"]["initial"][0]
+        self.assertEqual((option["value"], option["count"]), ("Т", 3))
+
+    def test_out_of_range_numbers_are_ignored(self):
+        for name in ("publisher", "year_from", "year_to"):
+            for value in (str(10**20), str(-(10**20))):
+                with self.subTest(name=name, value=value):
+                    response = self.client.get(reverse("book_list"), {name: value})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.context["object_list"]), 3)
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tiered_cache.reset_stats(caches["default"].location)
+
+    def test_tests_do_not_touch_shared_cache(self):
+        # TestRunner подменяет файловый кэш сайта кэшем в памяти
+        self.assertIsInstance(caches["shared"], LocMemCache)
+        self.assertIsInstance(caches["default"], tiered_cache.TieredCache)
+
+    def test_back_tier_refills_front(self):
+        backend = caches["default"]
+        cache.set("lib_app:test:key", 1)
+        backend.front.clear()
+        self.assertEqual(cache.get("lib_app:test:key"), 1)
+        self.assertEqual(cache.get("lib_app:test:key"), 1)
+        self.assertIsNone(cache.get("lib_app:test:other"))
+        stats = catalogue_cache.get_stats()["namespaces"]["lib_app:test"]
+        self.assertEqual(
+            (stats["front_hits"], stats["back_hits"], stats["misses"]), (1, 1, 1)
+        )
+
+        cache.set("lib_app:test:counter", 1)
+        self.assertEqual(cache.incr("lib_app:test:counter"), 2)
+        self.assertEqual(cache.get("lib_app:test:counter"), 2)
+
+    def test_version_bump_on_book_write(self):
+        book = Book.objects.create(title="Война и мир")
+        version = catalogue_cache.get_version()
+        loads = []
+        catalogue_cache.get_cached_object("book", book.pk, lambda: loads.append(1))
+        catalogue_cache.get_cached_object("book", book.pk, lambda: loads.append(1))
+        self.assertEqual(len(loads), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        self.assertGreater(catalogue_cache.get_version(), version)
+        catalogue_cache.get_cached_object("book", book.pk, lambda: loads.append(1))
+        self.assertEqual(len(loads), 2)
+
+    def test_anonymous_page_cached(self):
+        book = Book.objects.create(title="Война и мир")
+        self.client.get(reverse("book_detail", args=(book.pk,)))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("book_detail", args=(book.pk,)))
+        self.assertContains(response, "Война и мир")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book.title = "Анна Каренина"
+            book.save()
+        response = self.client.get(reverse("book_detail", args=(book.pk,)))
+        self.assertContains(response, "Анна Каренина")
+
+    def test_stats_view_for_staff(self):
+        url = reverse("cache_stats")
+        self.client.force_login(create_reader(1))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        staff = create_reader(2)
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("total", response.json()["stats"])
+
+
+@skipUnless(connection.vendor == "sqlite", "профиль соединений только для SQLite")
+class SqliteProfileTests(TestCase):
+    def test_profile_applied_on_connect(self):
+        pragmas = read_pragmas(connection, ["journal_mode", "synchronous"])
+        # synchronous=NORMAL — значение 1
+        self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1})
+
+    def test_busy_timeout_applied_first(self):
+        self.assertEqual(list(get_pragmas("production"))[0], "busy_timeout")
+
+    def test_apply_and_validate(self):
+        apply_pragmas(connection, {"cache_size": -1000})
+        self.assertEqual(read_pragmas(connection, ["cache_size"])["cache_size"], -1000)
+        apply_pragmas(connection, {"cache_size": get_pragmas()["cache_size"]})
+        with self.assertRaises(ValueError):
+            apply_pragmas(connection, {"cache_size": "1; DROP TABLE lib_app_book"})
+
+
+@override_settings(LIBRARY_DB_REPLICAS=["replica"])
+class ReplicaRouterTests(TestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+
+    def titles(self, response):
+        return [book.title for book in response.context["object_list"]]
+
+    def test_router(self):
+        with use_replica("replica"):
+            self.assertEqual(Book.objects.all().db, "replica")
+            self.assertEqual(CustomUser.objects.all().db, "default")
+        self.assertEqual(Book.objects.all().db, "default")
+
+    def test_read_your_writes(self):
+        self.client.force_login(create_reader(1))
+        book = Book.objects.create(title="В основной базе")
+        Book.objects.using("replica").create(title="На реплике")
+
+        response = self.client.get(reverse("book_list"))
+        self.assertEqual(self.titles(response), ["На реплике"])
+
+        # После записи сессия читает основную базу
+        self.client.post(reverse("add_to_cart", args=(book.pk,)))
+        response = self.client.get(reverse("book_list"))
+        self.assertEqual(self.titles(response), ["В основной базе"])
+
+        session = self.client.session
+        session[PIN_SESSION_KEY] = 0
+        session.save()
+        response = self.client.get(reverse("book_list"))
+        self.assertEqual(self.titles(response), ["На реплике"])
+
+    def test_cached_data_read_from_primary(self):
+        Book.objects.create(title="В основной базе")
+        with use_replica("replica"):
+            self.assertEqual(leaderboard.get_books_total(), 1)
+        # Страница для кэша анонимных посетителей тоже строится по основной базе
+        response = self.client.get(reverse("book_list"))
+        self.assertContains(response, "В основной базе")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(name="Толстой")
+        self.book = Book.objects.create(title="Война и мир", author=author)
+        self.other = Book.objects.create(title="Анна Каренина", author=author)
+
+    def revalidate(self, url, response):
+        return self.client.get(
+            url,
+            headers={
+                "if-none-match": response["ETag"],
+                "if-modified-since": response["Last-Modified"],
+            },
+        )
+
+    def test_catalogue_list(self):
+        url = reverse("book_list")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title="Воскресение")
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_book_detail(self):
+        url = reverse("book_detail", args=(self.book.pk,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        # Изменение другой книги не касается этой страницы
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        # Выдача меняет доступность книги (UPDATE мимо save)
+        reader = create_reader(1)
+        cart = Cart.objects.create(user=reader)
+        cart.books.add(self.book)
+        with self.captureOnCommitCallbacks(execute=True):
+            issue_books_from_cart(cart)
+        response = self.revalidate(url, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context["book"].available)
+
+    def test_reader_cart_changes_etag(self):
+        self.client.force_login(create_reader(1))
+        url = reverse("book_list")
+        # Первый ответ выдаёт cookie CSRF, он входит в ETag
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("add_to_cart", args=(self.book.pk,)))
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+
+class GenerateDataTests(TestCase):
+    """Генератор тестовых данных gen_user на маленьком объёме"""
+
+    options = {
+        "users": 12,
+        "staff": 1,
+        "authors": 5,
+        "publishers": 3,
+        "books": 30,
+        "loans": 60,
+        "carts": 0.25,
+        "seed": 3,
+        # Меньше объёма: проверяем и переходы между пачками
+        "batch_size": 7,
+    }
+
+    def generate(self):
+        call_command("gen_user", stdout=StringIO(), **self.options)
+
+    def snapshot(self):
+        """Сгенерированные данные без id, паролей и дат относительно «сейчас»"""
+        return {
+            "books": list(
+                Book.objects.order_by("pk").values_list(
+                    "title",
+                    "author_name",
+                    "publisher__name",
+                    "isbn",
+                    "year",
+                    "key_words",
+                    "available",
+                    "times_of_issued",
+                )
+            ),
+            "users": list(
+                CustomUser.objects.order_by("pk").values_list(
+                    "email",
+                    "full_name",
+                    "date_of_birth",
+                    "is_staff",
+                    "active_loans_count",
+                    "total_loans_count",
+                )
+            ),
+            "loans": list(
+                BorrowedBook.objects.order_by("pk").values_list(
+                    "book__isbn", "user__email", "returned"
+                )
+            ),
+            "carts": sorted(
+                Cart.books.through.objects.values_list(
+                    "cart__user__email", "book__isbn"
+                )
+            ),
+        }
+
+    def test_same_seed_same_data(self):
+        self.generate()
+        first = self.snapshot()
+        self.assertEqual(len(first["books"]), 30)
+        self.assertEqual(len(first["users"]), 13)
+        self.assertEqual(len(first["loans"]), 60)
+
+        CustomUser.objects.all().delete()
+        Book.objects.all().delete()
+        Author.objects.all().delete()
+        Publisher.objects.all().delete()
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_data_is_consistent(self):
+        self.generate()
+
+        out = StringIO()
+        call_command("repair_loan_counters", "--dry-run", stdout=out)
+        self.assertIn("Расходятся счётчики у 0.", out.getvalue())
+
+        # Книга недоступна ровно тогда, когда по ней есть открытая выдача
+        open_loans = list(
+            BorrowedBook.objects.filter(returned=False).values_list(
+                "book_id", flat=True
+            )
+        )
+        self.assertTrue(open_loans)
+        self.assertEqual(len(open_loans), len(set(open_loans)))
+        self.assertEqual(
+            set(open_loans),
+            set(Book.objects.filter(available=False).values_list("pk", flat=True)),
+        )
+        self.assertFalse(
+            BorrowedBook.objects.filter(
+                returned=True, returned_at__isnull=True
+            ).exists()
+        )
+        self.assertFalse(
+            Book.objects.annotate(n=Count("borrowedbook"))
+            .exclude(times_of_issued=F("n"))
+            .exists()
+        )
+        self.assertTrue(Cart.books.through.objects.exists())
+        self.assertFalse(
+            Cart.books.through.objects.filter(book__available=False).exists()
+        )
+
+    def test_seed_is_generated_once(self):
+        self.generate()
+        with self.assertRaises(CommandError):
+            self.generate()
+
+
+class LoadTestTests(TestCase):
+    def test_mix_and_summary(self):
+        mix = loadtest.parse_mix("search=0,add_to_cart=50", loadtest.PATRON_MIX)
+        self.assertEqual(mix["search"], 0)
+        self.assertEqual(mix["add_to_cart"], 50)
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix("issue=10", loadtest.PATRON_MIX)
+
+        samples = [("book_list", float(ms), True) for ms in range(1, 101)]
+        samples.append(("add_to_cart", 5.0, False))
+        results = loadtest.summarize(samples, duration=10)
+        self.assertEqual(results["book_list"]["count"], 100)
+        self.assertEqual(results["book_list"]["rps"], 10)
+        self.assertEqual(results["book_list"]["p50"], 51)
+        self.assertEqual(results["book_list"]["p99"], 100)
+        self.assertEqual(results["add_to_cart"]["errors"], 1)
+
+        baseline = {"book_list": dict(results["book_list"], p95=50, rps=20)}
+        self.assertEqual(
+            loadtest.compare(results, baseline),
+            {"book_list": {"p95": 92.0, "rps": -50.0}},
+        )
+
+    def test_patron_trims_cart_through_cart_cache(self):
+        reader = create_reader(1)
+        books = [Book.objects.create(title=f"Книга {n}") for n in range(3)]
+        cart = Cart.objects.create(user=reader)
+        cart.books.add(books[0], books[1])
+        cache.clear()
+        self.assertEqual(
+            cart_cache.get_cart_book_ids(reader.pk), {books[0].pk, books[1].pk}
+        )
+
+        # Замеряемый запрос не нужен: проверяется только уборка корзины
+        transport = mock.Mock()
+        transport.request.return_value = (302, [])
+        workload = mock.Mock(book_ids=[books[2].pk])
+        patron = loadtest.Patron(workload, transport, {}, seed=1)
+        patron.user = reader
+        patron.cart_limit = 2
+        patron.cart = [books[0].pk, books[1].pk]
+        with self.captureOnCommitCallbacks(execute=True):
+            patron.add_to_cart()
+
+        self.assertEqual(patron.cart, [books[1].pk, books[2].pk])
+        self.assertEqual(cart_cache.get_cart_book_ids(reader.pk), {books[1].pk})
+
+    def test_stored_baseline(self):
+        baseline = loadtest.load_baseline("default")
+        self.assertIn("book_list", baseline)
+        self.assertIn("issue_books_from_cart", baseline)
+
+
+class ImportTests(TestCase):
+    CSV = (
+        "title,author,publisher,isbn,year,key_words\n"
+        "Война и мир,Лев Толстой,Эксмо,0-306-40615-2,1869,роман; классика\n"
+        "Анна Каренина,лев  толстой,эксмо,978-3-16-148410-0,1877,роман\n"
+        ",Без названия,,,,\n"
+        "Повесть,Автор,,,не год,\n"
+        "Без ISBN,,,,,\n"
+    )
+
+    def setUp(self):
+        cache.clear()
+
+    def import_text(self, text, name="books.csv", **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            return importer.import_file(BytesIO(text.encode()), name, **options)
+
+    def test_csv_import(self):
+        leaderboard.get_books_total()
+        version = catalogue_cache.get_version()
+
+        stats = self.import_text(self.CSV, batch_size=2)
+
+        self.assertEqual((stats.read, stats.created, stats.failed), (5, 3, 2))
+        self.assertEqual([number for number, _ in stats.errors], [3, 4])
+        self.assertTrue(stats.errors[1][1].startswith("year:"))
+        # «лев  толстой» — тот же автор, «эксмо» — то же издательство
+        self.assertEqual(Author.objects.count(), 1)
+        self.assertEqual(Publisher.objects.count(), 1)
+        book = Book.objects.get(isbn="9780306406157")
+        self.assertEqual(book.author_name, "Лев Толстой")
+        self.assertEqual(book.author.search_name, "лев толстой")
+        self.assertEqual(
+            set(book.keywords.values_list("normalized", flat=True)),
+            {"роман", "классика"},
+        )
+        self.assertEqual(leaderboard.get_books_total(), 3)
+        self.assertNotEqual(catalogue_cache.get_version(), version)
+
+    def test_upsert_by_isbn(self):
+        author = Author.objects.create(name="Лев Толстой")
+        copies = [
+            Book.objects.create(title="Война и мир", isbn="0306406152", author=author)
+            for _ in range(2)
+        ]
+        old_updated_at = copies[0].updated_at
+
+        stats = self.import_text(
+            '{"title": "Война и мир. Том 1", "isbn": "9780306406157", '
+            '"author": "Лев Толстой", "key_words": "роман"}\n'
+            "не json\n",
+            name="books.jsonl",
+        )
+
+        self.assertEqual((stats.updated, stats.created, stats.failed), (1, 0, 1))
+        for book in Book.objects.filter(pk__in=[copy.pk for copy in copies]):
+            self.assertEqual(book.title, "Война и мир. Том 1")
+            self.assertGreater(book.updated_at, old_updated_at)
+            self.assertEqual(
+                list(book.keywords.values_list("name", flat=True)), ["роман"]
+            )
+
+        # Повторный импорт того же файла ничего не меняет
+        stats = self.import_text(
+            '{"title": "Война и мир. Том 1", "isbn": "0-306-40615-2", '
+            '"author": "Лев Толстой", "key_words": "роман"}',
+            name="books.jsonl",
+        )
+        self.assertEqual((stats.updated, stats.unchanged), (0, 1))
+
+        stats = self.import_text(
+            '{"title": "Другое", "isbn": "0306406152"}',
+            name="books.jsonl",
+            update=False,
+        )
+        self.assertEqual(stats.skipped, 1)
+        self.assertFalse(Book.objects.filter(title="Другое").exists())
+
+    def test_command(self):
+        with NamedTemporaryFile(suffix=".csv.gz") as file:
+            file.write(gzip.compress(self.CSV.encode()))
+            file.flush()
+            out, err = StringIO(), StringIO()
+            call_command("import_books", file.name, stdout=out, stderr=err)
+        self.assertIn("добавлено 3", out.getvalue())
+        self.assertIn("Запись 4: year:", err.getvalue())
+        self.assertEqual(Book.objects.count(), 3)
+
+    def test_upload_view(self):
+        staff = CustomUser.objects.create_user(
+            email="staff@example.com",
+            full_name="Библиотекарь",
+            date_of_birth=date(1990, 1, 1),
+            is_staff=True,
+        )
+        url = reverse("book_import")
+        upload = SimpleUploadedFile("books.csv", self.CSV.encode())
+
+        self.client.force_login(create_reader(1))
+        self.assertEqual(self.client.post(url, {"file": upload}).status_code, 403)
+
+        staff.user_permissions.add(
+            *Permission.objects.filter(codename__in=["add_book", "change_book"])
+        )
+        self.client.force_login(staff)
+        upload.seek(0)
+        response = self.client.post(url, {"file": upload, "update": "on"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["stats"].created, 3)
+        self.assertContains(response, "Запись 3: title:")
+
+        response = self.client.post(
+            url, {"file": SimpleUploadedFile("books.xlsx", b"data")}
+        )
+        self.assertFormError(
+            response.context["form"],
+            "file",
+            "Формат файла не распознан: ожидается .csv или .jsonl.",
+        )
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.reader = create_reader(1)
+        self.staff = CustomUser.objects.create_user(
+            email="staff@example.com",
+            full_name="Библиотекарь",
+            date_of_birth=date(1990, 1, 1),
+            is_staff=True,
+        )
+        author = Author.objects.create(name="Лев Толстой")
+        self.book = Book.objects.create(
+            title="Война и мир, том 1",
+            author=author,
+            isbn="0306406152",
+            key_words="роман; классика",
+        )
+        Book.objects.create(title="Без автора")
+        BorrowedBook.objects.create(user=self.reader, book=self.book)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse("export", args=[name]), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def test_books_csv_round_trip(self):
+        self.client.force_login(self.staff)
+        response, content = self.export("books")
+
+        self.assertIn("books-", response["Content-Disposition"])
+        rows = list(csv.DictReader(StringIO(content.decode())))
+        self.assertEqual(
+            [row["title"] for row in rows], ["Война и мир, том 1", "Без автора"]
+        )
+        self.assertEqual(rows[0]["author"], "Лев Толстой")
+        self.assertEqual(rows[0]["isbn"], "9780306406157")
+        self.assertEqual(rows[1]["publisher"], "")
+
+        # Выгрузку книг можно загрузить обратно: книга с ISBN не меняется
+        stats = importer.import_file(BytesIO(content), "books.csv")
+        self.assertEqual((stats.unchanged, stats.created), (1, 1))
+
+    def test_loans_jsonl_gzip(self):
+        self.client.force_login(self.staff)
+        response, content = self.export("loans", format="jsonl", gzip="1")
+
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        rows = [json.loads(line) for line in gzip.decompress(content).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["user_email"], "reader1@example.com")
+        self.assertEqual(rows[0]["isbn"], "9780306406157")
+        self.assertAlmostEqual(
+            parse_datetime(rows[0]["due_at"]),
+            BorrowedBook.objects.get().due_at,
+            delta=timedelta(milliseconds=1),
+        )
+        self.assertFalse(rows[0]["returned"])
+
+    def test_access_and_errors(self):
+        url = reverse("export", args=["users"])
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(url, {"format": "xml"}).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse("export", args=["carts"])).status_code, 404
+        )
+
+    def test_command(self):
+        with NamedTemporaryFile(suffix=".csv") as file:
+            call_command("export_data", "users", output=file.name, stderr=StringIO())
+            header, *rows = file.read().decode().splitlines()
+        self.assertNotIn("password", header)
+        self.assertEqual(len(rows), 2)
+
+    @override_settings(ROOT_URLCONF="config.urls_asgi")
+    async def test_asgi_streams_async_iterator(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(
+            reverse("export", args=["books"]), {"format": "jsonl"}
+        )
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(content.splitlines()), 2)
+
+
+@override_settings(ROOT_URLCONF="config.urls_asgi")
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tolstoy = Author.objects.create(name="Толстой")
+        self.books = [
+            Book.objects.create(title=f"Том {n}", author=tolstoy, year=1860 + n)
+            for n in range(12)
+        ]
+        self.books[0].key_words = "роман"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[0].save()
+
+    def titles(self, response):
+        return [book.title for book in response.context["object_list"]]
+
+    async def test_book_list(self):
+        response = await self.async_client.get(reverse("book_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.titles(response)), 10)
+        # Фасет по десятилетиям: 1870-е (2 книги), затем 1860-е (10 книг)
+        self.assertEqual(response.context["facets"]["year"][0]["count"], 2)
+
+        next_page = await self.async_client.get(
+            reverse("book_list"), {"after": response.context["page_obj"].next_cursor}
+        )
+        self.assertCountEqual(
+            self.titles(response) + self.titles(next_page),
+            [book.title for book in self.books],
+        )
+
+        response = await self.async_client.get(
+            reverse("book_list"), {"keyword": "Роман"}
+        )
+        self.assertEqual(self.titles(response), ["Том 0"])
+
+    async def test_out_of_range_facet_filters(self):
+        response = await self.async_client.get(
+            reverse("book_list"),
+            {"publisher": 10**20, "year_from": 10**20, "year_to": -(10**20)},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.titles(response)), 10)
+
+    async def test_same_context_as_sync_views(self):
+        user = await CustomUser.objects.acreate(
+            email="reader1@example.com",
+            full_name="Читатель 1",
+            date_of_birth=date(2000, 1, 1),
+        )
+        cart = await Cart.objects.acreate(user=user)
+        await cart.books.aadd(self.books[3])
+        await self.async_client.aforce_login(user)
+        with self.settings(ROOT_URLCONF="config.urls"):
+            await self.client.aforce_login(user)
+
+        for name, args, keys in (
+            ("index", (), ("total_books", "top_books")),
+            ("author_list", (), ("object_list",)),
+            ("book_list", (), ("object_list", "cart_book_ids", "keyword_cloud")),
+            ("book_detail", (self.books[0].pk,), ("object", "title")),
+        ):
+            url = reverse(name, args=args)
+            response = await self.async_client.get(url)
+            with self.settings(ROOT_URLCONF="config.urls"):
+                expected = await sync_to_async(self.client.get)(url)
+            self.assertEqual(response.status_code, 200)
+            for key in keys:
+                value, expected_value = response.context[key], expected.context[key]
+                if key == "object_list":
+                    value, expected_value = list(value), list(expected_value)
+                self.assertEqual(value, expected_value)
+            if name == "book_list":
+                self.assertEqual(response.context["cart_book_ids"], {self.books[3].pk})
+
+    async def test_no_blocking_cache_calls_in_event_loop(self):
+        in_loop = []
+
+        def guard(name):
+            method = getattr(LocMemCache, name)
+
+            def wrapper(backend, *args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    pass  # поток sync_to_async
+                else:
+                    in_loop.append(name)
+                return method(backend, *args, **kwargs)
+
+            return mock.patch.object(LocMemCache, name, wrapper)
+
+        user = await CustomUser.objects.acreate(
+            email="reader1@example.com",
+            full_name="Читатель 1",
+            date_of_birth=date(2000, 1, 1),
+        )
+        patches = [guard(name) for name in ("get", "set", "add", "delete", "touch")]
+        for patch in patches:
+            patch.start()
+        try:
+            # Страницы для гостя (кэш страниц, промах и попадание) и для читателя
+            for _ in range(2):
+                for url in (
+                    reverse("index"),
+                    reverse("book_list"),
+                    reverse("book_detail", args=(self.books[0].pk,)),
+                ):
+                    response = await self.async_client.get(url)
+                    self.assertEqual(response.status_code, 200)
+            await self.async_client.aforce_login(user)
+            response = await self.async_client.get(reverse("book_list"))
+            self.assertEqual(response.status_code, 200)
+        finally:
+            for patch in patches:
+                patch.stop()
+        self.assertEqual(in_loop, [])
+
+    async def test_missing_book(self):
+        response = await self.async_client.get(reverse("book_detail", args=(0,)))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(LIBRARY_QUERY_BUDGET_HEADER=True)
+    async def test_middleware_counts_async_queries(self):
+        response = await self.async_client.get(reverse("book_list"), {"q": "zz"})
+        count = int(response["X-SQL-Queries"].split(";")[0])
+        # Та же страница через WSGI, без кэша страницы
+        await sync_to_async(cache.clear)()
+        with self.settings(ROOT_URLCONF="config.urls"):
+            expected = await sync_to_async(self.client.get)(
+                reverse("book_list"), {"q": "zz"}
+            )
+        self.assertGreater(count, 0)
+        self.assertEqual(count, int(expected["X-SQL-Queries"].split(";")[0]))
+
+
+class ShortLoanPolicy(LoanPolicy):
+    """Политика для тестов: книги с ключевым словом «справочник» — на 1 день"""
+
+    def get_period(self, user, book):
+        if "справочник" in (book.key_words or ""):
+            return timedelta(days=1)
+        return super().get_period(user, book)
+
+
+class LoanDueDateTests(TestCase):
+    def setUp(self):
+        self.reader = create_reader(1)
+        self.staff = CustomUser.objects.create_user(
+            email="staff@example.com",
+            full_name="Библиотекарь",
+            date_of_birth=date(1990, 1, 1),
+            is_staff=True,
+        )
+
+    def overdue_loan(self, user, title, days):
+        loan = BorrowedBook.objects.create(
+            user=user, book=Book.objects.create(title=title, available=False)
+        )
+        BorrowedBook.objects.filter(pk=loan.pk).update(
+            due_at=timezone.now() - timedelta(days=days)
+        )
+        return loan
+
+    @override_settings(
+        LIBRARY_LOAN_PERIOD_DAYS=21,
+        LIBRARY_LOAN_POLICY="lib_app.tests.ShortLoanPolicy",
+    )
+    def test_issue_sets_due_date_by_policy(self):
+        book = Book.objects.create(title="Роман")
+        reference = Book.objects.create(title="Словарь", key_words="справочник")
+        cart = Cart.objects.create(user=self.reader)
+        cart.books.add(book, reference)
+
+        started = timezone.now()
+        result = issue_books_from_cart(cart)
+
+        due = dict(BorrowedBook.objects.values_list("book_id", "due_at"))
+        self.assertAlmostEqual(
+            due[book.pk], started + timedelta(days=21), delta=timedelta(minutes=1)
+        )
+        self.assertAlmostEqual(
+            due[reference.pk], started + timedelta(days=1), delta=timedelta(minutes=1)
+        )
+        self.assertEqual(result.due_at, due[reference.pk])
+
+    def test_save_sets_default_due_date(self):
+        loan = BorrowedBook.objects.create(
+            user=self.reader, book=Book.objects.create(title="Роман")
+        )
+        self.assertAlmostEqual(
+            loan.due_at,
+            loan.borrowed_at + timedelta(days=14),
+            delta=timedelta(seconds=1),
+        )
+        self.assertFalse(loan.is_overdue)
+
+    def test_overdue_report(self):
+        old = self.overdue_loan(self.reader, "Давняя", days=30)
+        recent = self.overdue_loan(self.reader, "Недавняя", days=2)
+        returned = self.overdue_loan(self.reader, "Возвращённая", days=40)
+        return_books(loan_ids=[returned.pk])
+        BorrowedBook.objects.create(
+            user=self.reader, book=Book.objects.create(title="В срок")
+        )
+
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(reverse("overdue_loans")).status_code, 403)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("overdue_loans"))
+        self.assertEqual(list(response.context["loans"]), [old, recent])
+        self.assertEqual(response.context["loans"][0].days_overdue, 30)
+
+    def test_scanner_reminds_in_batches(self):
+        other = create_reader(2)
+        for days in (10, 9, 8):
+            self.overdue_loan(self.reader, f"Книга {days}", days)
+        self.overdue_loan(other, "Книга читателя 2", 5)
+
+        out = StringIO()
+        call_command("scan_overdue_loans", "--dry-run", stdout=out)
+        self.assertIn("просроченных выдач 4, отправлено писем 0", out.getvalue())
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command("scan_overdue_loans", "--batch-size", "2", stdout=StringIO())
+        # Пачки по 2: выдачи первого читателя попали в две пачки
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ["reader1@example.com", "reader1@example.com", "reader2@example.com"],
+        )
+        self.assertIn("Книга 10", mail.outbox[0].body)
+        self.assertFalse(BorrowedBook.objects.filter(reminded_at=None).exists())
+
+        # Повторный запуск до истечения интервала напоминаний писем не шлёт
+        mail.outbox.clear()
+        call_command("scan_overdue_loans", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_failed_send_leaves_loans_unmarked(self):
+        self.overdue_loan(self.reader, "Книга", 3)
+        with mock.patch(
+            "lib_app.loans.send_mass_mail", side_effect=OSError("SMTP недоступен")
+        ):
+            with self.assertRaises(OSError):
+                call_command("scan_overdue_loans", stdout=StringIO())
+        self.assertFalse(BorrowedBook.objects.exclude(reminded_at=None).exists())
+
+
+class ConcurrentIssueTests(TransactionTestCase):
+    """Стресс-тест: много стоек одновременно выдают одни и те же книги"""
+
+    issuers = 8
+    books_count = 20
+
+    def test_book_is_never_issued_twice(self):
+        books = [
+            Book.objects.create(title=f"Книга {i}") for i in range(self.books_count)
+        ]
+        carts = []
+        for n in range(self.issuers):
+            cart = Cart.objects.create(user=create_reader(n))
+            cart.books.add(*books)
+            carts.append(cart)
+
+        barrier = threading.Barrier(self.issuers)
+        errors = []
+
+        def issue(cart):
+            try:
+                barrier.wait()
+                issue_books_from_cart(cart)
+            except Exception as exc:  # ошибка в потоке не должна потеряться
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=issue, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        loans = BorrowedBook.objects.values("book").annotate(n=Count("id"))
+        self.assertEqual(len(loans), self.books_count)
+        self.assertTrue(all(loan["n"] == 1 for loan in loans))
+        self.assertFalse(Book.objects.filter(available=True).exists())
+        self.assertFalse(Book.objects.exclude(times_of_issued=1).exists())
+
+
+@jobs.task("test_count_books", "Тест: посчитать книги")
+def count_books_task(marker=""):
+    return f"{marker}{Book.objects.count()}"
+
+
+@jobs.task("test_reclaimed", "Тест: задачу занимает другой воркер")
+def reclaimed_task():
+    Job.objects.filter(name="test_reclaimed").update(
+        attempts=F("attempts") + 1, locked_by="w2"
+    )
+    return "устаревший результат"
+
+
+@jobs.task("test_broken", "Тест: всегда падает")
+def broken_task():
+    raise RuntimeError("сломано")
+
+
+class JobTests(TransactionTestCase):
+    """Очередь фоновых задач; воркер выполняет задачи в потоках"""
+
+    def test_claim_hands_out_each_job_once(self):
+        queued = [jobs.enqueue("test_count_books") for _ in range(5)]
+        later = Job.objects.create(
+            name="test_count_books", run_after=timezone.now() + timedelta(hours=1)
+        )
+
+        first = Job.objects.claim("w1", limit=3)
+        second = Job.objects.claim("w2", limit=3)
+
+        self.assertEqual(first, [job.pk for job in queued[:3]])
+        self.assertEqual(second, [job.pk for job in queued[3:]])
+        self.assertEqual(Job.objects.claim("w3"), [])
+        running = Job.objects.filter(status=Job.RUNNING)
+        self.assertEqual(running.count(), 5)
+        self.assertFalse(running.exclude(attempts=1).exists())
+        self.assertEqual(Job.objects.get(pk=later.pk).status, Job.QUEUED)
+
+    def test_concurrent_claims_do_not_overlap(self):
+        for _ in range(20):
+            jobs.enqueue("test_count_books")
+        workers = 4
+        barrier = threading.Barrier(workers)
+        claimed = []
+        errors = []
+
+        def claim(n):
+            try:
+                barrier.wait()
+                while ids := Job.objects.claim(f"w{n}", limit=2):
+                    claimed.extend(ids)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim, args=(n,)) for n in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(claimed), 20)
+        self.assertEqual(len(set(claimed)), 20)
+
+    @override_settings(LIBRARY_JOB_RETRY_DELAY=10)
+    def test_failed_job_is_retried_then_failed(self):
+        job = jobs.enqueue("test_broken", max_attempts=2)
+
+        (job_id,) = Job.objects.claim("w")
+        self.assertEqual(jobs.execute_job(job_id), (job.pk, Job.QUEUED))
+        job.refresh_from_db()
+        self.assertIn("сломано", job.result)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=5))
+        # Повтор откладывается
+        self.assertEqual(Job.objects.claim("w"), [])
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        (job_id,) = Job.objects.claim("w")
+        self.assertEqual(jobs.execute_job(job_id), (job.pk, Job.FAILED))
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(LIBRARY_JOB_TIMEOUT=60)
+    def test_stale_job_is_requeued(self):
+        stale, alive = jobs.enqueue("test_count_books"), jobs.enqueue(
+            "test_count_books"
+        )
+        Job.objects.claim("w", limit=2)
+        long_ago = timezone.now() - timedelta(minutes=5)
+        Job.objects.update(started_at=long_ago, heartbeat_at=long_ago)
+        # Долгая задача, которую воркер ещё отмечает, не зависла
+        self.assertEqual(jobs.heartbeat([alive.pk], "w"), 1)
+
+        self.assertEqual(jobs.requeue_stale(), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by), (Job.QUEUED, ""))
+        self.assertEqual(Job.objects.get(pk=alive.pk).status, Job.RUNNING)
+
+    def test_late_result_does_not_overwrite_new_attempt(self):
+        job = jobs.enqueue("test_reclaimed")
+        Job.objects.claim("w1")
+
+        # Пока задача выполнялась, её сочли зависшей и занял другой воркер
+        self.assertEqual(jobs.execute_job(job.pk), (job.pk, Job.RUNNING))
+        job.refresh_from_db()
+        self.assertEqual((job.locked_by, job.attempts, job.result), ("w2", 2, ""))
+
+    def test_worker_runs_queue_in_thread_pool(self):
+        Book.objects.create(title="Книга")
+        done = [jobs.enqueue("test_count_books", marker=f"{n}:") for n in range(4)]
+        broken = jobs.enqueue("test_broken", max_attempts=1)
+
+        out = StringIO()
+        call_command(
+            "run_jobs", workers=2, mode="thread", once=True, poll=0.1, stdout=out
+        )
+
+        for n, job in enumerate(done):
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.DONE)
+            self.assertEqual(job.result, f"{n}:1")
+        broken.refresh_from_db()
+        self.assertEqual(broken.status, Job.FAILED)
+        self.assertIn("выполнено задач 4", out.getvalue())
+
+    def test_staff_page_enqueues_and_retries(self):
+        reader = create_reader(1)
+        staff = CustomUser.objects.create_user(
+            email="staff@example.com",
+            full_name="Библиотекарь",
+            date_of_birth=date(1990, 1, 1),
+            is_staff=True,
+        )
+        url = reverse("jobs")
+        self.client.force_login(reader)
+        self.assertEqual(
+            self.client.post(url, {"task": "test_count_books"}).status_code, 403
+        )
+
+        self.client.force_login(staff)
+        self.assertRedirects(self.client.post(url, {"task": "test_count_books"}), url)
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.status), ("test_count_books", Job.QUEUED))
+        self.assertEqual(self.client.post(url, {"task": "nope"}).status_code, 400)
+
+        Job.objects.filter(pk=job.pk).update(status=Job.FAILED, attempts=3)
+        for retry in ("abc", "²", str(10**30)):
+            response = self.client.post(url, {"retry": retry}, follow=True)
+            self.assertContains(response, "не завершилась ошибкой")
+        self.client.post(url, {"retry": job.pk})
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 0))
+
+        response = self.client.get(url)
+        self.assertContains(response, "test_count_books")
+        self.assertContains(response, "В очереди: 1")
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN есть только в SQLite")
+class KeysetPaginationTests(TestCase):
+    """Курсорная пагинация: переходы вперёд и назад, повреждённые курсоры"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Повторы имени автора и названия: порядок решает последнее поле ключа
+        authors = [Author.objects.create(name=name) for name in ("Б", "А", "В")]
+        for n in range(25):
+            Book.objects.create(title=f"Книга {n % 4}", author=authors[n % 3])
+        cls.expected = list(
+            Book.objects.order_by("author_name", "title", "pk").values_list(
+                "pk", flat=True
+            )
+        )
+
+    def make_paginator(self):
+        return KeysetPaginator(Book.objects.all(), ("author_name", "title", "pk"), 10)
+
+    def ids(self, page):
+        return [book.pk for book in page]
+
+    def test_forward_pages_cover_catalogue_in_order(self):
+        paginator = self.make_paginator()
+        first = paginator.page()
+        second = paginator.page(after=first.next_cursor)
+        third = paginator.page(after=second.next_cursor)
+
+        self.assertEqual(self.ids(first), self.expected[:10])
+        self.assertEqual(self.ids(second), self.expected[10:20])
+        self.assertEqual(self.ids(third), self.expected[20:])
+        self.assertFalse(first.has_previous())
+        self.assertTrue(second.has_previous() and second.has_next())
+        self.assertFalse(third.has_next())
+        self.assertIsNone(third.next_cursor)
+
+    def test_previous_cursor_returns_same_page(self):
+        paginator = self.make_paginator()
+        first = paginator.page()
+        second = paginator.page(after=first.next_cursor)
+        third = paginator.page(after=second.next_cursor)
+
+        back = paginator.page(before=third.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(second))
+        self.assertTrue(back.has_next())
+        back = paginator.page(before=back.previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(first))
+        self.assertFalse(back.has_previous())
+
+    def test_invalid_cursor_shows_first_page(self):
+        paginator = self.make_paginator()
+        cursor = paginator.page().next_cursor
+        other_length = KeysetPaginator(Book.objects.all(), ("pk",), 10).page()
+        for token in ("abc", cursor[:-1] + "x", other_length.next_cursor):
+            with self.subTest(token=token):
+                self.assertEqual(
+                    self.ids(paginator.page(after=token)), self.expected[:10]
+                )
+                self.assertEqual(
+                    self.ids(paginator.page(before=token)), self.expected[:10]
+                )
+
+    def test_book_list_view(self):
+        cache.clear()
+        response = self.client.get(reverse("book_list"))
+        page = response.context["page_obj"]
+        self.assertTrue(page.is_keyset)
+        self.assertEqual(self.ids(page), self.expected[:10])
+
+        response = self.client.get(reverse("book_list"), {"after": page.next_cursor})
+        self.assertEqual(self.ids(response.context["page_obj"]), self.expected[10:20])
+
+        response = self.client.get(reverse("book_list"), {"after": "tampered"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response.context["page_obj"]), self.expected[:10])
+
+
+class QueryPlanTests(TestCase):
+    """
+    Регрессионные тесты планов запросов списков: ни один список
+    не должен читать таблицу целиком (строка плана «SCAN <таблица>» без индекса).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_reader(1)
+        cls.staff = CustomUser.objects.create_user(
+            email="staff@example.com",
+            full_name="Библиотекарь",
+            date_of_birth=date(1990, 1, 1),
+            is_staff=True,
+        )
+        author = Author.objects.create(name="Лев Толстой")
+        cls.book = Book.objects.create(title="Война и мир", author=author)
+        BorrowedBook.objects.create(user=cls.reader, book=cls.book)
+
+    def make_view(self, view_class, user=None, query="", **kwargs):
+        request = RequestFactory().get("/", {"q": query} if query else {})
+        request.user = user or self.staff
+        view = view_class()
+        view.setup(request, **kwargs)
+        return view
+
+    def keyset_page(self, view, after=None):
+        paginator = KeysetPaginator(
+            view.get_queryset(), view.keyset_fields, view.paginate_by
+        )
+        return paginator.page_queryset(after_values=after)
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        full_scans = [
+            line for line in plan.splitlines() if re.search(r"\bSCAN \S+$", line)
+        ]
+        self.assertEqual(full_scans, [], f"Полный просмотр таблицы:\n{plan}")
+
+    def assertIndexOrdered(self, queryset):
+        plan = queryset.explain()
+        self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan, plan)
+
+    def test_book_list(self):
+        view = self.make_view(views.BookListView)
+        first_page = self.keyset_page(view)
+        next_page = self.keyset_page(view, after=["Лев Толстой", "Война и мир", 1])
+        for queryset in (first_page, next_page):
+            self.assertNoFullScan(queryset)
+            self.assertIndexOrdered(queryset)
+
+    def test_book_search(self):
+        view = self.make_view(views.BookListView, query="война")
+        self.assertNoFullScan(view.get_queryset()[: view.paginate_by])
+
+    def test_author_and_publisher_lists(self):
+        for view_class in (views.AuthorListView, views.PublisherListView):
+            view = self.make_view(view_class)
+            queryset = view.get_queryset()[: view.paginate_by]
+            self.assertNoFullScan(queryset)
+            self.assertIndexOrdered(queryset)
+
+    def test_borrowed_books_lists(self):
+        my_books = self.make_view(views.MyBorrowedBooksView, user=self.reader)
+        self.assertNoFullScan(self.keyset_page(my_books))
+        user_books = self.make_view(
+            views.UserBorrowedBooksListView, user_id=self.reader.pk
+        )
+        self.assertNoFullScan(self.keyset_page(user_books))
+
+    def test_borrowing_users_list(self):
+        view = self.make_view(views.BorrowingUsersListView)
+        for queryset in (
+            self.keyset_page(view),
+            self.keyset_page(view, after=["Читатель 1", self.reader.pk]),
+        ):
+            self.assertIn("user_active_borrowers_idx", queryset.explain())
+            self.assertIndexOrdered(queryset)
+
+    def test_overdue_loans(self):
+        view = self.make_view(views.OverdueLoansView)
+        for queryset in (
+            self.keyset_page(view),
+            self.keyset_page(view, after=[timezone.now(), 1]),
+        ):
+            self.assertIn("borrowed_open_by_due_idx", queryset.explain())
+            self.assertIndexOrdered(queryset)
+
+    def test_staff_lists(self):
+        for view_class in (
+            views.UsersWithCartView,
+            UserListView,
+        ):
+            self.assertNoFullScan(self.make_view(view_class).get_queryset())
+
+    def test_top_books(self):
+        top_books = leaderboard.top_books_queryset()
+        self.assertNoFullScan(top_books)
+        self.assertIndexOrdered(top_books)
+
+    def test_autocomplete(self):
+        for model in (Author, Publisher):
+            queryset = model.objects.filter(
+                prefix_filter("search_name", "лев")
+            ).order_by("search_name", "pk")[:21]
+            self.assertNoFullScan(queryset)
+            self.assertIndexOrdered(queryset)
+
+    def test_keyword_filter(self):
+        view = self.make_view(views.BookListView)
+        keyword = Keyword.objects.create(name="Классика")
+        view.request.GET = {"keyword": "классика"}
+        queryset = view.get_queryset()[: view.paginate_by]
+        self.assertNoFullScan(queryset)
+        self.assertIn("keyword_id", queryset.explain())
+
+    def test_isbn_lookup(self):
+        self.assertIn(
+            "book_isbn_idx", Book.objects.filter(isbn="9780306406157").explain()
+        )
+
+    def test_book_delete_check(self):
+        open_loans = BorrowedBook.objects.filter(book=self.book, returned=False)
+        self.assertIn("borrowed_open_by_book_idx", open_loans.explain())
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """
+    Страницы укладываются в свой query_budget. Данных заведено столько,
+    чтобы запрос на каждую строку списка (N+1) превысил порог повторов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_superuser(
+            email="staff@example.com",
+            full_name="Библиотекарь",
+            date_of_birth=date(1990, 1, 1),
+        )
+        cls.readers = [create_reader(n) for n in range(4)]
+        publishers = [
+            Publisher.objects.create(name=f"Издательство {n}") for n in range(4)
+        ]
+        authors = [Author.objects.create(name=f"Автор {n}") for n in range(4)]
+        cls.books = [
+            Book.objects.create(
+                title=f"Книга {n}",
+                author=authors[n % 4],
+                publisher=publishers[n % 4],
+                times_of_issued=n,
+            )
+            for n in range(12)
+        ]
+        for n, reader in enumerate(cls.readers):
+            Cart.objects.create(user=reader).books.add(*cls.books[n : n + 3])
+            for book in cls.books[n + 4 : n + 7]:
+                BorrowedBook.objects.create(user=reader, book=book)
+        # Просроченные выдачи для отчёта overdue_loans
+        BorrowedBook.objects.update(due_at=timezone.now() - timedelta(days=1))
+
+    def test_reader_pages(self):
+        self.client.force_login(self.readers[0])
+        for name, args in (
+            ("index", ()),
+            ("book_list", ()),
+            ("book_detail", (self.books[0].pk,)),
+            ("author_list", ()),
+            ("publisher_list", ()),
+            ("view_cart", ()),
+            ("my_borrowed_books", ()),
+        ):
+            with self.subTest(name=name):
+                self.assertWithinQueryBudget("get", reverse(name, args=args))
+
+    def test_staff_pages(self):
+        self.client.force_login(self.staff)
+        reader = self.readers[0]
+        for name, args in (
+            ("users_with_cart", ()),
+            ("borrowing_users_list", ()),
+            ("user_borrowed_books_detail", (reader.pk,)),
+            ("staff_view_user_cart", (reader.pk,)),
+            ("return_books", ()),
+            ("overdue_loans", ()),
+            ("jobs", ()),
+            ("book_edit", (self.books[0].pk,)),
+            ("user_list", ()),
+        ):
+            with self.subTest(name=name):
+                self.assertWithinQueryBudget("get", reverse(name, args=args))
+
+    def test_issue_and_return(self):
+        self.client.force_login(self.staff)
+        reader = self.readers[0]
+        self.assertWithinQueryBudget(
+            "post", reverse("issue_books_from_cart", args=(reader.pk,))
+        )
+        loan_ids = " ".join(
+            str(pk)
+            for pk in BorrowedBook.objects.filter(user=reader).values_list(
+                "pk", flat=True
+            )
+        )
+        self.assertWithinQueryBudget(
+            "post", reverse("return_books"), {"loan_ids": loan_ids}
+        )
+
+    def test_recorder_detects_repeated_queries(self):
+        recorder = QueryRecorder()
+        with recorder.record():
+            for book in Book.objects.all()[:5]:
+                book.author.name
+        self.assertEqual(list(recorder.repeated().values()), [5])
+
+    @override_settings(LIBRARY_QUERY_BUDGET_HEADER=True)
+    def test_middleware_reports_queries(self):
+        with self.assertNoLogs("lib_app.sql"):
+            response = self.client.get(reverse("index"))
+        self.assertRegex(response["X-SQL-Queries"], r"^\d+; time=[\d.]+ms; budget=5$")
+
+    def test_middleware_logs_over_budget(self):
+        with mock.patch.object(views.BookListView, "query_budget", 0):
+            with self.assertLogs("lib_app.sql", "WARNING") as logs:
+                self.client.get(reverse("book_list"))
+        self.assertIn("при бюджете 0", logs.output[0])
@@ -0,0 +1,163 @@
+"""
+Двухуровневый бэкенд кэша Django.
+
+Передний уровень — LocMemCache в памяти процесса (вытесняет давно
+не читанные записи сверх MAX_ENTRIES), задний — общий для всех процессов
+кэш из CACHES (файловый, Redis, memcached), его алиас задаётся в LOCATION.
+Чтение идёт сначала в память процесса, при промахе — в общий кэш,
+найденное значение кладётся в память. Запись и удаление идут в оба уровня.
+
+Запись в памяти живёт не дольше FRONT_TIMEOUT секунд: изменение,
+сделанное другим процессом, станет видно здесь не позже этого срока.
+Записи с версией каталога в ключе (lib_app.catalogue_cache)
+не меняются, поэтому для них такое расхождение не важно.
+
+    CACHES = {
+        "default": {
+            "BACKEND": "lib_app.tiered_cache.TieredCache",
+            "LOCATION": "shared",
+            "OPTIONS": {"FRONT_MAX_ENTRIES": 1000, "FRONT_TIMEOUT": 5},
+        },
+        "shared": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / "cache",
+        },
+    }
+
+Статистика попаданий и промахов считается в каждом процессе отдельно
+и группируется по пространству имён ключа (первые две части до «:»).
+"""
+
+import threading
+from collections import Counter
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+MISSING = object()
+
+FRONT_HIT = "front_hits"
+BACK_HIT = "back_hits"
+MISS = "misses"
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def namespace(key):
+    return ":".join(key.split(":")[:2])
+
+
+def get_stats(location):
+    """Статистика бэкенда: {"total": {...}, "namespaces": {ns: {...}}}"""
+    with _stats_lock:
+        counters = {
+            ns: dict(counter) for ns, counter in _stats.get(location, {}).items()
+        }
+    total = Counter()
+    for counter in counters.values():
+        total.update(counter)
+
+    def summary(counter):
+        hits = counter.get(FRONT_HIT, 0) + counter.get(BACK_HIT, 0)
+        reads = hits + counter.get(MISS, 0)
+        return {
+            FRONT_HIT: counter.get(FRONT_HIT, 0),
+            BACK_HIT: counter.get(BACK_HIT, 0),
+            MISS: counter.get(MISS, 0),
+            "hit_ratio": round(hits / reads, 3) if reads else None,
+        }
+
+    return {
+        "total": summary(total),
+        "namespaces": {
+            ns: summary(counter) for ns, counter in sorted(counters.items())
+        },
+    }
+
+
+def reset_stats(location):
+    with _stats_lock:
+        _stats.pop(location, None)
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.location = location
+        self.front_timeout = options.get("FRONT_TIMEOUT", 5)
+        # Хранилище LocMemCache общее для всех экземпляров с тем же именем,
+        # поэтому передний уровень один на процесс, а не на поток
+        self.front = LocMemCache(
+            f"tiered:{location}",
+            {
+                "TIMEOUT": self.front_timeout,
+                "OPTIONS": {"MAX_ENTRIES": options.get("FRONT_MAX_ENTRIES", 1000)},
+            },
+        )
+
+    @property
+    def back(self):
+        return caches[self.location]
+
+    def record(self, key, outcome):
+        with _stats_lock:
+            counters = _stats.setdefault(self.location, {})
+            counters.setdefault(namespace(key), Counter())[outcome] += 1
+
+    def get_front_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.front_timeout
+        return min(timeout, self.front_timeout)
+
+    def get(self, key, default=None, version=None):
+        value = self.front.get(key, MISSING, version=version)
+        if value is not MISSING:
+            self.record(key, FRONT_HIT)
+            return value
+        value = self.back.get(key, MISSING, version=version)
+        if value is MISSING:
+            self.record(key, MISS)
+            return default
+        self.record(key, BACK_HIT)
+        self.front.set(key, value, version=version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.back.set(key, value, timeout, version=version)
+        self.front.set(key, value, self.get_front_timeout(timeout), version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self.back.add(key, value, timeout, version=version):
+            return False
+        self.front.set(key, value, self.get_front_timeout(timeout), version=version)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.front.delete(key, version=version)
+        return self.back.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.front.delete(key, version=version)
+        return self.back.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self.front.has_key(key, version=version) or self.back.has_key(
+            key, version=version
+        )
+
+    def incr(self, key, delta=1, version=None):
+        # Счётчик увеличивает общий кэш, копия в памяти процесса сбрасывается
+        self.front.delete(key, version=version)
+        return self.back.incr(key, delta, version=version)
+
+    def clear(self):
+        self.front.clear()
+        self.back.clear()
+
+    def close(self, **kwargs):
+        self.back.close(**kwargs)
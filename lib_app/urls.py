@@ -1,12 +1,18 @@
 from django.urls import path
 from . import views
+from lib_app.models import Author, Publisher
 from .views import (
+    AutocompleteView,
+    CacheStatsView,
+    ExportView,
     AuthorListView,
     AuthorCreateView,
     AuthorUpdateView,
     AuthorDeleteView,
     BookListView,
     BookDetailView,
+    BookIsbnLookupView,
+    BookImportView,
     BookCreateView,
     BookUpdateView,
     BookDeleteView,
@@ -24,7 +30,10 @@ from .views import (
     MyBorrowedBooksView,
     BorrowingUsersListView,
     UserBorrowedBooksListView,
+    OverdueLoansView,
+    JobListView,
     ReturnBookView,
+    BatchReturnBooksView,
     StaffViewUserCartView,
     StaffRemoveFromCartView,
 )
@@ -38,6 +47,8 @@ urlpatterns = [
     path("books/", BookListView.as_view(), name="book_list"),
     path("book/add/", BookCreateView.as_view(), name="book_add"),
     path("book/<int:pk>/", BookDetailView.as_view(), name="book_detail"),
+    path("books/isbn/<str:isbn>/", BookIsbnLookupView.as_view(), name="book_by_isbn"),
+    path("staff/import-books/", BookImportView.as_view(), name="book_import"),
     path("book/<int:pk>/edit/", BookUpdateView.as_view(), name="book_edit"),
     path("book/<int:pk>/delete/", BookDeleteView.as_view(), name="book_delete"),
     path("publishers/", PublisherListView.as_view(), name="publisher_list"),
@@ -77,6 +88,9 @@ urlpatterns = [
     path(
         "staff/return-book/<int:book_id>/", ReturnBookView.as_view(), name="return_book"
     ),
+    path("staff/return-books/", BatchReturnBooksView.as_view(), name="return_books"),
+    path("staff/overdue/", OverdueLoansView.as_view(), name="overdue_loans"),
+    path("staff/jobs/", JobListView.as_view(), name="jobs"),
     path(
         "staff/cart/<int:user_id>/",
         StaffViewUserCartView.as_view(),
@@ -88,4 +102,16 @@ urlpatterns = [
         name="staff_remove_from_cart",
     ),
     path("about/", AboutTemplateView.as_view(), name="about"),
+    path("staff/cache-stats/", CacheStatsView.as_view(), name="cache_stats"),
+    path("staff/export/<slug:name>/", ExportView.as_view(), name="export"),
+    path(
+        "autocomplete/authors/",
+        AutocompleteView.as_view(model=Author),
+        name="author_autocomplete",
+    ),
+    path(
+        "autocomplete/publishers/",
+        AutocompleteView.as_view(model=Publisher),
+        name="publisher_autocomplete",
+    ),
 ]
@@ -1,14 +1,24 @@
+import json
+import re
+from dataclasses import asdict
+
 from django.contrib import messages
 from django.contrib.auth.mixins import (
     LoginRequiredMixin,
     PermissionRequiredMixin,
     UserPassesTestMixin,
 )
-from django.db import models
-from django.db.models import Q, Count
-from django.http import HttpResponseRedirect
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 from django.views import View
 from django.views.generic import (
@@ -18,31 +28,71 @@ from django.views.generic import (
     UpdateView,
     DeleteView,
     TemplateView,
+    FormView,
 )
 
-from lib_app.forms import BookModelForm, AuthorModelForm, PublisherModelForm
-from lib_app.models import Book, Cart, BorrowedBook, Author, Publisher
+from lib_app import (
+    cart_cache,
+    catalogue_cache,
+    exporter,
+    facets,
+    jobs,
+    keywords,
+    leaderboard,
+    loans,
+)
+from lib_app.forms import (
+    BookImportForm,
+    BookModelForm,
+    AuthorModelForm,
+    PublisherModelForm,
+    ReturnBooksForm,
+)
+from lib_app.importer import ImportFormatError, import_file
+from lib_app.isbn import InvalidISBN, normalize_isbn
+from lib_app.models import (
+    Book,
+    Cart,
+    BorrowedBook,
+    Author,
+    Publisher,
+    Job,
+    search_key,
+)
+from lib_app.catalogue_cache import CatalogueCacheMixin, ConditionalGetMixin
+from lib_app.pagination import KeysetPaginationMixin
+from lib_app.search import get_search_backend, prefix_filter
+from lib_app.services import ReturnItem, issue_books_from_cart, return_books
 from user_app.models import CustomUser
 
 
-class IndexTemplateView(TemplateView):
+class IndexTemplateView(ConditionalGetMixin, CatalogueCacheMixin, TemplateView):
     template_name = "lib_app/index.html"
+    # Сколько SQL-запросов допускается на запрос (см. lib_app.middleware).
+    # С пустым кэшем: сессия, пользователь, корзина, число книг и топ
+    query_budget = 5
+    # Чтение каталога с реплики (см. lib_app.routers)
+    use_replica = True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["title"] = "Главная страница"
-        # Общее количество книг в библиотеке
-        context["total_books"] = Book.objects.count()
-        # Топ-5 самых выдаваемых книг (по times_of_issued)
-        context["top_books"] = Book.objects.filter(times_of_issued__gt=0).order_by(
-            "-times_of_issued"
-        )[:5]
+        context.update(self.get_leaderboard_context())
 
         return context
 
+    def get_leaderboard_context(self):
+        # Общее количество книг и топ-5 самых выдаваемых книг берутся из кэша,
+        # который ведут выдача и сигналы создания и удаления книг
+        return {
+            "total_books": leaderboard.get_books_total(),
+            "top_books": leaderboard.get_top_books(),
+        }
+
 
 class AboutTemplateView(TemplateView):
     template_name = "lib_app/about.html"
+    query_budget = 2
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -55,13 +105,15 @@ class AboutTemplateView(TemplateView):
 ################################
 
 
-class AuthorListView(ListView):
+class AuthorListView(ConditionalGetMixin, CatalogueCacheMixin, ListView):
     """Список всех авторов"""
 
     model = Author
     template_name = "lib_app/author_list.html"
     context_object_name = "authors"
     paginate_by = 20
+    query_budget = 6
+    use_replica = True
 
     def get_queryset(self):
         queryset = Author.objects.all()
@@ -86,6 +138,7 @@ class AuthorCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     success_url = reverse_lazy("author_list")
     permission_required = "lib_app.add_author"
     context_object_name = "author"
+    query_budget = 2
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -112,6 +165,7 @@ class AuthorUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
     template_name = "lib_app/author_edit.html"
     success_url = reverse_lazy("author_list")
     permission_required = "lib_app.change_author"
+    query_budget = 3
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -156,50 +210,171 @@ class AuthorDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
 ################################
 
 
-class BookListView(ListView):
+class BookListView(
+    ConditionalGetMixin, CatalogueCacheMixin, KeysetPaginationMixin, ListView
+):
     """Список всех книг, с фильтрацией"""
 
     model = Book
     template_name = "lib_app/book_list.html"
     paginate_by = 10
+    # Курсорная пагинация по ключу сортировки каталога
+    keyset_fields = ("author_name", "title", "pk")
+    # С пустым кэшем: сессия, пользователь, корзина, ключевое слово, COUNT
+    # результатов поиска, страница, облако слов, 4 фасета и 2 запроса прав
+    query_budget = 13
+    use_replica = True
+
+    def use_keyset_pagination(self):
+        # Результаты поиска упорядочены по релевантности и ограничены
+        # совпадениями, для них остаётся обычная постраничная навигация
+        return not self.request.GET.get("q", "").strip()
 
     def get_queryset(self):
         # Сортировка: сначала по имени автора, потом по названию книги
         queryset = Book.objects.select_related("author").order_by(
-            "author__name", "title"
+            "author_name", "title"
         )
         query = self.request.GET.get("q", "").strip()
 
+        queryset = self.filter_by_keyword(queryset)
+
         if query:
-            queryset = queryset.filter(
-                Q(title__contains=query)
-                | Q(author__name__contains=query)
-                | Q(isbn__contains=query)
-                | Q(key_words__contains=query)
+            try:
+                # Отсканированный штрихкод: точное совпадение по индексу ISBN
+                queryset = queryset.filter(isbn=normalize_isbn(query))
+            except InvalidISBN:
+                # Поиск через полнотекстовый индекс, результаты упорядочены по релевантности
+                queryset = get_search_backend().search(queryset, query)
+        # Фасеты считаются по выборке без собственных фильтров (см. lib_app.facets)
+        self.unfaceted_queryset = queryset
+        return facets.apply_filters(queryset, self.get_facet_filters())
+
+    def get_facet_filters(self):
+        return facets.parse_filters(self.request.GET)
+
+    def has_catalogue_facets(self):
+        """Фасеты всего каталога без поиска и фильтров берутся из кэша"""
+        return not (
+            self.get_facet_filters()
+            or self.request.GET.get("q", "").strip()
+            or self.get_keyword()
+        )
+
+    def get_facet_counts(self):
+        if self.has_catalogue_facets():
+            return facets.get_catalogue_facets(self.unfaceted_queryset)
+        return facets.count_facets(self.unfaceted_queryset, self.get_facet_filters())
+
+    def get_facets(self):
+        return facets.with_links(
+            self.get_facet_counts(), self.get_facet_filters(), self.request.GET
+        )
+
+    def get_keyword_cloud(self):
+        return keywords.get_keyword_cloud()
+
+    def get_cart_book_ids(self):
+        """Множество ID книг, которые уже в корзине текущего пользователя"""
+        user = self.request.user
+        if user.is_authenticated and not user.is_staff:
+            return cart_cache.get_cart_book_ids(user.pk)
+        return set()
+
+    def get_keyword(self):
+        """Ключевое слово из параметра keyword (фильтр каталога) или None"""
+        if not hasattr(self, "_keyword"):
+            value = self.request.GET.get("keyword", "").strip()
+            self._keyword = keywords.get_keyword(value) if value else None
+        return self._keyword
+
+    def filter_by_keyword(self, queryset):
+        if not self.request.GET.get("keyword", "").strip():
+            return queryset
+        keyword = self.get_keyword()
+        if keyword is None:
+            return queryset.none()
+        # Книги со словом выбираются по индексу таблицы связей, затем сортируются:
+        # стоимость зависит от числа найденных книг, а не от размера каталога
+        return queryset.filter(
+            pk__in=Book.keywords.through.objects.filter(keyword=keyword).values(
+                "book_id"
             )
-        return queryset
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["page_title"] = "Список книг"
         context["search_query"] = self.request.GET.get("q", "").strip()
-
-        # Передаём множество ID книг, которые уже в корзине текущего пользователя
-        if self.request.user.is_authenticated and not self.request.user.is_staff:
-            cart_books = Cart.objects.filter(user=self.request.user).values_list(
-                "books__id", flat=True
-            )
-            context["cart_book_ids"] = set(cart_books)
-        else:
-            context["cart_book_ids"] = set()
+        context["keyword"] = self.get_keyword()
+        context["keyword_cloud"] = self.get_keyword_cloud()
+        context["facets"] = self.get_facets()
+        context["facet_groups"] = facets.as_groups(context["facets"])
+        context["facet_filters"] = {
+            name: self.request.GET[name]
+            for name in facets.FACET_PARAMS
+            if self.request.GET.get(name)
+        }
+        context["cart_book_ids"] = self.get_cart_book_ids()
 
         return context
 
 
-class BookDetailView(DetailView):
+class BookIsbnLookupView(View):
+    """
+    Поиск книг по ISBN для сканеров штрихкодов: JSON со всеми экземплярами
+    с этим ISBN. Номер может быть ISBN-10 или ISBN-13, с дефисами или без.
+    """
+
+    query_budget = 3
+
+    def get(self, request, isbn):
+        try:
+            isbn = normalize_isbn(isbn)
+        except InvalidISBN as error:
+            return JsonResponse({"error": str(error)}, status=400)
+
+        books = list(
+            Book.objects.filter(isbn=isbn)
+            .order_by("pk")
+            .values("id", "title", "author_name", "isbn", "available")
+        )
+        if not books:
+            return JsonResponse({"isbn": isbn, "books": []}, status=404)
+        for book in books:
+            book["url"] = reverse("book_detail", args=(book["id"],))
+        return JsonResponse({"isbn": isbn, "books": books})
+
+
+class BookDetailView(ConditionalGetMixin, CatalogueCacheMixin, DetailView):
     """Детальная информация о книге"""
 
     model = Book
+    queryset = Book.objects.select_related("author", "publisher").prefetch_related(
+        "keywords"
+    )
+    query_budget = 6
+    use_replica = True
+
+    def get_object(self, queryset=None):
+        # Книгу уже могла прочитать проверка ETag (get_last_modified)
+        if getattr(self, "object", None) is not None:
+            return self.object
+        # Книга с автором, издательством и ключевыми словами — из кэша каталога
+        load = super().get_object
+        return catalogue_cache.get_cached_object(
+            "book", self.kwargs["pk"], lambda: load(queryset)
+        )
+
+    def get_last_modified(self):
+        # Страница книги меняется только вместе с книгой, автором или издательством,
+        # поэтому смена версии каталога из-за других книг не сбрасывает её ETag
+        book = self.object = self.get_object()
+        related = (book, book.author, book.publisher)
+        return max(obj.updated_at for obj in related if obj).timestamp()
+
+    def get_etag_parts(self):
+        return [self.kwargs["pk"]]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -215,6 +390,7 @@ class BookCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     form_class = BookModelForm
     success_url = reverse_lazy("book_list")
     permission_required = "lib_app.add_book"
+    query_budget = 4
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -241,6 +417,7 @@ class BookUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
     form_class = BookModelForm
     success_url = reverse_lazy("book_list")
     permission_required = "lib_app.change_book"
+    query_budget = 6
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -295,18 +472,62 @@ class BookDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
         return super().form_valid(form)
 
 
+class BookImportView(LoginRequiredMixin, PermissionRequiredMixin, FormView):
+    """
+    Пакетный импорт книг из загруженного CSV или JSONL (lib_app.importer).
+    Файл больше FILE_UPLOAD_MAX_MEMORY_SIZE Django сохраняет во временный
+    файл, а импорт читает его потоком. Для очень больших файлов удобнее
+    команда import_books: она не ограничена таймаутом HTTP-запроса.
+    """
+
+    form_class = BookImportForm
+    template_name = "lib_app/book_import.html"
+    permission_required = ("lib_app.add_book", "lib_app.change_book")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["title"] = "Импорт книг"
+        return context
+
+    def form_valid(self, form):
+        upload = form.cleaned_data["file"]
+        try:
+            stats = import_file(
+                upload.file,
+                upload.name,
+                format=form.format,
+                update=form.cleaned_data["update"],
+            )
+        except ImportFormatError as error:
+            form.add_error("file", str(error))
+            return self.form_invalid(form)
+        finally:
+            upload.close()
+
+        messages.success(
+            self.request,
+            f"Импорт завершён за {stats.elapsed:.1f} с: добавлено {stats.created}, "
+            f"обновлено {stats.updated}, ошибок {stats.failed}.",
+        )
+        return self.render_to_response(
+            self.get_context_data(form=self.form_class(), stats=stats)
+        )
+
+
 ################################
 # Работа с издательствами
 ################################
 
 
-class PublisherListView(ListView):
+class PublisherListView(ConditionalGetMixin, CatalogueCacheMixin, ListView):
     """Список всех издательств"""
 
     model = Publisher
     template_name = "lib_app/publisher_list.html"
     context_object_name = "publishers"  # вместо object_list
     paginate_by = 20  # выводим по 20 позиций
+    query_budget = 6
+    use_replica = True
 
     def get_queryset(self):
         queryset = Publisher.objects.all().order_by("name")
@@ -332,6 +553,7 @@ class PublisherCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateVie
     template_name = "lib_app/publisher_add.html"
     success_url = reverse_lazy("publisher_list")
     permission_required = "lib_app.add_publisher"
+    query_budget = 2
 
     def form_valid(self, form):
         """Обработка успешной отправки формы"""
@@ -360,6 +582,7 @@ class PublisherUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateVie
     template_name = "lib_app/publisher_edit.html"
     success_url = reverse_lazy("publisher_list")
     permission_required = "lib_app.change_publisher"
+    query_budget = 3
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -401,6 +624,99 @@ class PublisherDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteVie
         return super().form_valid(form)
 
 
+################################
+# Автодополнение в формах
+################################
+
+
+class AutocompleteView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """
+    JSON-поиск по началу названия для виджета AutocompleteSelect.
+    Ищет по нормализованной копии имени (search_name) диапазоном
+    по индексу, поэтому не читает справочник целиком.
+    """
+
+    model = None
+    limit = 20
+    query_budget = 3
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        prefix = search_key(request.GET.get("q", ""))
+        rows = list(
+            self.model.objects.filter(prefix_filter("search_name", prefix))
+            .order_by("search_name", "pk")
+            .values_list("pk", "name")[: self.limit + 1]
+        )
+        return JsonResponse(
+            {
+                "results": [
+                    {"id": pk, "text": name} for pk, name in rows[: self.limit]
+                ],
+                "more": len(rows) > self.limit,
+            }
+        )
+
+
+class CacheStatsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """
+    Статистика попаданий и промахов кэша (JSON) в процессе, обработавшем запрос:
+    по уровням (память процесса, общий кэш) и по пространствам имён ключей.
+    """
+
+    query_budget = 3
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return JsonResponse(
+            {
+                "catalogue_version": catalogue_cache.get_version(),
+                "stats": catalogue_cache.get_stats(),
+            }
+        )
+
+
+class ExportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """
+    Потоковая выгрузка книг, истории выдач или читателей (lib_app.exporter):
+    ?format=csv|jsonl, ?gzip=1 — сжатие на лету. Строки читаются из базы
+    уже после ответа middleware, поэтому в бюджет входят только сессия
+    и пользователь.
+    """
+
+    query_budget = 2
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, name):
+        if name not in exporter.EXPORTS:
+            raise Http404("Неизвестная выгрузка.")
+        format = request.GET.get("format", "csv")
+        if format not in exporter.FORMATS:
+            return HttpResponseBadRequest("Формат выгрузки: csv или jsonl.")
+        compress = request.GET.get("gzip") in ("1", "true", "on")
+
+        content = exporter.stream_export(name, format, compress)
+        if isinstance(request, ASGIRequest):
+            content = exporter.aiter_chunks(content)
+        response = StreamingHttpResponse(
+            content,
+            content_type=(
+                "application/gzip"
+                if compress
+                else f"{exporter.CONTENT_TYPES[format]}; charset=utf-8"
+            ),
+        )
+        filename = exporter.get_filename(name, format, compress, timezone.localdate())
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
 ################################
 # Работа с корзиной
 ################################
@@ -412,6 +728,7 @@ class CartView(LoginRequiredMixin, DetailView):
     model = Cart
     template_name = "lib_app/cart.html"
     context_object_name = "cart"
+    query_budget = 4
 
     def get(self, request, *args, **kwargs):
         if request.user.is_staff:
@@ -427,7 +744,7 @@ class CartView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         # Упорядочиваем книги отдельно
         context["ordered_books"] = self.object.books.select_related("author").order_by(
-            "author__name", "title"
+            "author_name", "title"
         )
         context["is_own_cart"] = True
         context["title"] = "Корзина"
@@ -437,15 +754,20 @@ class CartView(LoginRequiredMixin, DetailView):
 class AddToCartView(LoginRequiredMixin, View):
     """Добавить книгу в корзину"""
 
+    # Первое добавление создаёт корзину (с проверкой full_clean)
+    query_budget = 12
+
     def post(self, request, book_id):
         if request.user.is_staff:
             messages.error(request, "Персонал не может добавлять книги в корзину.")
             return redirect("book_list")
 
         book = get_object_or_404(Book, id=book_id)
-        cart, created = Cart.objects.get_or_create(user=request.user)
 
         if book.available:
+            # Решаем по базе, а не по кэшу корзины: в памяти другого процесса
+            # он может отставать. Повторное добавление в базу ничего не пишет
+            cart, created = Cart.objects.get_or_create(user=request.user)
             cart.books.add(book)
             messages.success(request, f'Книга "{book.title}" добавлена в корзину.')
         else:
@@ -455,11 +777,19 @@ class AddToCartView(LoginRequiredMixin, View):
 
 
 class RemoveFromCartView(LoginRequiredMixin, View):
+    query_budget = 7
+
     def post(self, request, book_id):
         book = get_object_or_404(Book, pk=book_id)
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        if book in cart.books.all():
-            cart.books.remove(book)
+        # Проверяем по базе, а не по кэшу корзины (он может отставать)
+        link = (
+            Cart.books.through.objects.filter(cart__user=request.user, book=book)
+            .select_related("cart")
+            .first()
+        )
+        if link is not None:
+            # Через менеджер связи: сигнал m2m_changed сбросит кэш корзины
+            link.cart.books.remove(book)
             messages.success(request, f'Книга "{book.title}" удалена из корзины.')
         else:
             messages.warning(request, "Эта книга не была в вашей корзине.")
@@ -471,11 +801,13 @@ class RemoveFromCartView(LoginRequiredMixin, View):
 class StaffRemoveFromCartView(LoginRequiredMixin, UserPassesTestMixin, View):
     """Админ убирает книгу из корзины пользователя"""
 
+    query_budget = 6
+
     def test_func(self):
         return self.request.user.is_staff
 
     def post(self, request, user_id, book_id):
-        cart = get_object_or_404(Cart, user_id=user_id)
+        cart = get_object_or_404(Cart.objects.select_related("user"), user_id=user_id)
         book = get_object_or_404(Book, id=book_id)
         cart.books.remove(book)
         messages.success(
@@ -488,23 +820,27 @@ class StaffRemoveFromCartView(LoginRequiredMixin, UserPassesTestMixin, View):
 class IssueBooksFromCartView(LoginRequiredMixin, UserPassesTestMixin, View):
     """Админ выдаёт все книги из корзины пользователя"""
 
+    query_budget = 14
+
     def test_func(self):
         return self.request.user.is_staff
 
     def post(self, request, user_id):
-        cart = get_object_or_404(Cart, user_id=user_id)
-        # Логика выдачи книг
-        for book in cart.books.all():
-            if book.available:
-                BorrowedBook.objects.create(user=cart.user, book=book)
-                Book.objects.filter(id=book.id).update(
-                    available=False, times_of_issued=models.F("times_of_issued") + 1
-                )
-        # Очищаем корзину
-        cart.books.clear()
-        messages.success(
-            request, f"Книги из корзины пользователя {cart.user.full_name} выданы."
-        )
+        cart = get_object_or_404(Cart.objects.select_related("user"), user_id=user_id)
+        # Выдача всех книг одной транзакцией, корзина очищается там же
+        result = issue_books_from_cart(cart)
+        if result.issued:
+            messages.success(
+                request,
+                f"Книги из корзины пользователя {cart.user.full_name} выданы "
+                f"({len(result.issued)} шт.), вернуть до "
+                f"{timezone.localtime(result.due_at):%d.%m.%Y}.",
+            )
+        if result.not_issued:
+            titles = ", ".join(f"«{book.title}»" for book in result.not_issued)
+            messages.warning(request, f"Не выданы, так как уже недоступны: {titles}.")
+        if not result.issued and not result.not_issued:
+            messages.warning(request, "Корзина пользователя пуста.")
         # Перенаправляем на страницу со списком пользователей с непустыми корзинами
         return redirect("users_with_cart")
 
@@ -515,17 +851,19 @@ class UsersWithCartView(LoginRequiredMixin, UserPassesTestMixin, ListView):
     model = Cart
     template_name = "lib_app/users_with_cart.html"
     context_object_name = "carts"
+    query_budget = 3
 
     def test_func(self):
         return self.request.user.is_staff
 
     def get_queryset(self):
         # Выводим с сортировкой по имени пользователя
+        # Число книг считаем в том же запросе, а не отдельным COUNT на строку
         return (
-            Cart.objects.filter(books__isnull=False)
+            Cart.objects.annotate(books_count=Count("books"))
+            .filter(books_count__gt=0)
             .select_related("user")
             .order_by("user__full_name")
-            .distinct()
         )
 
     def get_context_data(self, **kwargs):
@@ -534,13 +872,15 @@ class UsersWithCartView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         return context
 
 
-class MyBorrowedBooksView(LoginRequiredMixin, ListView):
+class MyBorrowedBooksView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """Просмотр пользователем взятых книг"""
 
     model = BorrowedBook
     template_name = "lib_app/my_borrowed_books.html"
     context_object_name = "borrowed_books"
     paginate_by = 10
+    keyset_fields = ("book__author_name", "book__title", "pk")
+    query_budget = 3
 
     def get_queryset(self):
         # Выводим с сортировкой по имени автора и названию книги
@@ -549,7 +889,7 @@ class MyBorrowedBooksView(LoginRequiredMixin, ListView):
                 user=self.request.user, returned=False  # только невозвращённые книги
             )
             .select_related("book__author")
-            .order_by("book__author__name", "book__title")
+            .order_by("book__author_name", "book__title")
         )
 
     def get_context_data(self, **kwargs):
@@ -558,26 +898,28 @@ class MyBorrowedBooksView(LoginRequiredMixin, ListView):
         return context
 
 
-class BorrowingUsersListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class BorrowingUsersListView(
+    LoginRequiredMixin, UserPassesTestMixin, KeysetPaginationMixin, ListView
+):
     """Просмотр персоналом списка пользователей с выданными книгами"""
 
     model = CustomUser
     template_name = "lib_app/borrowing_users_list.html"
     context_object_name = "users"
+    paginate_by = 20
+    # Курсорная пагинация по частичному индексу user_active_borrowers_idx
+    keyset_fields = ("full_name", "pk")
+    query_budget = 3
 
     def test_func(self):
         return self.request.user.is_staff
 
     def get_queryset(self):
-        return (
-            CustomUser.objects.filter(
-                borrowedbook__isnull=False,  # Только пользователи, у которых есть хотя бы одна выданная книга
-                borrowedbook__returned=False,  # Только активные выдачи
-            )
-            .annotate(active_books_count=Count("borrowedbook"))
-            .order_by("full_name")
-            .distinct()
-        )  # Сортировка по имени пользователя
+        # Число книг на руках хранится у пользователя (ведут lib_app.services),
+        # поэтому таблица выдач здесь не читается
+        return CustomUser.objects.filter(active_loans_count__gt=0).order_by(
+            "full_name", "pk"
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -585,13 +927,17 @@ class BorrowingUsersListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         return context
 
 
-class UserBorrowedBooksListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class UserBorrowedBooksListView(
+    LoginRequiredMixin, UserPassesTestMixin, KeysetPaginationMixin, ListView
+):
     """Просмотр персоналом выданных книг для конкретного пользователя"""
 
     model = BorrowedBook
     template_name = "lib_app/user_borrowed_books_list.html"
     context_object_name = "borrowed_books"
     paginate_by = 10  # пагинация
+    keyset_fields = ("book__author_name", "book__title", "pk")
+    query_budget = 4
 
     def test_func(self):
         return self.request.user.is_staff
@@ -603,7 +949,7 @@ class UserBorrowedBooksListView(LoginRequiredMixin, UserPassesTestMixin, ListVie
         return (
             BorrowedBook.objects.filter(user=self.borrower, returned=False)
             .select_related("book__author")
-            .order_by("book__author__name", "book__title")
+            .order_by("book__author_name", "book__title")
         )
 
     def get_context_data(self, **kwargs):
@@ -613,25 +959,195 @@ class UserBorrowedBooksListView(LoginRequiredMixin, UserPassesTestMixin, ListVie
         return context
 
 
+class OverdueLoansView(
+    LoginRequiredMixin, UserPassesTestMixin, KeysetPaginationMixin, ListView
+):
+    """Отчёт персонала о просроченных выдачах, самые давние сверху"""
+
+    model = BorrowedBook
+    template_name = "lib_app/overdue_loans.html"
+    context_object_name = "loans"
+    paginate_by = 20
+    # Курсорная пагинация по частичному индексу borrowed_open_by_due_idx
+    keyset_fields = loans.OVERDUE_KEYSET
+    query_budget = 3
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_queryset(self):
+        self.now = timezone.now()
+        return loans.overdue_loans(self.now).select_related("user", "book")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["title"] = "Просроченные выдачи"
+        for loan in context["loans"]:
+            loan.days_overdue = (self.now - loan.due_at).days
+        return context
+
+
+class JobListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+    """
+    Фоновые задачи: состояние очереди, запуск задач обслуживания
+    и повтор неудавшихся. Выполняет их воркер run_jobs, а не веб-запрос.
+    """
+
+    model = Job
+    template_name = "lib_app/jobs.html"
+    context_object_name = "jobs"
+    paginate_by = 20
+    query_budget = 5
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_queryset(self):
+        return Job.objects.order_by("-pk")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["title"] = "Фоновые задачи"
+        context["tasks"] = [(name, label) for name, (label, _) in jobs.TASKS.items()]
+        counts = jobs.get_status_counts()
+        context["status_counts"] = [
+            (label, counts[value]) for value, label in Job.STATUS_CHOICES
+        ]
+        return context
+
+    def post(self, request):
+        retry_id = request.POST.get("retry")
+        if retry_id is not None:
+            # Повторить можно только задачу, исчерпавшую попытки;
+            # номер — до 18 цифр ASCII, чтобы точно поместиться в ключ
+            retried = re.fullmatch(r"\d{1,18}", retry_id, re.ASCII) and (
+                Job.objects.filter(pk=int(retry_id), status=Job.FAILED).update(
+                    status=Job.QUEUED,
+                    attempts=0,
+                    run_after=timezone.now(),
+                    finished_at=None,
+                )
+            )
+            if retried:
+                messages.success(request, f"Задача #{retry_id} снова в очереди.")
+            else:
+                messages.error(request, "Задача не найдена или не завершилась ошибкой.")
+        else:
+            name = request.POST.get("task")
+            if name not in jobs.TASKS:
+                return HttpResponseBadRequest("Неизвестная задача.")
+            job = jobs.enqueue(name)
+            messages.success(
+                request,
+                f"Задача «{jobs.TASKS[name][0]}» поставлена в очередь (#{job.pk}).",
+            )
+        return redirect("jobs")
+
+
 class ReturnBookView(LoginRequiredMixin, UserPassesTestMixin, View):
     """Персонал возвращает книгу"""
 
+    query_budget = 7
+
     def test_func(self):
         return self.request.user.is_staff
 
     def post(self, request, book_id):
-        borrowed = get_object_or_404(BorrowedBook, id=book_id, returned=False)
-        borrowed.returned = True
-        borrowed.returned_at = timezone.now()
-        borrowed.save()
+        # Тот же путь, что и у пакетного возврата: два UPDATE в одной транзакции
+        (item,) = return_books(loan_ids=[book_id])
+        if item.status != ReturnItem.RETURNED:
+            raise Http404("Открытая выдача не найдена.")
+
+        messages.success(request, f'Книга "{item.title}" успешно возвращена.')
+        return redirect("user_borrowed_books_detail", user_id=item.user_id)
+
 
-        # Делаем книгу доступной
-        book = borrowed.book
-        book.available = True
-        book.save()
+class BatchReturnBooksView(LoginRequiredMixin, UserPassesTestMixin, FormView):
+    """
+    Пакетный возврат книг персоналом: много номеров выдач или ISBN за один запрос.
+    Принимает форму или JSON {"loan_ids": [...], "isbns": [...]}
+    и возвращает результат по каждому коду.
+    """
 
-        messages.success(request, f'Книга "{book.title}" успешно возвращена.')
-        return redirect("user_borrowed_books_detail", user_id=borrowed.user.id)
+    form_class = ReturnBooksForm
+    template_name = "lib_app/return_books.html"
+    # Девятый запрос — проверка номеров выдач, не найденных среди открытых
+    query_budget = 9
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def wants_json(self):
+        return self.request.content_type == "application/json"
+
+    def read_json(self):
+        """
+        Данные формы из JSON или None, если тело не объект со списками
+        кодов (строк или целых чисел): строка вместо списка иначе
+        разобралась бы посимвольно.
+        """
+        try:
+            payload = json.loads(self.request.body or b"{}")
+        except ValueError:
+            return None
+        if not isinstance(payload, dict):
+            return None
+        data = {}
+        for field in ("loan_ids", "isbns"):
+            codes = payload.get(field, [])
+            if not isinstance(codes, list) or not all(
+                isinstance(code, (int, str)) and not isinstance(code, bool)
+                for code in codes
+            ):
+                return None
+            data[field] = " ".join(str(code) for code in codes)
+        return data
+
+    def post(self, request, *args, **kwargs):
+        if self.wants_json():
+            self.json_data = self.read_json()
+            if self.json_data is None:
+                return JsonResponse(
+                    {
+                        "errors": {
+                            "__all__": [
+                                'Ожидается {"loan_ids": [...], "isbns": [...]}.'
+                            ]
+                        }
+                    },
+                    status=400,
+                )
+        return super().post(request, *args, **kwargs)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        if self.request.method == "POST" and self.wants_json():
+            kwargs["data"] = self.json_data
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["title"] = "Возврат книг"
+        return context
+
+    def form_valid(self, form):
+        items = return_books(
+            loan_ids=form.cleaned_data["loan_ids"], isbns=form.cleaned_data["isbns"]
+        )
+        if self.wants_json():
+            return JsonResponse({"results": [asdict(item) for item in items]})
+
+        returned = sum(item.status == ReturnItem.RETURNED for item in items)
+        messages.success(self.request, f"Возвращено книг: {returned} из {len(items)}.")
+        # Показываем ту же страницу с результатом по каждому коду и пустой формой
+        return self.render_to_response(
+            self.get_context_data(form=self.form_class(), results=items)
+        )
+
+    def form_invalid(self, form):
+        if self.wants_json():
+            return JsonResponse({"errors": form.errors}, status=400)
+        return super().form_invalid(form)
 
 
 class StaffViewUserCartView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
@@ -640,6 +1156,7 @@ class StaffViewUserCartView(LoginRequiredMixin, UserPassesTestMixin, DetailView)
     model = Cart
     template_name = "lib_app/cart.html"
     context_object_name = "cart"
+    query_budget = 5
 
     def test_func(self):
         return self.request.user.is_staff
@@ -648,13 +1165,14 @@ class StaffViewUserCartView(LoginRequiredMixin, UserPassesTestMixin, DetailView)
         user_id = self.kwargs.get("user_id")
         user = get_object_or_404(CustomUser, id=user_id)
         cart, created = Cart.objects.get_or_create(user=user)
+        cart.user = user  # шаблону не нужен повторный запрос пользователя
         return cart
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Упорядочиваем книги отдельно
         context["ordered_books"] = self.object.books.select_related("author").order_by(
-            "author__name", "title"
+            "author_name", "title"
         )
         context["is_own_cart"] = False
         context["title"] = "Корзина пользователя"
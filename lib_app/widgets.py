@@ -0,0 +1,71 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+
+
+class AutocompleteSelect(forms.Select):
+    """
+    Выпадающий список для ForeignKey с большим справочником.
+    В HTML попадает только выбранное значение, остальные варианты
+    подгружает скрипт lib_app/autocomplete.js по мере ввода
+    из JSON-точки url_name (см. AutocompleteView).
+    """
+
+    def __init__(self, url_name, attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+
+    class Media:
+        js = ["lib_app/autocomplete.js"]
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["widget"]["attrs"]["data-autocomplete-url"] = reverse(self.url_name)
+        return context
+
+    @staticmethod
+    def clean_keys(field, values):
+        """
+        Выбранные значения, приведённые к типу ключа. Значения, которые
+        не могут быть ключом (подделанный POST author=abc), отбрасываются:
+        форма с ошибкой перерисовывается, а не падает на фильтре.
+        """
+        model = field.queryset.model
+        key_field = (
+            model._meta.get_field(field.to_field_name)
+            if field.to_field_name
+            else model._meta.pk
+        )
+        keys = []
+        for value in values:
+            if value in ("", None):
+                continue
+            try:
+                key = key_field.to_python(value)
+            except ValidationError:
+                continue
+            # Число вне 64-битного целого база не примет даже в фильтре
+            if isinstance(key, int) and not -(2**63) <= key < 2**63:
+                continue
+            keys.append(key)
+        return keys
+
+    def optgroups(self, name, value, attrs=None):
+        # Вместо всех строк справочника — пустой вариант и выбранное значение
+        iterator = self.choices
+        if not hasattr(iterator, "queryset"):
+            return super().optgroups(name, value, attrs)
+        field = iterator.field
+        selected = self.clean_keys(field, value)
+        choices = [("", field.empty_label)] if field.empty_label is not None else []
+        if selected:
+            key = field.to_field_name or "pk"
+            choices += [
+                iterator.choice(obj)
+                for obj in field.queryset.filter(**{f"{key}__in": selected})
+            ]
+        self.choices = choices
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = iterator
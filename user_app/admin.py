@@ -5,11 +5,18 @@ from .models import CustomUser
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
-    list_display = ("email", "full_name", "date_of_birth", "is_staff")
+    list_display = (
+        "email",
+        "full_name",
+        "date_of_birth",
+        "active_loans_count",
+        "is_staff",
+    )
     list_filter = ("is_staff", "is_superuser", "is_active")
     fieldsets = (
         (None, {"fields": ("email", "password")}),
         ("Personal info", {"fields": ("full_name", "date_of_birth")}),
+        ("Loans", {"fields": ("active_loans_count", "total_loans_count")}),
         (
             "Permissions",
             {
@@ -38,5 +45,6 @@ class CustomUserAdmin(UserAdmin):
             },
         ),
     )
+    readonly_fields = ("active_loans_count", "total_loans_count")
     search_fields = ("email", "full_name")
     ordering = ("email",)
@@ -0,0 +1,54 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:49
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_loan_counters(apps, schema_editor):
+    CustomUser = apps.get_model('user_app', 'CustomUser')
+    BorrowedBook = apps.get_model('lib_app', 'BorrowedBook')
+    db_alias = schema_editor.connection.alias
+
+    def loans_count(**filters):
+        loans = (
+            BorrowedBook.objects.using(db_alias)
+            .filter(user=OuterRef('pk'), **filters)
+            .order_by()
+            .values('user')
+            .annotate(n=Count('id'))
+            .values('n')
+        )
+        return Coalesce(Subquery(loans), Value(0), output_field=IntegerField())
+
+    CustomUser.objects.using(db_alias).update(
+        active_loans_count=loans_count(returned=False),
+        total_loans_count=loans_count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('user_app', '0002_customuser_user_full_name_idx'),
+        ('lib_app', '0005_catalogue_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='active_loans_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Книг на руках'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='total_loans_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Всего выдач'),
+        ),
+        migrations.RunPython(fill_loan_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(condition=models.Q(('active_loans_count__gt', 0)), fields=['full_name', 'id'], name='user_active_borrowers_idx'),
+        ),
+    ]
@@ -50,6 +50,15 @@ class CustomUser(AbstractUser):
         blank=False, null=False, verbose_name="Дата рождения"
     )
 
+    # Счётчики выдач ведут lib_app.services при выдаче и возврате книг,
+    # пересчитать их по записям о выдачах можно командой repair_loan_counters
+    active_loans_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Книг на руках"
+    )
+    total_loans_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Всего выдач"
+    )
+
     # Аутентификация по email
     USERNAME_FIELD = "email"
     # Обязательные поля при создании (кроме email и password)
@@ -57,5 +66,17 @@ class CustomUser(AbstractUser):
 
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        # Списки читателей сортируются по имени
+        indexes = [
+            models.Index(fields=["full_name"], name="user_full_name_idx"),
+            # Список читателей с книгами на руках: только они попадают в индекс
+            models.Index(
+                fields=["full_name", "id"],
+                name="user_active_borrowers_idx",
+                condition=models.Q(active_loans_count__gt=0),
+            ),
+        ]
+
     def __str__(self):
         return f"{self.full_name} ({self.email})"
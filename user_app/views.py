@@ -66,6 +66,7 @@ class UserListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
     model = CustomUser
     template_name = "user_app/user_list.html"
     context_object_name = "users"
+    query_budget = 3
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)